@@ -0,0 +1,304 @@
+"""Enemy AI sharded across worker processes.
+
+AIPool starts N worker processes.  Each keeps its own copy of the world's
+ObstacleGrid and a replica of its PointGrid.  Every tick the main process
+writes two things into shared memory:
+- a snapshot of the dragons: head position, direction, length, speed and
+  score of every enemy, plus the head and length of the player it reacts to;
+- the journal of points added and removed since the previous tick.
+Each worker then gets a slice of the enemies thinking this tick.  Workers run the
+same steer() as Enemy.update_ai and write directions and burst flags back
+into a shared result array.  Only plain numbers cross the process
+boundary, never Enemy objects.
+
+The replicas apply the journal in the order the real PointGrid saw the
+changes, so nearest-point queries give the same answers, ties included.
+A run with workers therefore plays out exactly like a single-process run
+with the same seed, replays included.
+
+Simulation only starts a pool for rosters of AI_WORKERS_MIN_ENEMIES or
+more (see settings.py); below that the copying costs more than it saves.
+If a worker dies, think() shuts the pool down and raises RuntimeError.
+"""
+import os
+import traceback
+import weakref
+import multiprocessing
+from array import array
+from itertools import chain
+from multiprocessing import shared_memory
+
+from chunks import ChunkWalls, ChunkedWorld
+from world import POINT_TIERS
+
+# per enemy: x, y, dir x, dir y, length, speed, score, then its target
+# player's x, y, length and 1.0 (or 0.0 when it has none)
+_HEAD_FIELDS = 11
+# per enemy: dir x, dir y, bursting
+_OUT_FIELDS = 3
+# op, seq, x, y, tier index
+_JOURNAL_FIELDS = 5
+_NO_TARGET = (0.0, 0.0, 0.0, 0.0)
+_TIER_NAMES = tuple(POINT_TIERS)
+_TIER_INDEX = {name: i for i, name in enumerate(_TIER_NAMES)}
+
+
+class _Block:
+    """A float64 array in shared memory that can be reallocated bigger.
+
+    The segment is unlinked by release(), or failing that when the block is
+    collected or the interpreter exits, so a crash does not leave it behind.
+    """
+    def __init__(self, width, rows):
+        self.width = width
+        self.shm = None
+        self.data = None
+        self._finalizer = None
+        self._alloc(rows)
+
+    def _alloc(self, rows):
+        self.release()
+        self.rows = rows
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * self.width * max(1, rows))
+        self.data = self.shm.buf.cast('d')
+        self._finalizer = weakref.finalize(self, _free, self.shm, self.data)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def reserve(self, rows):
+        """Make room for rows; True if the block moved to a new segment."""
+        if rows <= self.rows:
+            return False
+        self._alloc(max(rows, self.rows * 2))
+        return True
+
+    def write(self, values):
+        self.data[:len(values)] = values
+
+    def release(self):
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self.shm = self.data = None
+
+
+def _free(shm, data):
+    data.release()
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        # the resource tracker got to it first
+        pass
+
+
+def _attach(name):
+    # spawned workers share the main process's resource tracker, which
+    # unlinks the segment once when the creating _Block releases it
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, shm.buf.cast('d')
+
+
+class AIPool:
+    """Runs enemy AI for a Simulation on worker processes."""
+    def __init__(self, world, workers):
+        # children import pygame again; keep them from greeting every time
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        self.world = world
+        self._heads = _Block(_HEAD_FIELDS, 256)
+        self._out = _Block(_OUT_FIELDS, 256)
+        self._journal = _Block(_JOURNAL_FIELDS, 4096)
+        # roster indices of the enemies that think this tick
+        self._picks = _Block(1, 256)
+        # workers generate a chunked world's walls themselves, from its seed
+        chunked = isinstance(world, ChunkedWorld)
+        obstacles = [] if chunked else world.obstacles
+        walls = _Block(4, len(obstacles))
+        walls.write(array('d', chain.from_iterable(
+            (obs.x, obs.y, obs.width, obs.height) for obs in obstacles)))
+        self._walls = walls
+        world.points.start_journal()
+
+        ctx = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        for _ in range(workers):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+            proc.start()
+            child.close()
+            if chunked:
+                parent.send(("chunks", world.seed, world.size, world.chunk_size))
+            else:
+                parent.send(("walls", walls.name, len(obstacles)))
+            self._conns.append(parent)
+            self._procs.append(proc)
+        self._finalizer = weakref.finalize(self, _shutdown, self._conns, self._procs,
+                                           [self._heads, self._out, self._journal, self._picks, walls])
+
+    @property
+    def workers(self):
+        return len(self._procs)
+
+    def think(self, targets, enemies, picks=None):
+        """Set dir and is_bursting like update_ai would, on every enemy or
+        on enemies[i] for each index i in picks.  targets[i] is the player
+        enemies[i] reacts to, or None."""
+        n = len(enemies)
+        if picks is None:
+            picks = range(n)
+        heads, out, journal, chosen = self._heads, self._out, self._journal, self._picks
+        heads.reserve(n)
+        out.reserve(n)
+        chosen.reserve(len(picks))
+        chosen.write(array('d', picks))
+
+        rows = array('d', chain.from_iterable(
+            (e.pos.x, e.pos.y, e.dir.x, e.dir.y, e.length, e.speed, e.score)
+            + ((p.pos.x, p.pos.y, p.length, 1.0) if p is not None else _NO_TARGET)
+            for e, p in zip(enemies, targets)))
+        heads.write(rows)
+
+        entries = self.world.points.journal
+        journal.reserve(len(entries))
+        journal.write(array('d', chain.from_iterable(
+            (op, seq, x, y, _TIER_INDEX[tier] if op else 0) for op, seq, x, y, tier in entries)))
+        count = len(entries)
+        entries.clear()
+
+        names = (heads.name, out.name, journal.name, chosen.name)
+        workers, m = self.workers, len(picks)
+        try:
+            for w, conn in enumerate(self._conns):
+                lo, hi = m * w // workers, m * (w + 1) // workers
+                conn.send(("tick", names, n, count, lo, hi))
+            replies = [conn.recv() for conn in self._conns]
+        except (EOFError, ConnectionError) as exc:
+            # a worker that crashed or was killed closes its end of the pipe
+            # (BrokenPipeError and ConnectionResetError are ConnectionErrors)
+            self.close()
+            raise RuntimeError("AI worker died") from exc
+        errors = [reply[1] for reply in replies if reply[0] == "error"]
+        if errors:
+            raise RuntimeError("AI worker failed:\n" + errors[0])
+
+        results = out.data[:_OUT_FIELDS * n].tolist()
+        for i in picks:
+            e = enemies[i]
+            k = _OUT_FIELDS * i
+            e.dir.update(results[k], results[k + 1])
+            e.is_bursting = results[k + 2] != 0.0
+
+    def close(self):
+        self._finalizer()
+
+
+def _shutdown(conns, procs, blocks):
+    for conn in conns:
+        try:
+            conn.send(("stop",))
+        except (OSError, EOFError):
+            pass
+    for proc in procs:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.terminate()
+    for conn in conns:
+        conn.close()
+    for block in blocks:
+        block.release()
+
+
+class _Head:
+    """What a worker knows about a dragon, enough for HeadGrid and steer()."""
+    __slots__ = ("pos", "length")
+
+
+def _worker_main(conn):
+    import pygame
+    from enemy import steer, DETECTION_RANGE
+    from spatial import HeadGrid, ObstacleGrid, PointGrid
+    from world import Point
+
+    attached = {}   # block -> (segment name, SharedMemory, float64 view)
+
+    def view(block, name):
+        entry = attached.get(block)
+        if entry is None or entry[0] != name:
+            if entry is not None:
+                # the block was reallocated; let go of the old segment
+                entry[2].release()
+                entry[1].close()
+            entry = attached[block] = (name, *_attach(name))
+        return entry[2]
+
+    walls = None
+    points = PointGrid()
+    by_seq = {}
+    heads = HeadGrid()
+    stubs = []
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == "stop":
+                break
+            if msg[0] == "walls":
+                _, name, count = msg
+                data = view("walls", name)
+                walls = ObstacleGrid([pygame.Rect(*(int(v) for v in data[4 * i:4 * i + 4]))
+                                      for i in range(count)])
+                continue
+            if msg[0] == "chunks":
+                walls = ChunkWalls(*msg[1:])
+                continue
+            try:
+                _, (heads_name, out_name, journal_name, picks_name), n, count, lo, hi = msg
+                # points first: every worker replays every change in order
+                journal = view("journal", journal_name)[:_JOURNAL_FIELDS * count].tolist()
+                for k in range(0, len(journal), _JOURNAL_FIELDS):
+                    op, seq, x, y, tier = journal[k:k + _JOURNAL_FIELDS]
+                    if op:
+                        pt = by_seq[seq] = Point((x, y), _TIER_NAMES[int(tier)], 0)
+                        points.add(pt)
+                    else:
+                        points.remove(by_seq.pop(seq))
+
+                rows = view("heads", heads_name)[:_HEAD_FIELDS * n].tolist()
+                while len(stubs) < n:
+                    stub = _Head()
+                    stub.pos = pygame.Vector2()
+                    stubs.append(stub)
+                roster = stubs[:n]
+                for i, stub in enumerate(roster):
+                    k = _HEAD_FIELDS * i
+                    stub.pos.update(rows[k], rows[k + 1])
+                    stub.length = rows[k + 4]
+                heads.rebuild(roster)
+
+                out = view("out", out_name)
+                for i in view("picks", picks_name)[lo:hi].tolist():
+                    i = int(i)
+                    k = _HEAD_FIELDS * i
+                    stub = roster[i]
+                    if rows[k + 10]:
+                        player_pos, player_length = pygame.Vector2(rows[k + 7], rows[k + 8]), rows[k + 9]
+                    else:
+                        player_pos, player_length = None, 0
+                    neighbours = [(o.pos, o.length) for o in heads.near(stub, DETECTION_RANGE)]
+                    new_dir, bursting = steer(
+                        stub.pos, pygame.Vector2(rows[k + 2], rows[k + 3]), stub.length,
+                        rows[k + 5], rows[k + 6], player_pos, player_length,
+                        neighbours, walls, points)
+                    j = _OUT_FIELDS * i
+                    out[j] = new_dir.x
+                    out[j + 1] = new_dir.y
+                    out[j + 2] = 1.0 if bursting else 0.0
+                conn.send(("ok",))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+    finally:
+        for _, shm, data in attached.values():
+            data.release()
+            shm.close()
@@ -0,0 +1,80 @@
+"""Level of detail for enemy AI.
+
+Enemies near a player are the ones on screen and the ones that can
+fight it, so they think every tick.  Further out an enemy only needs a new
+decision every few ticks.  In between it keeps its heading, which is all
+update() needs to move it.  AIScheduler decides each tick which enemies
+think:
+- Every enemy's period comes from its distance to the nearest player
+  (AI_LOD_TIERS); with no players at all, everyone is far away.
+- Enemies are spread over the ticks of their period from the moment they
+  appear, so the far ones never all come due at once.
+- At most `budget` enemies outside the every-tick ring think per tick.  When
+  more are due, the ones that have waited longest go first and the rest
+  wait for the next tick, so AI cost stays flat however big the roster.
+- An enemy that is coasting but about to run into a wall thinks straight
+  away; that costs one ObstacleGrid lookup per coasting enemy.
+"""
+from itertools import count
+
+from settings import *
+from player import nearest_dragon
+
+
+class AIScheduler:
+    """Picks the enemies that run their AI this tick."""
+    def __init__(self, tiers=AI_LOD_TIERS, far_period=AI_LOD_FAR_PERIOD, budget=AI_LOD_BUDGET):
+        self.tiers = tuple((radius * radius, period) for radius, period in tiers)
+        self.far_period = far_period
+        self.budget = budget
+        self._slots = count()
+        # decisions made by the last plan(), and far ones pushed back so far
+        self.thinking = 0
+        self.deferred = 0
+
+    def period(self, dist_sq):
+        for radius_sq, period in self.tiers:
+            if dist_sq < radius_sq:
+                return period
+        return self.far_period
+
+    def plan(self, tick, players, enemies, walls):
+        """Indices of the enemies that think this tick, in roster order.
+
+        Every other enemy coasts: it keeps its direction and stops any
+        burst, so a stale decision does not keep draining its score.
+        """
+        far_period = self.far_period
+        thinkers = []
+        due = []
+        for i, e in enumerate(enemies):
+            last = e.ai_tick
+            if last is None:
+                # new or respawned: pretend it last thought at a spread-out
+                # point in the past so far enemies come due evenly
+                last = e.ai_tick = tick - 1 - next(self._slots) % far_period
+            pos = e.pos
+            period = self.period(nearest_dragon(players, pos)[1])
+            if period <= 1:
+                thinkers.append(i)
+            elif tick - last >= period:
+                due.append((last, i))
+            else:
+                e.is_bursting = False
+                step = e.dir * e.speed
+                if walls.head_hits(pos.x + step.x, pos.y + step.y):
+                    thinkers.append(i)
+
+        if len(due) > self.budget:
+            # longest wait first; the rest try again next tick
+            due.sort()
+            for _, i in due[self.budget:]:
+                enemies[i].is_bursting = False
+            self.deferred += len(due) - self.budget
+            del due[self.budget:]
+        thinkers.extend(i for _, i in due)
+        thinkers.sort()
+        for i in thinkers:
+            enemies[i].ai_tick = tick
+        self.thinking = len(thinkers)
+        return thinkers
@@ -0,0 +1,516 @@
+"""Reproducible benchmarks for the simulation and the renderer.
+
+Every scenario is built from a fixed seed and driven by a seeded autopilot,
+so two runs on the same commit do the same work.  Each tick is split into
+phases (AI, movement, collision, point upkeep, rendering to an offscreen
+Surface) and the timings are summarised as mean, p50, p99 and max in ms.
+
+    python bench.py                          # every scenario
+    python bench.py -s default -s flood      # just some of them
+    python bench.py --out run.json           # keep the results
+    python bench.py --compare run.json       # flag phases that got slower
+    python bench.py --snapshot               # also time snapshot encode/decode
+    python bench.py --checkpoint             # also time checkpoint save/restore
+    python bench.py --no-scenarios --snapshot --checkpoint -s default
+                                             # just the round-trip checks; exits 1 on a failure
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+from settings import *
+from simulation import Simulation, DEFAULT_ROSTER
+from render import Renderer
+import checkpoint
+import snapshot
+from replay import state_digest
+from trail import Trail
+from world import Point
+
+PHASES = ("ai", "movement", "collision", "points", "tick", "render", "frame")
+
+
+class TimedSimulation(Simulation):
+    """Simulation that records how long each phase of every tick takes."""
+    def __init__(self, *args, **kwargs):
+        self._acc = dict.fromkeys(PHASES, 0.0)
+        super().__init__(*args, **kwargs)
+        # the player has to survive the whole run for the numbers to compare
+        self.player.invulnerable_until = float('inf')
+
+    def step(self, move=(0, 0), burst=False):
+        for phase in self._acc:
+            self._acc[phase] = 0.0
+        start = time.perf_counter()
+        super().step(move, burst)
+        self._acc["tick"] = time.perf_counter() - start
+        return dict(self._acc)
+
+    def _timed(self, phase, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        self._acc[phase] += time.perf_counter() - start
+
+    def _update_points(self):
+        self._timed("points", super()._update_points)
+
+    def _move_players(self):
+        self._timed("movement", super()._move_players)
+
+    def _plan_ai(self):
+        start = time.perf_counter()
+        thinkers = super()._plan_ai()
+        self._acc["ai"] += time.perf_counter() - start
+        return thinkers
+
+    def _think_all(self, thinkers=None):
+        self._timed("ai", super()._think_all, thinkers)
+
+    def _move(self, e):
+        self._timed("movement", super()._move, e)
+
+    def _move_all(self):
+        self._timed("movement", super()._move_all)
+
+    def _collide(self):
+        self._timed("collision", super()._collide)
+
+    def _spawn_rivals(self):
+        self._timed("collision", super()._spawn_rivals)
+
+
+class Autopilot:
+    """Seeded stand-in for a human: picks a spot in the arena and heads there."""
+    def __init__(self, seed, retarget=45):
+        self.rng = random.Random(seed)
+        self.retarget = retarget
+        self.target = None
+
+    def __call__(self, sim):
+        size = sim.world.size
+        if self.target is None or sim.tick_count % self.retarget == 0:
+            self.target = pygame.Vector2(self.rng.uniform(0.2, 0.8) * size,
+                                         self.rng.uniform(0.2, 0.8) * size)
+        move = self.target - sim.player.pos
+        return move, self.rng.random() < 0.05
+
+
+def scaled_roster(total):
+    """DEFAULT_ROSTER stretched to `total` enemies, keeping the tier mix."""
+    base = sum(count for _, count in DEFAULT_ROSTER)
+    roster = [(tier, count * total // base) for tier, count in DEFAULT_ROSTER]
+    missing = total - sum(count for _, count in roster)
+    tier, count = roster[-1]
+    roster[-1] = (tier, count + missing)
+    return tuple(roster)
+
+
+def _stretch(e, length=450):
+    """Grow an enemy to the maximum trail length."""
+    e.score = 7000  # enough for update() to keep it at the 450 cap
+    e.length = length
+    e.trail = Trail.stretched(e.pos, e.dir, length, ENEMY_SEGMENT_SIZE)
+
+
+def _scenario_default(seed, **options):
+    return TimedSimulation(seed=seed, **options)
+
+
+def _scenario_enemies(total):
+    def build(seed, **options):
+        return TimedSimulation(seed=seed, roster=scaled_roster(total), **options)
+    return build
+
+
+def _scenario_large_world(seed, **options):
+    return TimedSimulation(seed=seed, world_size=WORLD_SIZE * 4, roster=scaled_roster(200), **options)
+
+
+def _scenario_huge_world(seed, **options):
+    return TimedSimulation(seed=seed, world_size=WORLD_SIZE * 10, roster=scaled_roster(200), **options)
+
+
+def _scenario_flood(seed, **options):
+    sim = TimedSimulation(seed=seed, roster=scaled_roster(200), **options)
+    for e in sim.enemies:
+        sim._drop_trail(e)
+    return sim
+
+
+def _scenario_max_length(seed, **options):
+    sim = TimedSimulation(seed=seed, **options)
+    for e in sim.enemies:
+        _stretch(e)
+    return sim
+
+
+SCENARIOS = {
+    "default": ("34-enemy roster from main()", _scenario_default),
+    "enemies_200": ("200 enemies, default tier mix", _scenario_enemies(200)),
+    "enemies_1000": ("1000 enemies, default tier mix", _scenario_enemies(1000)),
+    "large_world": ("4x WORLD_SIZE with 200 enemies", _scenario_large_world),
+    "huge_world": ("10x WORLD_SIZE with 200 enemies", _scenario_huge_world),
+    "flood": ("200 enemies all dropping their trails as points", _scenario_flood),
+    "max_length": ("34 enemies at the 450-segment cap", _scenario_max_length),
+}
+
+
+class _DictPoint:
+    """The point layout before POINT_TIERS: an instance dict holding every
+    field on each point.  Only kept as the baseline for the memory report."""
+    def __init__(self, pos, tier, created_at):
+        self.pos = pygame.Vector2(pos)
+        self.tier = tier
+        self.created_at = created_at
+        self.value = 10
+        self.color = (0, 0, 255)
+        self.lifetime = 15000
+
+
+def _bytes_per_object(make, count):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        keep = [make(i) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    # the list holding them is not part of the point
+    return (after - before - sys.getsizeof(keep)) / count
+
+
+def point_memory_report(count=20000):
+    """Bytes per collectible point, old per-point dict layout vs. Point."""
+    return {
+        "count": count,
+        "dict_point": _bytes_per_object(lambda i: _DictPoint((i, i), "normal", i), count),
+        "point": _bytes_per_object(lambda i: Point((i, i), "normal", i), count),
+    }
+
+
+def snapshot_report(seed, ticks):
+    """Encode/decode cost and size of world snapshots over a default game.
+
+    Every tick is captured, encoded in full and as a delta against the
+    tick before, and both are decoded again.  The results must equal the
+    capture, and the capture must match the live dragons to within its
+    quantisation; any tick where they do not counts as a mismatch, and
+    first_mismatch is the first such tick (None when there is none).
+    """
+    sim = _scenario_default(seed)
+    pilot = Autopilot(seed)
+    ids = snapshot.IdMap()
+    head_tol = 0.5 / snapshot.HEAD_SCALE + 1e-9
+    times = {"encode_full": [], "decode_full": [], "encode_delta": [], "decode_delta": []}
+    sizes = {"full": [], "delta": []}
+    mismatches = 0
+    first_mismatch = None
+    prev = chain = None
+    try:
+        for tick in range(ticks):
+            before = mismatches
+            sim.step(*pilot(sim))
+            snap = snapshot.capture(sim, ids)
+            for dragon in sim.players + sim.enemies:
+                state = snap.dragons[ids(dragon)]
+                x, y = state.pos
+                if (abs(x - dragon.pos.x) > head_tol or abs(y - dragon.pos.y) > head_tol
+                        or len(state.trail) != len(dragon.trail)
+                        or any(abs(a - px) > 0.5 or abs(b - py) > 0.5
+                               for (a, b), (px, py) in zip(state.trail, dragon.trail))):
+                    mismatches += 1
+
+            t0 = time.perf_counter()
+            full = snapshot.encode(snap)
+            t1 = time.perf_counter()
+            decoded = snapshot.decode(full)
+            t2 = time.perf_counter()
+            times["encode_full"].append(t1 - t0)
+            times["decode_full"].append(t2 - t1)
+            sizes["full"].append(len(full))
+            mismatches += decoded != snap
+            if prev is None:
+                chain = decoded
+            else:
+                t0 = time.perf_counter()
+                delta = snapshot.encode(snap, prev)
+                t1 = time.perf_counter()
+                try:
+                    chain = snapshot.decode(delta, chain)
+                except ValueError:
+                    # a broken chain counts, then carries on from the full snapshot
+                    chain = None
+                t2 = time.perf_counter()
+                times["encode_delta"].append(t1 - t0)
+                times["decode_delta"].append(t2 - t1)
+                sizes["delta"].append(len(delta))
+                mismatches += chain != snap
+                if chain is None:
+                    chain = decoded
+            if mismatches != before and first_mismatch is None:
+                first_mismatch = tick
+            prev = snap
+    finally:
+        sim.close()
+
+    report = {"ticks": len(sizes["full"]), "enemies": len(sim.enemies), "mismatches": mismatches,
+              "first_mismatch": first_mismatch}
+    for kind, samples in sizes.items():
+        ordered = sorted(samples) or [0]
+        report[f"{kind}_bytes"] = {"mean": sum(ordered) / len(ordered), "max": ordered[-1]}
+    for name, samples in times.items():
+        report[name] = summarize(samples)
+        kind = name.split("_")[1]
+        total = sum(samples)
+        report[name]["mb_per_s"] = sum(sizes[kind][:len(samples)]) / total / 1e6 if total else 0.0
+    return report
+
+
+def checkpoint_report(name, seed, warmup, ticks=120):
+    """Save/restore cost of a scenario's state, against building it afresh.
+
+    The restored game and the original are then stepped side by side with
+    the same input; diverged_at is the first tick where they differ, or None.
+    """
+    build = SCENARIOS[name][1]
+    t0 = time.perf_counter()
+    sim = build(seed)
+    built = time.perf_counter() - t0
+    pilot = Autopilot(seed)
+    fd, path = tempfile.mkstemp(suffix=".ckpt")
+    os.close(fd)
+    try:
+        for _ in range(warmup):
+            sim.step(*pilot(sim))
+        t0 = time.perf_counter()
+        checkpoint.save(sim, path)
+        saved = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        restored = checkpoint.load(path)
+        loaded = time.perf_counter() - t0
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    diverged_at = None
+    for i in range(ticks):
+        if state_digest(sim) != state_digest(restored):
+            diverged_at = i
+            break
+        move, burst = pilot(sim)
+        sim.step(move, burst)
+        restored.step(move, burst)
+    return {"bytes": size, "build_ms": built * 1000, "save_ms": saved * 1000,
+            "load_ms": loaded * 1000, "checked_ticks": ticks, "diverged_at": diverged_at}
+
+
+def summarize(samples):
+    """mean/p50/p99/max of a list of seconds, reported in milliseconds."""
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(q):
+        return ordered[min(n - 1, max(0, math.ceil(q * n) - 1))] * 1000
+
+    return {
+        "mean": sum(ordered) / n * 1000,
+        "p50": pct(0.50),
+        "p99": pct(0.99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def run_scenario(name, seed, ticks, warmup, render=True, **options):
+    description, build = SCENARIOS[name]
+    sim = build(seed, **options)
+    pilot = Autopilot(seed)
+    renderer = None
+    if render:
+        surface = pygame.Surface((WIDTH, HEIGHT))
+        renderer = Renderer(surface, pygame.font.Font(None, 24))
+
+    samples = {phase: [] for phase in PHASES}
+    start = time.perf_counter()
+    try:
+        for i in range(warmup + ticks):
+            times = sim.step(*pilot(sim))
+            if renderer is not None:
+                t0 = time.perf_counter()
+                renderer.draw(sim)
+                times["render"] = time.perf_counter() - t0
+            times["frame"] = times["tick"] + times["render"]
+            if i >= warmup:
+                for phase in PHASES:
+                    samples[phase].append(times[phase])
+    finally:
+        sim.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "description": description,
+        "enemies": len(sim.enemies),
+        "points_end": len(sim.world.points),
+        "ticks_per_s": (warmup + ticks) / elapsed if elapsed else 0.0,
+        "phases": {phase: summarize(samples[phase]) for phase in PHASES
+                   if render or phase != "render"},
+    }
+
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Return (scenario, phase, old_p50, new_p50) for every phase that slowed down."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for phase, stats in result["phases"].items():
+            before = old["phases"].get(phase)
+            if not before:
+                continue
+            # ignore sub-50us noise on phases that barely register
+            if stats["p50"] > before["p50"] * (1 + tolerance) and stats["p50"] - before["p50"] > 0.05:
+                regressions.append((name, phase, before["p50"], stats["p50"]))
+    return regressions
+
+
+def print_report(results):
+    memory = results.get("memory")
+    if memory:
+        print(f"\npoint memory: {memory['point']:.0f} B/point "
+              f"(per-point dict layout: {memory['dict_point']:.0f} B/point, "
+              f"measured over {memory['count']} points)")
+    snap = results.get("snapshot")
+    if snap:
+        print(f"\nsnapshots: {snap['ticks']} ticks, {snap['enemies']} enemies, "
+              f"{snap['mismatches']} round-trip mismatches"
+              + (f", first at tick {snap['first_mismatch']}" if snap["mismatches"] else ""))
+        print(f"  full {snap['full_bytes']['mean']:.0f} B (max {snap['full_bytes']['max']}), "
+              f"delta {snap['delta_bytes']['mean']:.0f} B (max {snap['delta_bytes']['max']})")
+        print(f"  {'':<14}{'mean':>9}{'p99':>9}  ms {'MB/s':>8}")
+        for name in ("encode_full", "decode_full", "encode_delta", "decode_delta"):
+            stats = snap[name]
+            print(f"  {name:<14}{stats['mean']:>9.3f}{stats['p99']:>9.3f}    {stats['mb_per_s']:>8.1f}")
+    checkpoints = results.get("checkpoints")
+    if checkpoints:
+        print(f"\ncheckpoints:  {'size':>9}{'build':>9}{'save':>9}{'load':>9}  ms")
+        for name, report in checkpoints.items():
+            check = ("restored game matches" if report["diverged_at"] is None
+                     else f"DIVERGED at tick {report['diverged_at']}")
+            print(f"  {name:<12}{report['bytes'] / 1024:>7.0f}KB{report['build_ms']:>9.1f}"
+                  f"{report['save_ms']:>9.1f}{report['load_ms']:>9.1f}  {check}")
+    for name, result in results["scenarios"].items():
+        print(f"\n{name}: {result['description']} "
+              f"({result['enemies']} enemies, {result['points_end']} points, "
+              f"{result['ticks_per_s']:.0f} ticks/s)")
+        print(f"  {'phase':<10}{'mean':>9}{'p50':>9}{'p99':>9}{'max':>9}  ms")
+        for phase, stats in result["phases"].items():
+            print(f"  {phase:<10}{stats['mean']:>9.3f}{stats['p50']:>9.3f}"
+                  f"{stats['p99']:>9.3f}{stats['max']:>9.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark simulation and render cost.")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--ticks", type=int, default=200, help="measured ticks per scenario")
+    parser.add_argument("--warmup", type=int, default=30, help="unmeasured ticks before timing")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--no-render", action="store_true", help="skip the offscreen render phase")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="move enemies with the NumPy population stepper")
+    parser.add_argument("--ai-workers", type=int, default=0, metavar="N",
+                        help="run enemy AI on N worker processes")
+    parser.add_argument("--no-ai-lod", action="store_true",
+                        help="run every enemy's AI every tick, however far away")
+    parser.add_argument("--memory", action="store_true",
+                        help="also report bytes per collectible point")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="also report snapshot encode/decode speed and size")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="also report checkpoint save/restore time for each scenario")
+    parser.add_argument("--no-scenarios", action="store_true",
+                        help="skip the timed scenarios, e.g. to run just the --snapshot and "
+                             "--checkpoint checks")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown before --compare fails (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    pygame.font.init()
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ticks": args.ticks,
+            "warmup": args.warmup,
+            "vectorized": args.vectorized,
+            "ai_workers": args.ai_workers,
+            "ai_lod": not args.no_ai_lod,
+        },
+        "scenarios": {},
+    }
+    if args.memory:
+        results["memory"] = point_memory_report()
+    if args.snapshot:
+        results["snapshot"] = snapshot_report(args.seed, args.warmup + args.ticks)
+    if args.checkpoint:
+        results["checkpoints"] = {name: checkpoint_report(name, args.seed, args.warmup)
+                                  for name in args.scenario or SCENARIOS}
+    for name in () if args.no_scenarios else args.scenario or SCENARIOS:
+        results["scenarios"][name] = run_scenario(name, args.seed, args.ticks, args.warmup,
+                                                  render=not args.no_render,
+                                                  vectorized=args.vectorized,
+                                                  ai_workers=args.ai_workers,
+                                                  ai_lod=not args.no_ai_lod)
+    print_report(results)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if args.snapshot and results["snapshot"]["mismatches"]:
+        print("SNAPSHOT ROUND TRIP FAILED")
+        failed = True
+    for name, report in results.get("checkpoints", {}).items():
+        if report["diverged_at"] is not None:
+            print(f"CHECKPOINT RESTORE DIVERGED: {name}")
+            failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, phase, before, after in regressions:
+            print(f"REGRESSION {name}/{phase}: p50 {before:.3f} ms -> {after:.3f} ms")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,4 +12,8 @@ class Camera:
 
     def apply(self, entity_pos):
         # Translates world coords to screen coords
-        return (entity_pos[0] - self.offset.x, entity_pos[1] - self.offset.y)
\ No newline at end of file
+        return (entity_pos[0] - self.offset.x, entity_pos[1] - self.offset.y)
+
+    def viewport(self):
+        """The part of the world on screen, in world coordinates."""
+        return pygame.Rect(self.offset.x, self.offset.y, WIDTH, HEIGHT)
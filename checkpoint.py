@@ -0,0 +1,328 @@
+"""Save a running game to disk and bring it back in a few milliseconds.
+
+A checkpoint is one flat file, made to be memory-mapped:
+
+    header    "DCKP" u16 version, u16 sections, then per section
+              4s name, u32 offset, u32 size (offsets 8-byte aligned)
+    META      JSON: seed, RNG state, clock, tick, names, tiers, high scores
+    DRGN      one fixed-size record per dragon, players first
+    TRAL      every trail's float64 x, y pairs, head first, back to back
+    PNTS      one record per point, in the order they were added
+    OBST      i32 x, y, w, h per obstacle
+    STSH      points put aside by sleeping chunks, as PNTS (chunked worlds)
+
+Only META is parsed up front.  The map is not generated just to be
+replaced: dragons and points are read straight from the mapping with
+struct, points going into the map as they are decoded, and each trail is
+one memcpy out of TRAL into its ring buffer.  OBST is only read for a
+classic world and STSH only for a chunked one.  What is left is adding
+the live points to the map, which is most of a load with many of them.
+The restored Simulation carries on exactly as the saved one would have:
+the RNG, the clock, the AI schedule and the expiry order of every point
+are part of the checkpoint.  Grids that are rebuilt every tick are not,
+and neither are a chunked world's walls, which come back from its seed.
+
+    python checkpoint.py quicksave.ckpt      # describe a checkpoint
+"""
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from itertools import count
+
+import pygame
+
+from settings import *
+from enemy import Enemy
+from player import Dragon
+from simulation import Simulation, SimClock
+from trail import Trail
+from world import POINT_TIERS, Point
+
+MAGIC = b"DCKP"
+VERSION = 1
+TIER_NAMES = tuple(POINT_TIERS)
+TIER_IDS = {name: i for i, name in enumerate(TIER_NAMES)}
+
+_HEADER = struct.Struct("<4sHH")
+_SECTION = struct.Struct("<4sII")
+# pos, prev_pos, heading, base_speed, score, length, invulnerable_until,
+# burst_cooldown, ai_tick, flags, colour, trail start and length in points
+_DRAGON = struct.Struct("<10dqqH3BxII")
+_POINT = struct.Struct("<ddqIB3x")
+_OBSTACLE = struct.Struct("<4i")
+
+# dragon flags
+_ENEMY = 1
+_ALIVE = 2
+_BURSTING = 4
+_IN_ARENA = 8       # in sim.players (a dead local player is not)
+_LOCAL = 16         # sim.player
+_SCORE_INT = 32
+_LENGTH_INT = 64
+_HAS_AI_TICK = 128
+_SHIELDED = 256     # has invulnerable_until
+
+
+def _dragon_record(dragon, flags, trail_start):
+    heading = dragon.dir if flags & _ENEMY else dragon.current_move
+    if dragon.alive:
+        flags |= _ALIVE
+    if getattr(dragon, "is_bursting", False):
+        flags |= _BURSTING
+    if isinstance(dragon.score, int):
+        flags |= _SCORE_INT
+    if isinstance(dragon.length, int):
+        flags |= _LENGTH_INT
+    ai_tick = getattr(dragon, "ai_tick", None)
+    if ai_tick is not None:
+        flags |= _HAS_AI_TICK
+    shield = getattr(dragon, "invulnerable_until", None)
+    if shield is not None:
+        flags |= _SHIELDED
+    color = getattr(dragon, "color", CLR_PLAYER)
+    return _DRAGON.pack(dragon.pos.x, dragon.pos.y, dragon.prev_pos.x, dragon.prev_pos.y,
+                        heading.x, heading.y, dragon.base_speed, dragon.score, dragon.length,
+                        shield if shield is not None else 0.0, dragon.burst_cooldown,
+                        ai_tick if ai_tick is not None else 0, flags, *color,
+                        trail_start, len(dragon.trail))
+
+
+def save(sim, path, high_scores=None):
+    """Write sim (and the high-score table, if given) to path atomically."""
+    if sim.population is not None:
+        raise ValueError("checkpoints do not cover the vectorised population stepper")
+    dragons = []
+    for p in sim.players:
+        dragons.append((p, _IN_ARENA | (_LOCAL if p is sim.player else 0)))
+    if sim.player is not None and sim.player not in sim.players:
+        dragons.append((sim.player, _LOCAL))
+    dragons.extend((e, _ENEMY) for e in sim.enemies)
+
+    records = bytearray()
+    trails = bytearray()
+    for dragon, flags in dragons:
+        records += _dragon_record(dragon, flags, len(trails) // 16)
+        for view in dragon.trail.views(0):
+            trails += view.cast("B")
+
+    world = sim.world
+    points = bytearray()
+    for pt, seq in world.live_points():
+        points += _POINT.pack(pt.pos.x, pt.pos.y, pt.created_at, seq, TIER_IDS[pt.tier])
+    chunks = None
+    stashed = bytearray()
+    if sim.chunked:
+        chunks, stash = world.chunk_state()
+        for x, y, tier, created_at in stash:
+            stashed += _POINT.pack(x, y, created_at, 0, TIER_IDS[tier])
+        obstacles = b""
+    else:
+        obstacles = b"".join(_OBSTACLE.pack(o.x, o.y, o.width, o.height) for o in world.obstacles)
+
+    schedule = sim.ai_schedule
+    slot = None
+    if schedule is not None:
+        # itertools.count has no peek: take the next slot and start over from it
+        slot = next(schedule._slots)
+        schedule._slots = count(slot)
+    meta = {
+        "seed": sim.seed,
+        "rng": sim.rng.getstate(),
+        "clock": [sim.clock.now, sim.clock.tick_ms],
+        "tick": sim.tick_count,
+        "game_over": [sim.game_over, sim.game_over_reason],
+        "world_size": world.size,
+        "expiry_seq": world._expiry_seq,
+        "chunks": chunks,
+        "ai_slot": slot,
+        "names": [d.name for d, _ in dragons],
+        "tiers": [getattr(d, "tier", None) for d, _ in dragons],
+        "death_reasons": [d.death_reason if not flags & _ENEMY else "" for d, flags in dragons],
+        "high_scores": list(high_scores.scores) if high_scores is not None else [],
+    }
+    sections = [(b"META", json.dumps(meta).encode()), (b"DRGN", records), (b"TRAL", trails),
+                (b"PNTS", points), (b"OBST", obstacles)]
+    if chunks is not None:
+        sections.append((b"STSH", stashed))
+
+    table_end = _HEADER.size + _SECTION.size * len(sections)
+    offset = (table_end + 7) & ~7
+    parts = [_HEADER.pack(MAGIC, VERSION, len(sections))]
+    body = []
+    for name, data in sections:
+        parts.append(_SECTION.pack(name, offset, len(data)))
+        pad = -len(data) & 7
+        body.append(bytes(data) + bytes(pad))
+        offset += len(data) + pad
+    parts.append(bytes(-table_end & 7))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(parts + body))
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class Checkpoint:
+    """A checkpoint file mapped into memory.  Sections are memoryviews."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, version, n = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            view.release()
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} checkpoint")
+        self.sections = {}
+        for i in range(n):
+            name, offset, size = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            self.sections[name.decode()] = view[offset:offset + size]
+        self._view = view
+        self._meta = None
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._meta = json.loads(bytes(self.sections["META"]))
+        return self._meta
+
+    def dragons(self):
+        return _DRAGON.iter_unpack(self.sections["DRGN"])
+
+    def points(self):
+        return _POINT.iter_unpack(self.sections["PNTS"])
+
+    def obstacles(self):
+        return [pygame.Rect(*r) for r in _OBSTACLE.iter_unpack(self.sections["OBST"])]
+
+    def close(self):
+        for view in self.sections.values():
+            view.release()
+        self.sections = {}
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def restore(self, record_score=None, ai_lod=None):
+        """A new Simulation in the saved state."""
+        meta = self.meta
+        if ai_lod is None:
+            ai_lod = meta["ai_slot"] is not None
+        clock = SimClock(meta["clock"][1], meta["clock"][0])
+        # no map, no roster and no player: everything comes from the checkpoint
+        sim = Simulation(seed=meta["seed"], clock=clock, world_size=meta["world_size"],
+                         roster=(), record_score=record_score, ai_lod=ai_lod,
+                         local_player=False, generate=False)
+        world = sim.world
+        tiers = TIER_NAMES
+        chunks = meta.get("chunks")
+        if (chunks is not None) != sim.chunked:
+            raise ValueError("checkpoint and CHUNKED_WORLD_SIZE disagree on chunking this world")
+        # points go into the map as they are decoded; a chunked world's
+        # walls come from its seed, so OBST is not read for it
+        world.restore(self.obstacles() if chunks is None else [],
+                      ((Point((x, y), tiers[tier], created_at), seq)
+                       for x, y, created_at, seq, tier in self.points()),
+                      meta["expiry_seq"])
+        if chunks is not None:
+            world.restore_chunks(chunks, [(x, y, tiers[tier], created_at) for x, y, created_at, _, tier
+                                          in _POINT.iter_unpack(self.sections["STSH"])])
+
+        trails = self.sections["TRAL"]
+        names, dragon_tiers, reasons = meta["names"], meta["tiers"], meta["death_reasons"]
+        for i, record in enumerate(self.dragons()):
+            (x, y, px, py, hx, hy, base_speed, score, length, shield, burst_cooldown, ai_tick,
+             flags, r, g, b, trail_start, trail_len) = record
+            trail = Trail.from_bytes(trails[16 * trail_start:16 * (trail_start + trail_len)])
+            if flags & _ENEMY:
+                dragon = Enemy(dragon_tiers[i], world, trail)
+                dragon.dir = pygame.Vector2(hx, hy)
+                dragon.color = (r, g, b)
+                dragon.ai_tick = ai_tick if flags & _HAS_AI_TICK else None
+                sim.enemies.append(dragon)
+            else:
+                dragon = Dragon((x, y), world, names[i], trail)
+                dragon.current_move = pygame.Vector2(hx, hy)
+                dragon.death_reason = reasons[i]
+                if flags & _IN_ARENA:
+                    sim.players.append(dragon)
+                if flags & _LOCAL:
+                    sim.player = dragon
+            dragon.name = names[i]
+            dragon.pos = pygame.Vector2(x, y)
+            dragon.prev_pos = pygame.Vector2(px, py)
+            dragon.base_speed = base_speed
+            dragon.score = int(score) if flags & _SCORE_INT else score
+            dragon.length = int(length) if flags & _LENGTH_INT else length
+            dragon.burst_cooldown = burst_cooldown
+            dragon.alive = bool(flags & _ALIVE)
+            dragon.is_bursting = bool(flags & _BURSTING)
+            if flags & _SHIELDED:
+                dragon.invulnerable_until = shield
+
+        if ai_lod and meta["ai_slot"] is not None:
+            sim.ai_schedule._slots = count(meta["ai_slot"])
+        sim.tick_count = meta["tick"]
+        sim.game_over, sim.game_over_reason = meta["game_over"]
+        state = meta["rng"]
+        sim.rng.setstate((state[0], tuple(state[1]), state[2]))
+        return sim
+
+
+def load(path, record_score=None, high_scores=None):
+    """Restore the Simulation saved at path.
+
+    Saved high scores are merged into high_scores, when given.
+    """
+    # thousands of new objects would otherwise set off full collections
+    # of everything else that is alive, which costs more than the restore
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        with Checkpoint(path) as checkpoint:
+            sim = checkpoint.restore(record_score)
+            if high_scores is not None:
+                for entry in checkpoint.meta["high_scores"]:
+                    high_scores.add(entry["name"], entry["score"])
+    finally:
+        if collecting:
+            gc.enable()
+    return sim
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python checkpoint.py FILE")
+        return 2
+    with Checkpoint(argv[0]) as checkpoint:
+        meta = checkpoint.meta
+        sizes = ", ".join(f"{name} {len(view)} B" for name, view in checkpoint.sections.items())
+        print(f"seed {meta['seed']}, tick {meta['tick']}, world {meta['world_size']}")
+        print(f"{len(meta['names'])} dragons, {len(checkpoint.sections['PNTS']) // _POINT.size} points, "
+              f"{len(checkpoint.sections['OBST']) // _OBSTACLE.size} obstacles")
+        chunks = meta.get("chunks")
+        if chunks is not None:
+            print(f"{len(chunks['active'])} active chunks, {len(chunks['sleeping'])} sleeping")
+        print(f"sections: {sizes}")
+        if meta["game_over"][0]:
+            print(f"game over: {meta['game_over'][1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Worlds too big to build up front, generated a chunk at a time.
+
+The map is cut into square chunks of WORLD_CHUNK pixels.  What a chunk holds
+comes from its own random.Random, seeded from the world seed and the chunk's
+coordinates, so a chunk gets the same obstacles whenever and in whatever
+order it is first visited.  Contents are scaled from the classic 6000px map,
+which keeps the density of walls and points the game was tuned for.
+
+Only active chunks, the ones within CHUNK_RADIUS chunks of a dragon, have
+their points on the map, so pickups, the AI, snapshots and drawing never see
+the rest.  A chunk nobody has come near for CHUNK_SLEEP_SECONDS goes to sleep:
+its points are put aside and its walls dropped.  Waking it brings back the
+points that have not expired since, or a fresh batch when none are left.
+Walls are generated for any chunk a head is tested in (spawns look all over
+the map) and dropped again once that chunk is not active.
+"""
+import random
+
+import pygame
+
+from settings import *
+from spatial import ObstacleGrid, SEGMENT_SIZE
+from world import World, POINT_TIERS, _NORMAL, wall_free_lattice
+
+# chunk contents per area of the classic map
+_CLASSIC_AREA = 6000 * 6000
+_OBSTACLES = 20
+_POINTS = (("normal", 150), ("rare", 40), ("legendary", 15), ("mythic", 5))
+# stashes of sleeping chunks are cleared of expired points past this size
+_STASH_PRUNE = 64
+# updates, one a tick, before a deserted chunk sleeps
+_SLEEP_TICKS = round(CHUNK_SLEEP_SECONDS * TICK_RATE)
+
+_NO_WALLS = ObstacleGrid([])
+
+
+def _count(rng, expected):
+    """expected rounded up or down at random, so it is right on average."""
+    n = int(expected)
+    return n + (rng.random() < expected - n)
+
+
+def _expired(entry, now):
+    _, _, tier, created_at = entry
+    return now - created_at > POINT_TIERS.get(tier, _NORMAL)[2]
+
+
+class ChunkWalls:
+    """The obstacles of a chunked world, generated a chunk at a time.
+
+    Answers head_hits() like ObstacleGrid.  Obstacles keep SEGMENT_SIZE clear
+    of the top and left edges of their chunk, so a head rect only ever
+    reaches the walls of the chunk its position is in.
+    """
+    def __init__(self, seed, size, chunk_size=WORLD_CHUNK):
+        self.seed = seed
+        self.size = size
+        self.chunk_size = chunk_size
+        self.span = -(-size // chunk_size)     # chunks along each side
+        self.chunks = {}     # (cx, cy) -> (obstacles, ObstacleGrid)
+
+    def in_world(self, key):
+        return 0 <= key[0] < self.span and 0 <= key[1] < self.span
+
+    def bounds(self, key):
+        """x, y, width, height of a chunk; the last row and column may be short."""
+        size = self.chunk_size
+        x0, y0 = key[0] * size, key[1] * size
+        return x0, y0, min(size, self.size - x0), min(size, self.size - y0)
+
+    def generate(self, key):
+        """The obstacles of one chunk, always the same for the same seed."""
+        x0, y0, w, h = self.bounds(key)
+        rng = random.Random(f"{self.seed}/{key[0]}/{key[1]}")
+        obstacles = []
+        for _ in range(_count(rng, _OBSTACLES * w * h / _CLASSIC_AREA)):
+            ow, oh = rng.randint(100, 300), rng.randint(100, 300)
+            if ow + SEGMENT_SIZE <= w and oh + SEGMENT_SIZE <= h:
+                x = rng.randint(x0 + SEGMENT_SIZE, x0 + w - ow)
+                y = rng.randint(y0 + SEGMENT_SIZE, y0 + h - oh)
+                obstacles.append(pygame.Rect(x, y, ow, oh))
+        return obstacles
+
+    def load(self, key):
+        entry = self.chunks.get(key)
+        if entry is None:
+            if not self.in_world(key):
+                return (), _NO_WALLS
+            obstacles = self.generate(key)
+            size = self.chunk_size
+            entry = (obstacles, ObstacleGrid(obstacles, origin=(key[0] * size, key[1] * size)))
+            self.chunks[key] = entry
+        return entry
+
+    def head_hits(self, x, y):
+        """True if a head rect at (x, y) overlaps an obstacle."""
+        size = self.chunk_size
+        key = (int(x) // size, int(y) // size)
+        entry = self.chunks.get(key)
+        if entry is None:
+            entry = self.load(key)
+        return entry[1].head_hits(x, y)
+
+    def obstacles_in(self, rect):
+        """The obstacles that overlap rect, generating chunks as needed."""
+        size = self.chunk_size
+        found = []
+        for cx in range(max(0, rect.left // size), min(self.span, rect.right // size + 1)):
+            for cy in range(max(0, rect.top // size), min(self.span, rect.bottom // size + 1)):
+                found.extend(obs for obs in self.load((cx, cy))[0] if rect.colliderect(obs))
+        return found
+
+    @property
+    def obstacles(self):
+        """Every obstacle generated so far."""
+        return [obs for obstacles, _ in self.chunks.values() for obs in obstacles]
+
+    def keep(self, keys):
+        """Drop the walls of every chunk not in keys."""
+        self.chunks = {key: entry for key, entry in self.chunks.items() if key in keys}
+
+
+class ChunkedWorld(World):
+    """A World whose obstacles and points are generated chunk by chunk.
+
+    The Simulation calls update_chunks() with every head once a tick, before
+    anything looks at the map.
+    """
+    def _generate(self):
+        # the only draw from the simulation's rng; chunks have their own
+        self.seed = self.rng.getrandbits(32)
+        self.walls = ChunkWalls(self.seed, self.size)
+        self.chunk_size = self.walls.chunk_size
+        self.active = {}        # (cx, cy) -> times the chunk has been woken
+        self.sleeping = {}      # (cx, cy) -> (times woken, [(x, y, tier, created_at)])
+        self._leaving = {}      # active chunk no one is near -> update it was left
+        self._centres = set()   # chunks with a head in them at the last update
+        self._near = set()      # chunks within CHUNK_RADIUS of those
+        self._updates = 0
+        # active chunk -> (margin, its spawn lattice points clear of walls)
+        self._lattices = {}
+
+    # the seed is all a chunked world lays out up front
+    _blank = _generate
+
+    @property
+    def obstacles(self):
+        return self.walls.obstacles
+
+    def obstacles_in(self, rect):
+        return self.walls.obstacles_in(rect)
+
+    def restore(self, obstacles, points, expiry_seq):
+        # obstacles come back from the seed; see restore_chunks for the rest
+        self._restore_points(points, expiry_seq)
+
+    def _key(self, pos):
+        size = self.chunk_size
+        return (int(pos[0]) // size, int(pos[1]) // size)
+
+    def _spawn_regions(self):
+        # the active chunks: their walls are loaded already, and nobody is
+        # anywhere near the rest.  Before any is active, the middle one.
+        return sorted(self.active) or [self._key((self.size // 2, self.size // 2))]
+
+    def _spawn_lattice(self, key, margin):
+        entry = self._lattices.get(key)
+        if entry is None or entry[0] != margin:
+            x0, y0, w, h = self.walls.bounds(key)
+            area = (x0, y0, x0 + w - 1, y0 + h - 1)
+            entry = self._lattices[key] = (margin, wall_free_lattice(
+                self.walls, margin, self.size - margin, area))
+        return entry[1]
+
+    def update_chunks(self, positions):
+        """Wake the chunks around positions and put long-deserted ones to sleep."""
+        self._updates += 1
+        centres = {self._key(pos) for pos in positions}
+        if centres != self._centres:
+            self._centres = centres
+            r, walls = CHUNK_RADIUS, self.walls
+            near = {(cx + dx, cy + dy) for cx, cy in centres
+                    for dx in range(-r, r + 1) for dy in range(-r, r + 1)}
+            near = {key for key in near if walls.in_world(key)}
+            for key in self._near - near:
+                self._leaving[key] = self._updates
+            for key in near:
+                self._leaving.pop(key, None)
+            self._near = near
+            # sorted, so the order points are added in never depends on set order
+            for key in sorted(near - self.active.keys()):
+                self._wake(key)
+        if self._leaving:
+            due = self._updates - _SLEEP_TICKS
+            for key in sorted(key for key, left in self._leaving.items() if left <= due):
+                del self._leaving[key]
+                self._sleep(key)
+        if len(self.walls.chunks) > len(self.active):
+            self.walls.keep(self.active)
+        cells = -(-self.chunk_size // self.points.cell_size)
+        self.points.spread = len(self.active) * cells * cells
+
+    def _wake(self, key):
+        wakes, stash = self.sleeping.pop(key, (0, ()))
+        self.active[key] = wakes + 1
+        now = self.clock()
+        alive = [entry for entry in stash if not _expired(entry, now)]
+        for x, y, tier, created_at in alive:
+            self._place((x, y), tier, created_at)
+        if wakes and alive:
+            return
+        x0, y0, w, h = self.walls.bounds(key)
+        rng = random.Random(f"{self.seed}/{key[0]}/{key[1]}/{wakes}")
+        lo_x, hi_x = max(x0, 50), min(x0 + w, self.size - 50) - 1
+        lo_y, hi_y = max(y0, 50), min(y0 + h, self.size - 50) - 1
+        if hi_x < lo_x or hi_y < lo_y:
+            return
+        scale = w * h / _CLASSIC_AREA
+        for tier, count in _POINTS:
+            for _ in range(_count(rng, count * scale)):
+                self._place((rng.randint(lo_x, hi_x), rng.randint(lo_y, hi_y)), tier, now)
+
+    def _sleep(self, key):
+        wakes = self.active.pop(key)
+        self._lattices.pop(key, None)
+        size = self.chunk_size
+        gone = self.points.in_rect(pygame.Rect(key[0] * size, key[1] * size, size, size))
+        self.sleeping[key] = (wakes, [(pt.pos.x, pt.pos.y, pt.tier, pt.created_at) for pt in gone])
+        for pt in gone:
+            self.remove_point(pt)
+
+    def spawn_point(self, pos, tier="normal"):
+        key = self._key(pos)
+        if key in self.active or not self.walls.in_world(key):
+            self._place(pos, tier, self.clock())
+            return
+        # nobody is there to see it: it waits with the chunk
+        wakes, stash = self.sleeping.setdefault(key, (0, []))
+        now = self.clock()
+        if len(stash) >= _STASH_PRUNE:
+            stash[:] = [entry for entry in stash if not _expired(entry, now)]
+        stash.append((pos[0], pos[1], tier, now))
+
+    def chunk_state(self):
+        """(state, stashed points) for a checkpoint: a JSON-ready dict and the
+        (x, y, tier, created_at) of every sleeping point, in stash order."""
+        stashed = []
+        sleeping = []
+        for (cx, cy), (wakes, stash) in self.sleeping.items():
+            sleeping.append([cx, cy, wakes, len(stash)])
+            stashed.extend(stash)
+        state = {
+            "updates": self._updates,
+            "centres": sorted(self._centres),
+            "active": [[cx, cy, wakes, self._leaving.get((cx, cy))]
+                       for (cx, cy), wakes in self.active.items()],
+            "sleeping": sleeping,
+        }
+        return state, stashed
+
+    def restore_chunks(self, state, stashed):
+        """Take back what chunk_state() gave."""
+        self._updates = state["updates"]
+        self._centres = {tuple(key) for key in state["centres"]}
+        self.active = {}
+        self._leaving = {}
+        for cx, cy, wakes, left in state["active"]:
+            self.active[cx, cy] = wakes
+            if left is not None:
+                self._leaving[cx, cy] = left
+        self._near = set(self.active) - set(self._leaving)
+        self.sleeping = {}
+        start = 0
+        for cx, cy, wakes, count in state["sleeping"]:
+            self.sleeping[cx, cy] = (wakes, list(stashed[start:start + count]))
+            start += count
@@ -0,0 +1,225 @@
+"""Thin pygame client for server.py.
+
+Sends keyboard input and draws the arena from the server's state
+frames with the ordinary Renderer.  Nothing is simulated locally.
+Dragons slide from where the previous snapshot had them to where the
+latest one does, so movement stays smooth between snapshots.
+
+    python client.py --host 127.0.0.1 --port 8765 --name ALICE
+"""
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+
+import pygame
+
+from settings import *
+from chunks import ChunkWalls
+from player import read_input
+from render import Renderer
+from server import HOST, PORT
+from snapshot import SCORE_SCALE, decode
+from trail import Trail
+from world import Point
+
+
+class RemoteDragon:
+    """A dragon as the last snapshot described it."""
+    def __init__(self, dragon_id):
+        self.id = dragon_id
+        self.name = ""
+        self.color = CLR_ENEMY
+        self.pos = pygame.Vector2()
+        self.prev_pos = pygame.Vector2()
+        self.placed = False
+        # a new name under the same id is a respawn, as for Enemy.respawns
+        self.respawns = 0
+        self.score = 0
+        self.length = 0
+        self.trail = Trail()
+        self._state = None
+
+    def update(self, state):
+        """Take on a snapshot.DragonState."""
+        x, y = state.pos
+        if self.placed:
+            self.prev_pos.update(self.pos)
+        else:
+            self.prev_pos.update(x, y)
+            self.placed = True
+        self.pos.update(x, y)
+        if self.name and state.name != self.name:
+            self.respawns += 1
+        self.name = state.name
+        self.color = state.color
+        self.score = state.score / SCORE_SCALE
+        self.length = state.length
+        old, self._state = self._state, state
+        if old is not None and old.trail is state.trail:
+            return
+        trail = self.trail
+        trail.clear()
+        for px, py in reversed(state.trail):
+            trail.push_front(px, py)
+
+
+class RemoteWorld:
+    """The parts of World the Renderer draws: size, obstacles and points."""
+    def __init__(self, welcome):
+        self.size = welcome["size"]
+        self.obstacles = [pygame.Rect(*rect) for rect in welcome["obstacles"]]
+        # a chunked world's walls are generated here from its seed, as needed
+        chunks = welcome.get("chunks")
+        self.walls = ChunkWalls(*chunks) if chunks else None
+        self.tiers = welcome["tiers"]
+        self.points = VisiblePoints()
+
+    def obstacles_in(self, rect):
+        if self.walls is not None:
+            return self.walls.obstacles_in(rect)
+        return [obs for obs in self.obstacles if rect.colliderect(obs)]
+
+    def follow(self, pos):
+        """Drop the walls of chunks more than CHUNK_RADIUS from pos, the way
+        ChunkedWorld.update_chunks does around the dragons."""
+        walls = self.walls
+        if walls is None:
+            return
+        size, r = walls.chunk_size, CHUNK_RADIUS
+        cx, cy = int(pos[0]) // size, int(pos[1]) // size
+        if any(abs(x - cx) > r or abs(y - cy) > r for x, y in walls.chunks):
+            walls.keep({(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1)})
+
+
+class VisiblePoints(list):
+    """The points the server sent, already limited to around the player."""
+    def in_rect(self, rect):
+        return [pt for pt in self if rect.collidepoint(pt.pos)]
+
+
+class RemoteGame:
+    """Stands in for a Simulation as far as Renderer.draw is concerned."""
+    def __init__(self, welcome):
+        self.world = RemoteWorld(welcome)
+        self.snapshot_interval = 1.0 / welcome["snapshot_rate"]
+        self.player = RemoteDragon(None)
+        self.enemies = []
+        self.dead = ""
+        self.received_at = None
+        # the last snapshot decoded; the next one is a delta against it
+        self.snapshot = None
+        self._dragons = {}
+        self._points = {}
+
+    def apply(self, you, dead, snap):
+        seen = {}
+        for dragon_id, state in snap.dragons.items():
+            dragon = self._dragons.get(dragon_id)
+            if dragon is None:
+                dragon = RemoteDragon(dragon_id)
+            dragon.update(state)
+            seen[dragon_id] = dragon
+        self._dragons = seen
+        if you in seen:
+            self.player = seen.pop(you)
+            # the camera follows the player; walls far from it go
+            self.world.follow(self.player.pos)
+        # other players are drawn like enemies, in their own colours
+        self.enemies = list(seen.values())
+        tiers = self.world.tiers
+        points = {}
+        for point_id, (x, y, tier) in snap.points.items():
+            pt = self._points.get(point_id)
+            points[point_id] = pt if pt is not None else Point((x, y), tiers[tier], 0)
+        self._points = points
+        self.world.points[:] = points.values()
+        self.dead = dead if not you else ""
+        self.snapshot = snap
+        self.received_at = time.perf_counter()
+
+    def alpha(self):
+        if self.received_at is None:
+            return 1.0
+        return min(1.0, (time.perf_counter() - self.received_at) / self.snapshot_interval)
+
+
+_FRAME = struct.Struct("<IB")
+_STATE = struct.Struct("<IB")
+
+
+async def _read_frame(reader):
+    """(type, payload) of the next server frame."""
+    size, kind = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    return chr(kind), await reader.readexactly(size - 1)
+
+
+async def _receive(reader, game):
+    while True:
+        try:
+            kind, payload = await _read_frame(reader)
+        except asyncio.IncompleteReadError:
+            return
+        if kind == "S":
+            you, size = _STATE.unpack_from(payload, 0)
+            start = _STATE.size + size
+            dead = payload[_STATE.size:start].decode("utf-8", "replace")
+            game.apply(you, dead, decode(payload[start:], game.snapshot))
+
+
+async def run(host, port, name):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({"name": name}).encode() + b"\n")
+    kind, payload = await _read_frame(reader)
+    welcome = json.loads(payload)
+    game = RemoteGame(welcome)
+
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(f"Dragons: {host}:{port}")
+    font = pygame.font.SysFont("Arial", 24, bold=True)
+    renderer = Renderer(screen, font)
+    receiving = asyncio.create_task(_receive(reader, game))
+    frame = 1.0 / FPS if FPS else 0.0
+    sent = None
+    try:
+        while not receiving.done():
+            start = time.perf_counter()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+            move, burst = read_input()
+            command = ([move.x, move.y], burst)
+            if command != sent:
+                writer.write(json.dumps({"move": command[0], "burst": burst}).encode() + b"\n")
+                sent = command
+            if game.received_at is not None:
+                renderer.draw(game, game.alpha())
+                if game.dead:
+                    text = renderer.text.render(f"{game.dead} Respawning...", (255, 255, 255))
+                    screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2))
+                pygame.display.flip()
+            # yield to the network until the next frame is due
+            await asyncio.sleep(max(0.0, frame - (time.perf_counter() - start)))
+    finally:
+        receiving.cancel()
+        writer.close()
+        pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join a multiplayer arena.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--name", default="PLAYER")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args.host, args.port, args.name))
+    except ConnectionError as exc:
+        sys.exit(f"could not reach {args.host}:{args.port}: {exc}")
+
+
+if __name__ == "__main__":
+    main()
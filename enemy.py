@@ -2,53 +2,91 @@ import pygame
 import random
 import math
 from settings import *
+from tracing import traced
+from trail import Trail
 
 
 # simple naming utility for leaderboard/enemies
 _ADJECTIVES = ["Flaming", "Shadow", "Steel", "Wild", "Mystic", "Dark", "Fierce", "Swift", "Sunny", "Grim"]
 _NOUNS = ["Claw", "Wing", "Scale", "Fang", "Storm", "Blaze", "Roar", "Tail", "Heart", "Spine"]
 
-def random_name():
+# Distance multipliers used when picking a point to chase: a mythic point
+# 1000px away looks as attractive as a normal one 300px away.
+HUNT_VALUE_BONUS = {"mythic": 0.3, "legendary": 0.5, "rare": 0.7}
+STEAL_VALUE_BONUS = {"mythic": 0.3, "legendary": 0.6}
+# How far the AI looks for threats and prey
+DETECTION_RANGE = 300
+# Share of the old heading kept when turning to flee, hunt or chase a point,
+# tuned for a decision every tick at 60 ticks per second
+FLEE_KEEP = 0.3 ** TICK_SCALE
+HUNT_KEEP = 0.2 ** TICK_SCALE
+POINT_KEEP = 0.15 ** TICK_SCALE
+
+def random_name(rng=random):
     """Return a two‑word style name with a two‑digit suffix."""
-    return f"{random.choice(_ADJECTIVES)}{random.choice(_NOUNS)}{random.randint(10,99)}"
+    return f"{rng.choice(_ADJECTIVES)}{rng.choice(_NOUNS)}{rng.randint(10,99)}"
 
 
 class Enemy:
-    def __init__(self, tier="starter"):
-        self.name = random_name()
+    def __init__(self, tier="starter", world=None, trail=None):
+        self.trail = None
+        # bumped by every reset(), so a respawn in place reads as a new dragon
+        self.respawns = -1
+        self.reset(tier, world, trail)
+
+    def reset(self, tier="starter", world=None, trail=None):
+        """(Re)initialise as a freshly spawned dragon of the given tier.
+
+        Used by __init__ and to respawn a dead enemy in place, in which case
+        the trail buffer is kept and refilled.  A trail passed in is used as
+        it is, for restoring a saved enemy.
+        """
+        self.alive = True
+        self.respawns += 1
+        # last tick this enemy ran its AI, None until the scheduler sees it
+        self.ai_tick = None
+        # Randomness and timing come from the world when we have one so a
+        # seeded simulation stays repeatable.
+        rng = self.rng = world.rng if world else random
+        self.clock = world.clock if world else pygame.time.get_ticks
+        self.world_size = world.size if world else WORLD_SIZE
+        self.name = random_name(rng)
         self.tier = tier
-        self.pos = pygame.Vector2(random.randint(50, WORLD_SIZE-50), random.randint(50, WORLD_SIZE-50))
-        self.dir = pygame.Vector2(random.uniform(-1, 1), random.uniform(-1, 1)).normalize()
+        self.pos = pygame.Vector2(rng.randint(50, self.world_size-50), rng.randint(50, self.world_size-50))
+        self.dir = pygame.Vector2(rng.uniform(-1, 1), rng.uniform(-1, 1)).normalize()
+        # position at the start of the current tick, for interpolated drawing
+        self.prev_pos = pygame.Vector2(self.pos)
         
         # Progression Tiers
         if tier == "mythic":
             self.base_speed = 1.0
             self.color = (150, 0, 80)  # Dark purple
-            self.score = random.randint(1500, 2000)
+            self.score = rng.randint(1500, 2000)
         elif tier == "legendary":
             self.base_speed = 1.5
             self.color = (180, 30, 150)  # Purple-red
-            self.score = random.randint(1000, 1500)
+            self.score = rng.randint(1000, 1500)
         elif tier == "ultra":
             self.base_speed = 2.0
             self.color = (220, 50, 50)  # Dark red
-            self.score = random.randint(700, 900)
+            self.score = rng.randint(700, 900)
         elif tier == "high":
             self.base_speed = 2.5
             self.color = (200, 30, 30)
-            self.score = random.randint(300, 500)  # High tier starts strong
+            self.score = rng.randint(300, 500)  # High tier starts strong
         elif tier == "medium":
             self.base_speed = 4
             self.color = (230, 120, 30)
-            self.score = random.randint(100, 200)  # Medium tier starts moderate
+            self.score = rng.randint(100, 200)  # Medium tier starts moderate
         else: # starter
             self.base_speed = 5.5
             self.color = (200, 200, 50)
-            self.score = random.randint(10, 50)  # Starter tier starts low
+            self.score = rng.randint(10, 50)  # Starter tier starts low
         
         # Initial length using the square root formula for balanced growth
         self.length = 10 + int(math.sqrt(self.score) * 6)
 
+        self.is_bursting = False
         self.burst_cooldown = 0
         self.BURST_COST_POINTS = 30
         self.BURST_COST_LENGTH = 5
@@ -59,178 +97,71 @@ class Enemy:
         if self.dir.length() == 0:
             self.dir = pygame.Vector2(1, 0)
         segment_size = ENEMY_SEGMENT_SIZE
-        self.trail = [ (self.pos - self.dir * (i * segment_size)).xy for i in range(self.length) ]
+        if trail is not None:
+            self.trail = trail
+        elif self.trail is None:
+            self.trail = Trail.stretched(self.pos, self.dir, self.length, segment_size)
+        else:
+            self.trail.reset(self.pos, self.dir, self.length, segment_size)
     
     def burst(self):
-        now = pygame.time.get_ticks()
+        now = self.clock()
         if now < self.burst_cooldown or self.score < self.BURST_COST_POINTS + 50 or self.length < 15:
             return False
         
         self.score -= self.BURST_COST_POINTS
         self.length -= self.BURST_COST_LENGTH
         self.pos += self.dir * self.BURST_DISTANCE
-        self.trail.insert(0, tuple(self.pos))
+        self.trail.push_front(self.pos.x, self.pos.y)
         self.burst_cooldown = now + self.BURST_COOLDOWN_MS
         return True
     
     @property
     def speed(self):
         """Speed decreases gradually as length increases, starting to be noticeable at high lengths."""
-        return max(0.3, self.base_speed - 0.0006 * self.length)
+        return max(0.3, self.base_speed - 0.0006 * self.length) * TICK_SCALE
 
     def grow(self, amount=3):
         self.length += amount
         self.score += 10
 
-    def update_ai(self, player, other_enemies, obstacles, points):
-        """Intelligent behavior: hunt, flee, or search for points based on relative strength."""
-        detection_range = 300  # How far to look for targets
-        
-        # Find nearby threats or prey
-        closest_threat = None
-        closest_threat_dist = float('inf')
-        threat_is_dangerous = False
-        
-        # Check player
-        player_dist = self.pos.distance_to(player.pos)
-        if player_dist < detection_range:
-            if player.length > self.length * 1.1:  # Player is 10% bigger
-                threat_is_dangerous = True
-            closest_threat = player.pos
-            closest_threat_dist = player_dist
-        
-        # Check other enemies
-        for e in other_enemies:
-            e_dist = self.pos.distance_to(e.pos)
-            if e_dist < detection_range and e_dist > 0:
-                if e.length > self.length * 1.2:  # Enemy is 20% bigger
-                    threat_is_dangerous = True
-                if e_dist < closest_threat_dist:
-                    if e.length < self.length * 0.9:  # This enemy is smaller
-                        closest_threat = e.pos
-                        closest_threat_dist = e_dist
-                        threat_is_dangerous = False
-        
-        # Decide behavior
-        new_dir = self.dir.copy()
-        
-        if closest_threat and closest_threat_dist < detection_range:
-            if threat_is_dangerous:
-                # Flee from larger threat
-                flee_dir = (self.pos - closest_threat).normalize()
-                new_dir = flee_dir.lerp(new_dir, 0.3)
-            else:
-                # Hunt smaller prey
-                hunt_dir = (closest_threat - self.pos).normalize()
-                new_dir = hunt_dir.lerp(new_dir, 0.2)
-        else:
-            # Hunt for points - prioritize higher value points
-            closest_point = None
-            closest_point_dist = float('inf')
-            for pt in points:
-                pt_dist = self.pos.distance_to(pt.pos)
-                # Prioritize higher value: reduce effective distance for valuable points
-                # Higher tier points get a bonus (closer effective distance)
-                value_bonus = 1.0
-                if pt.tier == "mythic":
-                    value_bonus = 0.3  # Mythic points worth 3x more distance
-                elif pt.tier == "legendary":
-                    value_bonus = 0.5
-                elif pt.tier == "rare":
-                    value_bonus = 0.7
-                
-                effective_dist = pt_dist * value_bonus
-                if effective_dist < closest_point_dist:
-                    closest_point = pt.pos
-                    closest_point_dist = effective_dist
-            
-            if closest_point:
-                hunt_dir = (closest_point - self.pos).normalize()
-                new_dir = hunt_dir.lerp(new_dir, 0.15)
-        
-        # --- NEW ENEMY BURST LOGIC ---
-        # 1. Fleeing Burst: If a dangerous threat is very close
-        self.is_bursting = False
-        
-        # Burst if close to a threat or closing in on prey
-        if (threat_is_dangerous and closest_threat_dist < 150) or \
-           (not threat_is_dangerous and closest_threat and closest_threat_dist < 100):
-            if self.score > 100 and self.length > 20:
-                self.is_bursting = True
-        
-        # --- POINT STEALING LOGIC ---
-        closest_point = None
-        closest_point_dist = float('inf')
-        
-        for pt in points:
-            pt_dist = self.pos.distance_to(pt.pos)
-            
-            # Value-based weighting (Mythic points look "closer" to the AI)
-            value_bonus = 0.3 if pt.tier == "mythic" else 0.6 if pt.tier == "legendary" else 1.0
-            effective_dist = pt_dist * value_bonus
-            
-            if effective_dist < closest_point_dist:
-                closest_point = pt
-                closest_point_dist = pt_dist
-
-        if closest_point:
-            # Steering toward the point
-            hunt_dir = (closest_point.pos - self.pos).normalize()
-            self.dir = hunt_dir.lerp(self.dir, 0.15)
-            
-            # BURST TO STEAL: If it's a high value point and we are close, dash!
-            # The AI is smart: it only bursts if the point is worth the cost.
-            if closest_point_dist < 150:
-                if closest_point.tier in ["mythic", "legendary", "rare"]:
-                    if self.score > 100 and self.length > 20:
-                        self.is_bursting = True
-        
-        # --- DEFENSIVE/OFFENSIVE BURST ---
-        # If the player is very close and smaller (prey), dash to cut them off
-        if player_dist < 100 and player.length < self.length:
-            self.is_bursting = True
-
-        # Obstacle avoidance: detect if next move hits an obstacle
-        next_pos = self.pos + new_dir * self.speed
-        next_rect = pygame.Rect(next_pos.x, next_pos.y, 20, 20)
-        will_hit_obstacle = any(next_rect.colliderect(obs) for obs in obstacles)
-        
-        if will_hit_obstacle:
-            # Try to steer around obstacle by rotating direction
-            for angle in [45, -45, 90, -90]:
-                test_dir = new_dir.rotate(angle)
-                test_pos = self.pos + test_dir * self.speed
-                test_rect = pygame.Rect(test_pos.x, test_pos.y, 20, 20)
-                if not any(test_rect.colliderect(obs) for obs in obstacles):
-                    new_dir = test_dir
-                    break
-        
-        
+    @traced("Enemy.update_ai")
+    def update_ai(self, player, other_enemies, walls, points):
+        """Intelligent behavior: hunt, flee, or search for points based on relative strength.
 
-        self.dir = new_dir.normalize()
+        player is the player to react to (the nearest one) or None.
+        other_enemies only needs the dragons within DETECTION_RANGE (in
+        roster order); anything further away is ignored anyway.  walls is
+        the world's ObstacleGrid.
+        """
+        self.dir, self.is_bursting = steer(
+            self.pos, self.dir, self.length, self.speed, self.score,
+            player.pos if player is not None else None,
+            player.length if player is not None else 0,
+            [(e.pos, e.length) for e in other_enemies], walls, points)
 
     def update(self, world=None):
         current_speed = self.speed
         if getattr(self, 'is_bursting', False):
             current_speed *= 2.0
-            self.score -= 0.5
-            self.length -= 0.1
+            self.score -= 0.5 * TICK_SCALE
+            self.length -= 0.1 * TICK_SCALE
 
             self.score = max(0, self.score)
             self.length = max(5, self.length)
 
-            if world and random.random() < 0.1:
+            if world and self.rng.random() < 0.1 * TICK_SCALE:
                 world.spawn_point(self.trail[-1], "normal")
         
         # Wander AI: Occasionally shift direction
-        if random.random() < 0.03:
-            self.dir = self.dir.rotate(random.randint(-45, 45))
+        if self.rng.random() < 0.03 * TICK_SCALE:
+            self.dir = self.dir.rotate(self.rng.randint(-45, 45))
             
         self.pos += self.dir * current_speed
         
         # Keep enemies inside world bounds (bounce logic)
-        if self.pos.x < 0 or self.pos.x > WORLD_SIZE: self.dir.x *= -1
-        if self.pos.y < 0 or self.pos.y > WORLD_SIZE: self.dir.y *= -1
+        if self.pos.x < 0 or self.pos.x > self.world_size: self.dir.x *= -1
+        if self.pos.y < 0 or self.pos.y > self.world_size: self.dir.y *= -1
 
         # --- FIXED GROWTH & SPACING ---
         if self.score < 100:
@@ -244,24 +175,123 @@ class Enemy:
         self.length = min(450, int(target_length))
 
         # Spacing reduced to 4
-        if not self.trail or self.pos.distance_to(pygame.Vector2(self.trail[0])) > 4:
-            self.trail.insert(0, tuple(self.pos))
+        self.trail.advance(self.pos.x, self.pos.y, 4, int(self.length))
 
-        if len(self.trail) > int(self.length):
-            self.trail = self.trail[:int(self.length)]
-
-    def check_bounds_and_obstacles(self, obstacles, world_size):
+    def check_bounds_and_obstacles(self, walls, world_size):
         """Check if enemy is out of bounds or hit an obstacle. Returns True if dead."""
         if self.pos.x < 0 or self.pos.x > world_size or self.pos.y < 0 or self.pos.y > world_size:
             return True
-        head_rect = self.get_head_rect()
-        if any(head_rect.colliderect(obs) for obs in obstacles):
-            return True
-        return False
+        return walls.head_hits(self.pos.x, self.pos.y)
 
     def get_head_rect(self):
         return pygame.Rect(self.pos.x, self.pos.y, 20, 20)
 
     def get_rects(self):
         # Returns all segments as Rects for collision
-        return [pygame.Rect(p[0], p[1], 20, 20) for p in self.trail]
\ No newline at end of file
+        return [pygame.Rect(p[0], p[1], 20, 20) for p in self.trail]
+
+
+def steer(pos, direction, length, speed, score, player_pos, player_length, neighbours, walls, points):
+    """The enemy AI as a pure function of what the enemy can see.
+
+    neighbours holds (pos, length) of the other dragons in roster order;
+    player_pos is the nearest player's head, or None.
+    Returns the new (normalised) direction and whether to burst.  Nothing
+    is mutated, so the AI worker processes can run exactly the same code.
+    """
+    detection_range = DETECTION_RANGE  # How far to look for targets
+    
+    # Find nearby threats or prey
+    closest_threat = None
+    closest_threat_dist = float('inf')
+    threat_is_dangerous = False
+    
+    # Check player (there may be none, e.g. an empty server)
+    player_dist = pos.distance_to(player_pos) if player_pos is not None else float('inf')
+    if player_dist < detection_range:
+        if player_length > length * 1.1:  # Player is 10% bigger
+            threat_is_dangerous = True
+        closest_threat = player_pos
+        closest_threat_dist = player_dist
+    
+    # Check other enemies
+    for e_pos, e_length in neighbours:
+        e_dist = pos.distance_to(e_pos)
+        if e_dist < detection_range and e_dist > 0:
+            if e_length > length * 1.2:  # Enemy is 20% bigger
+                threat_is_dangerous = True
+            if e_dist < closest_threat_dist:
+                if e_length < length * 0.9:  # This enemy is smaller
+                    closest_threat = e_pos
+                    closest_threat_dist = e_dist
+                    threat_is_dangerous = False
+    
+    # Decide behavior
+    new_dir = direction.copy()
+    stealing = None
+    
+    if closest_threat and closest_threat_dist < detection_range:
+        if threat_is_dangerous:
+            # Flee from larger threat
+            flee_dir = (pos - closest_threat).normalize()
+            new_dir = flee_dir.lerp(new_dir, FLEE_KEEP)
+        else:
+            # Hunt smaller prey
+            hunt_dir = (closest_threat - pos).normalize()
+            new_dir = hunt_dir.lerp(new_dir, HUNT_KEEP)
+    else:
+        # Hunt for points - prioritize higher value points
+        # Higher tier points get a bonus (closer effective distance)
+        # the stealing search below comes out of the same walk over the points
+        (closest_point, _), stealing = points.nearest_each(pos, (HUNT_VALUE_BONUS, STEAL_VALUE_BONUS))
+        
+        # a point dropped right under our head has no direction to it
+        if closest_point and closest_point.pos != pos:
+            hunt_dir = (closest_point.pos - pos).normalize()
+            new_dir = hunt_dir.lerp(new_dir, POINT_KEEP)
+    
+    # --- NEW ENEMY BURST LOGIC ---
+    # 1. Fleeing Burst: If a dangerous threat is very close
+    bursting = False
+    
+    # Burst if close to a threat or closing in on prey
+    if (threat_is_dangerous and closest_threat_dist < 150) or \
+       (not threat_is_dangerous and closest_threat and closest_threat_dist < 100):
+        if score > 100 and length > 20:
+            bursting = True
+    
+    # --- POINT STEALING LOGIC ---
+    # Value-based weighting (Mythic points look "closer" to the AI)
+    if stealing is None:
+        stealing = points.nearest(pos, STEAL_VALUE_BONUS)
+    closest_point, closest_point_dist = stealing
+
+    # Steering toward the point used to be written to self.dir here, but
+    # the final direction below always replaced it; only the burst counts.
+    if closest_point and closest_point.pos != pos:
+        # BURST TO STEAL: If it's a high value point and we are close, dash!
+        # The AI is smart: it only bursts if the point is worth the cost.
+        if closest_point_dist < 150:
+            if closest_point.tier in ["mythic", "legendary", "rare"]:
+                if score > 100 and length > 20:
+                    bursting = True
+    
+    # --- DEFENSIVE/OFFENSIVE BURST ---
+    # If the player is very close and smaller (prey), dash to cut them off
+    if player_dist < 100 and player_length < length:
+        bursting = True
+
+    # Obstacle avoidance: detect if next move hits an obstacle
+    next_pos = pos + new_dir * speed
+    will_hit_obstacle = walls.head_hits(next_pos.x, next_pos.y)
+    
+    if will_hit_obstacle:
+        # Try to steer around obstacle by rotating direction
+        for angle in [45, -45, 90, -90]:
+            test_dir = new_dir.rotate(angle)
+            test_pos = pos + test_dir * speed
+            if not walls.head_hits(test_pos.x, test_pos.y):
+                new_dir = test_dir
+                break
+
+    return new_dir.normalize(), bursting
@@ -0,0 +1,189 @@
+"""Persistent high-score table.
+
+HighScoreStore keeps the top entries in memory so recording a score from
+the game loop is just a list insert.  Saving happens on a background
+thread: any number of new scores between two writes are coalesced into a
+single write, writes are at least FLUSH_INTERVAL seconds apart, and
+close() writes whatever is still pending.  Every save goes to a temp file
+in the same directory that is then renamed over the real one, so a crash
+mid-write leaves the previous table intact rather than a truncated file.
+"""
+import glob
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from enemy import random_name
+from tracing import traced
+
+HIGHSCORE_FILE = "highscores.json"
+MAX_ENTRIES = 10
+FLUSH_INTERVAL = 1.0
+
+
+def _valid(entry):
+    return (isinstance(entry, dict) and isinstance(entry.get("name"), str)
+            and isinstance(entry.get("score"), (int, float)))
+
+
+def parse_scores(text):
+    """Parse the text of a highscores file, salvaging what it can.
+
+    Returns (entries, intact).  A complete file is a JSON list.  From a
+    truncated one (say the tail of the list never got written) every entry
+    that was complete is still recovered, with intact False.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, list):
+        entries = [entry for entry in data if _valid(entry)]
+        return entries, len(entries) == len(data)
+
+    entries = []
+    decoder = json.JSONDecoder()
+    pos = text.find("[") + 1
+    if pos == 0:
+        return entries, False
+    while True:
+        # skip separators up to the next object
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        try:
+            entry, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            break
+        if _valid(entry):
+            entries.append(entry)
+    return entries, False
+
+
+class HighScoreStore:
+    """In-memory top-N table with write-behind, atomic saves."""
+    def __init__(self, path=HIGHSCORE_FILE, max_entries=MAX_ENTRIES, interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.interval = interval
+        self.scores = []
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._closing = False
+        self._thread = None
+
+    def load(self, rng=random):
+        """Read the table from disk, falling back to dummy entries."""
+        self._remove_stale_temp_files()
+        scores, intact = [], False
+        try:
+            with open(self.path, "r") as f:
+                scores, intact = parse_scores(f.read())
+        except (OSError, UnicodeDecodeError):
+            pass
+        if not scores:
+            # no usable file, create some dummy enemy entries
+            scores = [{"name": random_name(rng), "score": rng.randint(0, 1000)}
+                      for _ in range(self.max_entries)]
+        scores.sort(key=lambda x: x["score"], reverse=True)
+        with self._cond:
+            self.scores = scores[:self.max_entries]
+            # rewrite a damaged or missing file with what we ended up with
+            if not intact:
+                self._dirty = True
+                self._cond.notify()
+        return self.scores
+
+    @traced("HighScoreStore.add")
+    def add(self, name, score):
+        """Record a score; only marks the table dirty if it made the cut."""
+        with self._cond:
+            scores = self.scores
+            if len(scores) >= self.max_entries and score <= scores[-1]["score"]:
+                return False
+            scores.append({"name": name, "score": score})
+            scores.sort(key=lambda x: x["score"], reverse=True)
+            del scores[self.max_entries:]
+            self._dirty = True
+            self._cond.notify()
+        return True
+
+    def start(self):
+        """Start the background writer."""
+        if self._thread is None:
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="highscores", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the writer and save anything still pending."""
+        thread = self._thread
+        if thread is not None:
+            with self._cond:
+                self._closing = True
+                self._cond.notify()
+            thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Write the table now if it changed since the last save."""
+        with self._cond:
+            if not self._dirty:
+                return False
+            snapshot = [dict(entry) for entry in self.scores]
+            self._dirty = False
+        try:
+            self._write(snapshot)
+        except OSError:
+            with self._cond:
+                self._dirty = True
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    return
+            self.flush()
+            # bound the write rate; scores recorded meanwhile share one write
+            deadline = time.monotonic() + self.interval
+            with self._cond:
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+    def _write(self, scores):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=self._temp_prefix(), suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(scores, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _temp_prefix(self):
+        return "." + os.path.basename(self.path) + "."
+
+    def _remove_stale_temp_files(self):
+        # leftovers from a save that was cut short; the real file is intact
+        directory = os.path.dirname(os.path.abspath(self.path))
+        for tmp in glob.glob(os.path.join(glob.escape(directory), glob.escape(self._temp_prefix()) + "*.tmp")):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
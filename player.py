@@ -2,19 +2,52 @@ import pygame
 import random
 import math
 from settings import *
+from trail import Trail
+
+def read_input():
+    """Return (move, burst) from the current keyboard state."""
+    keys = pygame.key.get_pressed()
+    move = pygame.Vector2(0, 0)
+    if keys[pygame.K_w]: move.y = -1
+    if keys[pygame.K_s]: move.y = 1
+    if keys[pygame.K_a]: move.x = -1
+    if keys[pygame.K_d]: move.x = 1
+    return move, bool(keys[pygame.K_e])
+
+
+def nearest_dragon(dragons, pos):
+    """(dragon, squared distance) of the dragon closest to pos, or
+    (None, inf) when there are none."""
+    best, best_sq = None, float('inf')
+    for d in dragons:
+        dist_sq = pos.distance_squared_to(d.pos)
+        if dist_sq < best_sq:
+            best, best_sq = d, dist_sq
+    return best, best_sq
+
 
 class Dragon:
-    def __init__(self, start_pos=None):
+    def __init__(self, start_pos=None, world=None, name="YOU", trail=None):
+        # Randomness and timing come from the world when we have one so a
+        # seeded simulation stays repeatable.
+        self.rng = world.rng if world else random
+        self.clock = world.clock if world else pygame.time.get_ticks
+        world_size = world.size if world else WORLD_SIZE
         # start_pos may be a Vector2 or tuple; default to centre of world.
         if start_pos is None:
-            start_pos = pygame.Vector2(WORLD_SIZE // 2, WORLD_SIZE // 2)
+            start_pos = pygame.Vector2(world_size // 2, world_size // 2)
         else:
             start_pos = pygame.Vector2(start_pos)
 
+        self.name = name
+        self.alive = True
+        self.death_reason = ""
         self.pos = start_pos
+        # position at the start of the current tick, for interpolated drawing
+        self.prev_pos = pygame.Vector2(start_pos)
         self.base_speed = 5.5  # Starting speed
         # Start moving in a random direction
-        angle = pygame.math.Vector2(1, 0).rotate(random.randint(0, 360))
+        angle = pygame.math.Vector2(1, 0).rotate(self.rng.randint(0, 360))
         self.current_move = pygame.Vector2(angle.x, angle.y).normalize()
         # trail will be filled stretched out behind the head so the snake
         # starts extended in its current movement direction.
@@ -23,8 +56,10 @@ class Dragon:
         # Ensure current_move is set (we initialize it above). If zero, default to right.
         if self.current_move.length() == 0:
             self.current_move = pygame.Vector2(1, 0)
-        # Build trail stretched behind the head
-        self.trail = [ (self.pos - self.current_move * (i * segment_size)).xy for i in range(self.length) ]
+        # Build trail stretched behind the head, unless restoring a saved one
+        if trail is None:
+            trail = Trail.stretched(self.pos, self.current_move, self.length, segment_size)
+        self.trail = trail
         self.score = 0
 
         # Burst feature
@@ -34,7 +69,7 @@ class Dragon:
         self.BURST_DISTANCE = 120
         self.BURST_COOLDOWN_MS = 2000
     def burst(self):
-        now = pygame.time.get_ticks()
+        now = self.clock()
         if now < self.burst_cooldown:
             return False  # Still on cooldown
         if self.score < self.BURST_COST_POINTS or self.length <= self.BURST_COST_LENGTH:
@@ -46,40 +81,38 @@ class Dragon:
         if self.current_move.length() > 0:
             self.pos += self.current_move.normalize() * self.BURST_DISTANCE
         # Insert new head position and trim trail
-        self.trail.insert(0, tuple(self.pos))
-        if len(self.trail) > self.length:
-            self.trail = self.trail[:self.length]
+        self.trail.push_front(self.pos.x, self.pos.y)
+        self.trail.trim(int(self.length))
         self.burst_cooldown = now + self.BURST_COOLDOWN_MS
         return True
 
     @property
     def speed(self):
         """Speed decreases gradually as length increases, starting to be noticeable at high lengths."""
-        return max(0.5, self.base_speed - 0.0006 * self.length)
+        return max(0.5, self.base_speed - 0.0006 * self.length) * TICK_SCALE
 
     def respawn(self, new_pos):
         """Reposition the player and reset basic attributes."""
         self.pos = pygame.Vector2(new_pos)
+        self.prev_pos = pygame.Vector2(new_pos)
         self.length = 10
         segment_size = 20
         if self.current_move.length() == 0:
             self.current_move = pygame.Vector2(1, 0)
-        self.trail = [ (self.pos - self.current_move * (i * segment_size)).xy for i in range(self.length) ]
+        self.trail.reset(self.pos, self.current_move, self.length, segment_size)
         self.score = 0
         # Start moving in a random direction
-        angle = pygame.math.Vector2(1, 0).rotate(random.randint(0, 360))
+        angle = pygame.math.Vector2(1, 0).rotate(self.rng.randint(0, 360))
         self.current_move = pygame.Vector2(angle.x, angle.y).normalize()
 
     def handle_input(self):
-        keys = pygame.key.get_pressed()
-        move = pygame.Vector2(0, 0)
-        if keys[pygame.K_w]: move.y = -1
-        if keys[pygame.K_s]: move.y = 1
-        if keys[pygame.K_a]: move.x = -1
-        if keys[pygame.K_d]: move.x = 1
-        
+        self.apply_input(*read_input())
+
+    def apply_input(self, move, burst):
+        """Steer towards move (zero keeps the heading) and maybe start bursting."""
+        move = pygame.Vector2(move)
         self.is_bursting = False
-        if keys[pygame.K_e]:
+        if burst:
             # Only burst if we have enough score and length to spare
             if self.score > 50 and self.length > 15:
                 self.is_bursting = True
@@ -94,14 +127,14 @@ class Dragon:
             current_speed *= 2.2  # Speed boost
             
             # Every frame (or use a timer), lose points and length
-            self.score -= 0.5
-            self.length -= 0.1
+            self.score -= 0.5 * TICK_SCALE
+            self.length -= 0.1 * TICK_SCALE
 
             self.score = max(0, self.score)
             self.length = max(5, self.length)
             
             # Drop points behind the tail occasionally while bursting
-            if world and random.random() < 0.1:
+            if world and self.rng.random() < 0.1 * TICK_SCALE:
                 world.spawn_point(self.trail[-1], "normal")
         
         if self.current_move.length() > 0:
@@ -120,11 +153,7 @@ class Dragon:
 
         # Spacing reduced to 4 for a tighter, denser trail
         # Added safety check: if trail is empty or we moved 4px, add segment
-        if not self.trail or self.pos.distance_to(pygame.Vector2(self.trail[0])) > 4:
-            self.trail.insert(0, tuple(self.pos))
-        
-        if len(self.trail) > int(self.length):
-            self.trail = self.trail[:int(self.length)]
+        self.trail.advance(self.pos.x, self.pos.y, 4, int(self.length))
 
     def get_head_rect(self):
         # Requirement: Moveable object hit-box
@@ -132,4 +161,4 @@ class Dragon:
     
     def get_body_rects(self):
         # Returns all segments except the head to prevent self-collision
-        return [pygame.Rect(s[0], s[1], 20, 20) for s in self.trail[1:]]
\ No newline at end of file
+        return [pygame.Rect(s[0], s[1], 20, 20) for s in self.trail.iter_from(1)]
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""Vectorised enemy movement.
+
+EnemyPopulation keeps the whole roster's kinematics (position, direction,
+score, length, base speed and burst flag) in NumPy arrays. It runs the
+burst cost, random wander, movement, bounce-off-bounds, growth curve and
+speed formula for every enemy in one step. The Enemy objects stay the
+view that the AI, collisions and renderer work with. Their fields are
+copied into the arrays before the step and written back after it, so the
+rest of the game does not know which path moved them.
+
+NumPy is optional. Simulation only uses this when asked for
+``vectorized=True``. The copy in and out costs more than it saves for the
+default roster, so it only pays off with around a thousand enemies or more.
+"""
+from collections import deque
+from itertools import chain, repeat
+from operator import attrgetter
+
+import pygame
+
+from settings import TICK_SCALE
+from trail import Trail
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+
+class EnemyPopulation:
+    """Struct-of-arrays stepper for all enemies at once."""
+    def __init__(self, seed=None):
+        if np is None:
+            raise ImportError("vectorized enemies need numpy (pip install numpy)")
+        self.rng = np.random.default_rng(seed)
+        self.size = 0
+        self._alloc(64)
+
+    def _alloc(self, capacity):
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2))
+        self.dir = np.zeros((capacity, 2))
+        self.score = np.zeros(capacity)
+        self.length = np.zeros(capacity)
+        self.base_speed = np.zeros(capacity)
+        self.bursting = np.zeros(capacity, dtype=bool)
+
+    def load(self, enemies):
+        """Copy the enemies' current state into the arrays."""
+        n = len(enemies)
+        if n > self.capacity:
+            self._alloc(max(n, self.capacity * 2))
+        self.size = n
+        if not n:
+            return
+        # map/attrgetter/fromiter keep the per-enemy work inside C loops
+        flat = chain.from_iterable(chain.from_iterable(map(_POS_DIR, enemies)))
+        kin = np.fromiter(flat, float, 4 * n).reshape(n, 2, 2)
+        self.pos[:n] = kin[:, 0]
+        self.dir[:n] = kin[:, 1]
+        self.score[:n] = np.fromiter(map(_SCORE, enemies), float, n)
+        self.length[:n] = np.fromiter(map(_LENGTH, enemies), float, n)
+        self.base_speed[:n] = np.fromiter(map(_BASE_SPEED, enemies), float, n)
+        self.bursting[:n] = np.fromiter(map(_BURSTING, enemies), bool, n)
+
+    def store(self, enemies, changed_dir, changed_stats):
+        """Write the arrays back onto the Enemy objects and advance their trails.
+
+        Only positions change for everyone; directions and score/length are
+        written for the indices that actually changed this step.
+        """
+        n = self.size
+        xs = self.pos[:n, 0].tolist()
+        ys = self.pos[:n, 1].tolist()
+        lengths = self.length[:n].astype(int).tolist()
+        # deque(map(...), 0) runs the unbound methods without a Python loop
+        deque(map(pygame.Vector2.update, map(_POS, enemies), xs, ys), 0)
+        deque(map(Trail.advance, map(_TRAIL, enemies), xs, ys, repeat(4), lengths), 0)
+        for i in changed_dir.tolist():
+            enemies[i].dir.update(self.dir[i, 0], self.dir[i, 1])
+        scores = self.score
+        for i in changed_stats.tolist():
+            e = enemies[i]
+            e.score = float(scores[i])
+            e.length = lengths[i]
+
+    def speed(self):
+        """Same formula as Enemy.speed for every loaded enemy."""
+        n = self.size
+        return np.maximum(0.3, self.base_speed[:n] - 0.0006 * self.length[:n]) * TICK_SCALE
+
+    def step(self, enemies, world):
+        """Move every enemy one tick, like calling e.update(world) on each."""
+        self.load(enemies)
+        n = self.size
+        if not n:
+            return
+        rng = self.rng
+        pos, dirs = self.pos[:n], self.dir[:n]
+        score, length = self.score[:n], self.length[:n]
+
+        old_length = length.copy()
+        speed = self.speed()
+        burst = self.bursting[:n]
+        if burst.any():
+            speed[burst] *= 2.0
+            score[burst] = np.maximum(0, score[burst] - 0.5 * TICK_SCALE)
+            length[burst] = np.maximum(5, length[burst] - 0.1 * TICK_SCALE)
+            # bursting dragons shed a point off the tail now and then
+            for i in np.flatnonzero(burst & (rng.random(n) < 0.1 * TICK_SCALE)).tolist():
+                world.spawn_point(enemies[i].trail[-1], "normal")
+
+        # Wander AI: occasionally shift direction by up to 45 degrees
+        wander = rng.random(n) < 0.03 * TICK_SCALE
+        turning = np.flatnonzero(wander)
+        if turning.size:
+            angle = np.radians(rng.integers(-45, 46, turning.size))
+            c, s = np.cos(angle), np.sin(angle)
+            x, y = dirs[turning, 0], dirs[turning, 1]
+            dirs[turning, 0], dirs[turning, 1] = x * c - y * s, x * s + y * c
+
+        pos += dirs * speed[:, None]
+
+        # Keep enemies inside world bounds (bounce logic)
+        size = world.size
+        out = (pos < 0) | (pos > size)
+        dirs[out] *= -1
+
+        # Growth: linear up to score 100, then sqrt taper, capped at 450
+        target = np.where(score < 100, 10 + score * 0.3,
+                          40 + np.sqrt(np.maximum(score - 100, 0)) * 5)
+        length[:] = np.minimum(450, np.floor(target))
+
+        changed_dir = np.flatnonzero(wander | out.any(axis=1))
+        changed_stats = np.flatnonzero(burst | (length != old_length))
+        self.store(enemies, changed_dir, changed_stats)
+
+
+_POS_DIR = attrgetter('pos', 'dir')
+_POS = attrgetter('pos')
+_TRAIL = attrgetter('trail')
+_SCORE = attrgetter('score')
+_LENGTH = attrgetter('length')
+_BASE_SPEED = attrgetter('base_speed')
+_BURSTING = attrgetter('is_bursting')
@@ -0,0 +1,368 @@
+import bisect
+
+import pygame
+from settings import *
+from camera import Camera
+from chunks import ChunkWalls
+from tracing import traced
+
+MINIMAP_SIZE = 150
+MINIMAP_MARGIN = 20
+# room around the minimap for markers drawn on its edge
+_MINIMAP_PAD = 8
+_BORDER_COLOR = (150, 150, 80)
+# a head that moved further than this in one tick was respawned or
+# teleported; it is drawn where it is rather than slid across the map
+_SNAP_DISTANCE = 200
+
+class Leaderboard:
+    """Live session ranking of the living enemies plus the player.
+
+    Kept sorted between frames: sync() only re-slots the dragons whose
+    rounded score changed and the ones that joined or left, instead of
+    rebuilding and sorting the whole roster.  Ties keep roster order with
+    the player last, and the player only takes part once they have points.
+    An enemy respawned in place counts as a newcomer.
+    """
+    def __init__(self):
+        self.player = None
+        self._ranking = []   # sorted (-score, seq, dragon)
+        self._keys = {}      # dragon -> (-score, seq)
+        self._lives = {}     # enemy -> its respawns when it was keyed
+        self._seq = 0
+
+    def _insert(self, dragon, score, seq):
+        key = (-score, seq)
+        self._keys[dragon] = key
+        bisect.insort(self._ranking, (-score, seq, dragon))
+
+    def _remove(self, dragon):
+        key = self._keys.pop(dragon)
+        del self._ranking[bisect.bisect_left(self._ranking, key)]
+
+    def sync(self, player, enemies):
+        """Bring the ranking up to date with the current scores."""
+        keys = self._keys
+        lives = self._lives
+        if player is not self.player:
+            self._ranking.clear()
+            keys.clear()
+            lives.clear()
+            self.player = player
+        on_board = len(keys) - (player in keys)
+        seen = 0
+        for e in enemies:
+            score = round(e.score, 1)
+            key = keys.get(e)
+            if key is not None and lives[e] != e.respawns:
+                # respawned in place: the same object, but a new dragon
+                seen += 1
+                self._remove(e)
+                key = None
+            if key is None:
+                # newcomers lose ties to everyone already on the board, like
+                # being appended to the roster
+                self._seq += 1
+                self._insert(e, score, self._seq)
+                lives[e] = e.respawns
+                continue
+            seen += 1
+            if key[0] != -score:
+                self._remove(e)
+                self._insert(e, score, key[1])
+        if seen < on_board:
+            # somebody died or left since the last sync
+            alive = set(enemies)
+            alive.add(player)
+            for dragon in [d for d in keys if d not in alive]:
+                self._remove(dragon)
+                lives.pop(dragon, None)
+
+        key = keys.get(player)
+        if player.score > 0:
+            score = round(player.score, 1)
+            if key is None or key[0] != -score:
+                if key is not None:
+                    self._remove(player)
+                self._insert(player, score, float('inf'))
+        elif key is not None:
+            self._remove(player)
+
+    def top(self, n):
+        """The first n entries as (name, score, dragon)."""
+        return [("YOU" if dragon is self.player else dragon.name, -neg_score, dragon)
+                for neg_score, _, dragon in self._ranking[:n]]
+
+
+class TextCache:
+    """Rendered text surfaces keyed by (text, color).
+
+    HUD lines mostly repeat from one frame to the next, so each distinct
+    string is rasterised once.  The least recently used entries are dropped
+    past max_entries.
+    """
+    def __init__(self, font, max_entries=256):
+        self.font = font
+        self.max_entries = max_entries
+        self.surfaces = {}
+
+    def render(self, text, color):
+        key = (text, color)
+        surfaces = self.surfaces
+        surf = surfaces.pop(key, None)
+        if surf is None:
+            surf = self.font.render(text, True, color)
+            if len(surfaces) >= self.max_entries:
+                del surfaces[next(iter(surfaces))]
+        surfaces[key] = surf
+        return surf
+
+
+class StaticLayer:
+    """The parts of a World that never move, pre-rendered in square tiles.
+
+    Background, out-of-bounds area, the world border and the obstacles are
+    drawn into a tile the first time it comes into view and reused after
+    that.  Tiles rather than one world-sized surface keep memory bounded
+    (a 6000px world would be ~140 MB as a single surface), and the least
+    recently used tiles are dropped once the cache is full.
+    """
+    def __init__(self, world, target, tile_size=STATIC_TILE, max_tiles=STATIC_TILE_CACHE):
+        self.world = world
+        self.target = target
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = {}   # (tx, ty) -> Surface, least recently used first
+
+    def _render_tile(self, tx, ty):
+        size = self.tile_size
+        x0, y0 = tx * size, ty * size
+        world_size = self.world.size
+        # same pixel format as the screen so blits need no conversion
+        tile = pygame.Surface((size, size), 0, self.target)
+        tile.fill(CLR_OOB)
+        tile.fill(CLR_BG, pygame.Rect(-x0, -y0, world_size, world_size))
+        pygame.draw.rect(tile, _BORDER_COLOR, (-x0, -y0, world_size, world_size), 3)
+        area = pygame.Rect(x0, y0, size, size)
+        for obs in self.world.obstacles_in(area):
+            pygame.draw.rect(tile, CLR_WALL, (obs.x - x0, obs.y - y0, obs.width, obs.height))
+        return tile
+
+    def _tile(self, key):
+        tiles = self.tiles
+        tile = tiles.pop(key, None)
+        if tile is None:
+            tile = self._render_tile(*key)
+            if len(tiles) >= self.max_tiles:
+                del tiles[next(iter(tiles))]
+        tiles[key] = tile
+        return tile
+
+    def draw(self, screen, offset):
+        """Cover the whole screen with the tiles under the camera."""
+        size = self.tile_size
+        ox, oy = int(offset[0]), int(offset[1])
+        width, height = screen.get_size()
+        for ty in range(oy // size, (oy + height - 1) // size + 1):
+            for tx in range(ox // size, (ox + width - 1) // size + 1):
+                screen.blit(self._tile((tx, ty)), (tx * size - ox, ty * size - oy))
+
+
+def _lerp(dragon, alpha):
+    """Where dragon's head is `alpha` of the way through the last tick."""
+    prev, pos = dragon.prev_pos, dragon.pos
+    if alpha >= 1.0 or prev.distance_squared_to(pos) > _SNAP_DISTANCE ** 2:
+        return pos
+    return prev.lerp(pos, alpha)
+
+
+def _minimap_base(world):
+    """Minimap background, border and scaled obstacles for one World."""
+    world_size = world.size
+    m_size = MINIMAP_SIZE
+    pad = _MINIMAP_PAD
+    surface = pygame.Surface((m_size + 2 * pad, m_size + 2 * pad), pygame.SRCALPHA)
+    m_rect = pygame.Rect(pad, pad, m_size, m_size)
+    pygame.draw.rect(surface, (50, 50, 50), m_rect)
+    pygame.draw.rect(surface, (255, 255, 255), m_rect, 1)
+
+    # Draw obstacles on minimap; a chunked world only has the walls around
+    # the dragons at any time, so it shows none rather than a stale few
+    if isinstance(world.walls, ChunkWalls):
+        return surface
+    for obs in world.obstacles:
+        obs_map_x = m_rect.x + (obs.x / world_size) * m_size
+        obs_map_y = m_rect.y + (obs.y / world_size) * m_size
+        obs_map_w = max(1, (obs.width / world_size) * m_size)
+        obs_map_h = max(1, (obs.height / world_size) * m_size)
+        pygame.draw.rect(surface, (100, 100, 100), (obs_map_x, obs_map_y, obs_map_w, obs_map_h))
+    return surface
+
+
+class Renderer:
+    """Draws a Simulation onto a surface.
+
+    Holds the only presentation state (camera and font) so the simulation
+    itself never needs a display.  The target can be the window or any
+    offscreen Surface.
+    """
+    def __init__(self, screen, font):
+        self.screen = screen
+        self.font = font
+        self.camera = Camera()
+        self.leaderboard = Leaderboard()
+        self.text = TextCache(font)
+        # pre-rendered pieces that only change with the World
+        self._static = None
+        self._minimap_world = None
+        self._minimap_base = None
+        self._minimap = None
+        self._minimap_age = 0
+        self.alpha = 1.0
+
+    def draw(self, sim, alpha=1.0):
+        """Draw the game as it is at `alpha` of the way from the previous
+        tick to the latest one (1.0 draws the latest tick as is)."""
+        world, player, enemies = sim.world, sim.player, sim.enemies
+        self.alpha = alpha
+        self.camera.update(_lerp(player, alpha))
+        self.leaderboard.sync(player, enemies)
+        self._draw_world(world)
+        self._draw_points(world)
+        self._draw_trails(player, enemies)
+        self._draw_hud(player, enemies)
+        self._draw_minimap(world, player, enemies)
+
+    @traced("render.world")
+    def _draw_world(self, world):
+        if self._static is None or self._static.world is not world:
+            self._static = StaticLayer(world, self.screen)
+        self._static.draw(self.screen, self.camera.offset)
+
+    @traced("render.points")
+    def _draw_points(self, world):
+        screen, camera = self.screen, self.camera
+        # points are radius-5 circles around pt.pos, leave room for them
+        view = camera.viewport().inflate(12, 12)
+        for pt in world.points.in_rect(view):
+            pygame.draw.circle(screen, pt.color, camera.apply(pt.pos), 5)
+
+    @traced("render.trails")
+    def _draw_trails(self, player, enemies):
+        view = self.camera.viewport()
+        for e in enemies:
+            self._draw_trail(e, e.color, view)
+        self._draw_trail(player, CLR_PLAYER, view)
+
+    def _draw_trail(self, dragon, color, view):
+        """Draw the on-screen segments of one trail as 20x20 squares."""
+        trail = dragon.trail
+        bounds = trail.bounds()
+        if bounds is None:
+            return
+        # the whole body is drawn shifted back along the head's last move;
+        # it follows the head, so this is close enough between two ticks
+        ox, oy = self.camera.offset
+        if self.alpha < 1.0:
+            head = _lerp(dragon, self.alpha)
+            ox += dragon.pos.x - head.x
+            oy += dragon.pos.y - head.y
+            view = view.move(dragon.pos.x - head.x, dragon.pos.y - head.y)
+        # a segment is drawn with its top-left corner at the trail point, so
+        # it shows if the point is inside the view grown 20px up and left
+        # (plus one for the truncation of float coordinates)
+        left, top = view.left - 21, view.top - 21
+        right, bottom = view.right + 1, view.bottom + 1
+        min_x, min_y, max_x, max_y = bounds
+        if max_x <= left or min_x >= right or max_y <= top or min_y >= bottom:
+            return
+        screen = self.screen
+        draw_rect = pygame.draw.rect
+        gap = TRAIL_LOD_GAP if RENDER_LOD else 0
+        last_x = last_y = -1e9
+        for x, y in trail:
+            if not (left < x < right and top < y < bottom):
+                continue
+            if abs(x - last_x) < gap and abs(y - last_y) < gap:
+                continue
+            last_x, last_y = x, y
+            draw_rect(screen, color, (x - ox, y - oy, 20, 20))
+
+    @traced("render.hud")
+    def _draw_hud(self, player, enemies):
+        screen, text = self.screen, self.text
+        # Draw live session leaderboard in top-left
+        lb_x = 20
+        lb_y = 20
+        for idx, (name, score, _) in enumerate(self.leaderboard.top(5), start=1):
+            lb_surf = text.render(f"{idx}. {name} {score}", (200, 200, 200))
+            screen.blit(lb_surf, (lb_x, lb_y))
+            lb_y += 25
+
+        # Player score/length display adjacent to leaderboard
+        player_info = f"YOUR SCORE: {player.score:.1f} | LENGTH: {player.length:.1f}"
+        player_surf = text.render(player_info, (100, 255, 100))
+        screen.blit(player_surf, (lb_x + 350, 20))
+
+    @traced("render.minimap")
+    def _draw_minimap(self, world, player, enemies):
+        if self._minimap_world is not world:
+            self._minimap_base = _minimap_base(world)
+            self._minimap_world = world
+            self._minimap_age = 0
+        if self._minimap_age <= 0:
+            self._minimap = self._minimap_base.copy()
+            self._draw_minimap_markers(self._minimap, world, player, enemies)
+            self._minimap_age = MINIMAP_REFRESH_FRAMES
+        self._minimap_age -= 1
+        self.screen.blit(self._minimap, (WIDTH - MINIMAP_SIZE - MINIMAP_MARGIN - _MINIMAP_PAD,
+                                         MINIMAP_MARGIN - _MINIMAP_PAD))
+
+    def _draw_minimap_markers(self, surface, world, player, enemies):
+        world_size = world.size
+        m_size = MINIMAP_SIZE
+        m_x = m_y = _MINIMAP_PAD
+
+        # Draw session leaderboard on minimap (top 3 rank indicators)
+        rank_colors = [(255, 215, 0), (192, 192, 192), (205, 127, 50)]  # Gold, Silver, Bronze
+        for rank, (_, _, dragon) in enumerate(self.leaderboard.top(3)):
+            pos = dragon.pos
+            rank_map_x = m_x + (pos.x / world_size) * m_size
+            rank_map_y = m_y + (pos.y / world_size) * m_size
+            pygame.draw.circle(surface, rank_colors[rank], (int(rank_map_x), int(rank_map_y)), 5)
+            # Draw rank number
+            rank_txt = self.text.render(str(rank + 1), (0, 0, 0))
+            surface.blit(rank_txt, (int(rank_map_x) - 3, int(rank_map_y) - 6))
+
+        # Draw player position on minimap
+        p_map_x = m_x + (player.pos.x / world_size) * m_size
+        p_map_y = m_y + (player.pos.y / world_size) * m_size
+        pygame.draw.circle(surface, (255, 255, 0), (int(p_map_x), int(p_map_y)), 3)
+
+    def draw_game_over(self, sim):
+        screen, text = self.screen, self.text
+        player, enemies = sim.player, sim.enemies
+        game_over_reason = sim.game_over_reason
+        white = (255, 255, 255)
+        screen.fill(CLR_BG)
+        # display the reason if we have one
+        title = "GAME OVER!"
+        if game_over_reason:
+            title += f" - {game_over_reason}"
+        go_surf = text.render(title, white)
+        screen.blit(go_surf, (WIDTH//2 - go_surf.get_width()//2, HEIGHT//2 - 60))
+
+        # show the player's last score
+        myscore = text.render(f"Your score: {player.score}", white)
+        screen.blit(myscore, (WIDTH//2 - myscore.get_width()//2, HEIGHT//2 - 20))
+
+        hint = text.render("Press R to restart or Q to quit", white)
+        screen.blit(hint, (WIDTH//2 - hint.get_width()//2, HEIGHT//2 + 20))
+
+        # leaderboard (show session leaderboard: living enemies + player if ranked)
+        self.leaderboard.sync(player, enemies)
+        y_off = HEIGHT//2 + 60
+        for idx, (name, score, _) in enumerate(self.leaderboard.top(5), start=1):
+            ls = text.render(f"{idx}. {name} {score}", white)
+            screen.blit(ls, (WIDTH//2 - ls.get_width()//2, y_off))
+            y_off += 30
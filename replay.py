@@ -0,0 +1,348 @@
+"""Record a game's inputs and play them back exactly.
+
+A Simulation is deterministic given its seed and the input of every tick,
+so a replay is just those.  The file is written append-only while the game
+runs, so a crash loses at most the last CHECK_EVERY ticks:
+
+    b"DRPL" u8 version, u32 n, n bytes of JSON header
+        seed, world size, tick rate, roster, AI LOD and the obstacle
+        layout, which playback compares with the World it regenerates
+    then one record after another:
+        0x00-0x7f                one tick of input, see pack_input()
+        0x80 u32 tick, u32 crc   state_digest() after that tick
+        0x81 u32 n, JSON         how the run ended: reason, ticks, score
+
+Playback rebuilds the Simulation, feeds it the inputs and stops with
+ReplayDivergence at the first digest that does not match.  Headless
+playback runs about 7-10x real time with the default roster.
+
+    python replay.py replays/run.replay            # headless, as fast as it goes
+    python replay.py replays/run.replay --watch 2  # draw it at 2x speed
+
+While watching: space pauses, left/right jump a keyframe back/forward,
+up/down double/halve the speed.
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+
+import pygame
+
+from settings import *
+from simulation import Simulation, FixedTimestep, DEFAULT_ROSTER
+
+MAGIC = b"DRPL"
+# 2: enemies decide from the state at the start of the tick
+VERSION = 2
+# a state digest goes into the file, and the file is flushed, this often
+CHECK_EVERY = TICK_RATE
+# watched playback keeps a copy of the simulation this often, for seeking
+KEYFRAME_EVERY = 10 * TICK_RATE
+
+_BURST = 0x10
+_CHECK = 0x80
+_END = 0x81
+_MARKER = re.compile(rb"[\x80\x81]")
+_HEADER = struct.Struct("<4sBI")
+_CHECK_RECORD = struct.Struct("<BII")
+_U32 = struct.Struct("<I")
+_DIGEST = struct.Struct("<3dI")
+
+
+class ReplayDivergence(Exception):
+    """Playback did not reproduce the recorded game."""
+
+
+def pack_input(move, burst):
+    """One byte for a tick of keyboard input.
+
+    Bits 0-1 hold move.x + 1, bits 2-3 move.y + 1 and bit 4 the burst key,
+    which covers everything read_input() can return.
+    """
+    x, y = move
+    if x not in (-1, 0, 1) or y not in (-1, 0, 1):
+        raise ValueError(f"only keyboard directions can be recorded, not {tuple(move)}")
+    return int(x + 1) | int(y + 1) << 2 | (_BURST if burst else 0)
+
+
+def unpack_input(byte):
+    return (byte & 3) - 1, (byte >> 2 & 3) - 1, bool(byte & _BURST)
+
+
+def state_digest(sim):
+    """CRC of the exact head positions and scores of every dragon."""
+    crc = 0
+    for dragon in sim.players + sim.enemies:
+        pos = dragon.pos
+        crc = zlib.crc32(_DIGEST.pack(pos.x, pos.y, dragon.score, len(dragon.trail)), crc)
+    return zlib.crc32(_U32.pack(len(sim.world.points)), crc)
+
+
+def _layout(world):
+    return [[o.x, o.y, o.width, o.height] for o in world.obstacles]
+
+
+class ReplayRecorder:
+    """Appends every tick of one Simulation's input to a replay file."""
+    def __init__(self, path, sim):
+        self.path = path
+        self.sim = sim
+        header = json.dumps({
+            "seed": sim.seed,
+            "world_size": sim.world.size,
+            "tick_rate": TICK_RATE,
+            "roster": DEFAULT_ROSTER,
+            "ai_lod": sim.ai_schedule is not None,
+            "obstacles": _layout(sim.world),
+        }).encode()
+        self._file = open(path, "ab")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(header)) + header)
+
+    def record(self, move, burst):
+        """Log the input of the tick the simulation just ran."""
+        file = self._file
+        if file is None:
+            return
+        file.write(bytes((pack_input(move, burst),)))
+        tick = self.sim.tick_count
+        if tick % CHECK_EVERY == 0:
+            file.write(_CHECK_RECORD.pack(_CHECK, tick, state_digest(self.sim)))
+            file.flush()
+
+    def close(self):
+        """Finish the file, noting how the run ended if it did."""
+        file, self._file = self._file, None
+        if file is None:
+            return
+        sim = self.sim
+        if sim.game_over:
+            end = json.dumps({"reason": sim.game_over_reason, "ticks": sim.tick_count,
+                              "score": sim.player.score}).encode()
+            file.write(bytes((_END,)) + _U32.pack(len(end)) + end)
+        file.close()
+
+
+def start_recording(sim, directory=REPLAY_DIR, keep=REPLAY_KEEP):
+    """Record sim into a new file in directory, keeping the newest `keep`
+    replays there.  Returns None when directory is empty."""
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    old = sorted(name for name in os.listdir(directory) if name.endswith(".replay"))
+    for name in old[:max(0, len(old) - keep + 1)]:
+        os.remove(os.path.join(directory, name))
+    name = time.strftime("%Y%m%d-%H%M%S") + f"-{sim.seed}.replay"
+    return ReplayRecorder(os.path.join(directory, name), sim)
+
+
+class Replay:
+    """A replay file read back: header, inputs, digests and outcome."""
+    def __init__(self, header, inputs, checks, outcome):
+        self.header = header
+        self.inputs = inputs      # bytes, one per tick
+        self.checks = checks      # tick -> state_digest
+        self.outcome = outcome    # None when the recording was cut short
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, size = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        pos = _HEADER.size + size
+        header = json.loads(data[_HEADER.size:pos])
+        inputs = []
+        checks = {}
+        outcome = None
+        while pos < len(data):
+            mark = _MARKER.search(data, pos)
+            if mark is None:
+                inputs.append(data[pos:])
+                break
+            start = mark.start()
+            inputs.append(data[pos:start])
+            if data[start] == _CHECK:
+                if start + _CHECK_RECORD.size > len(data):
+                    break
+                _, tick, digest = _CHECK_RECORD.unpack_from(data, start)
+                checks[tick] = digest
+                pos = start + _CHECK_RECORD.size
+            else:
+                if start + 5 > len(data):
+                    break
+                (size,) = _U32.unpack_from(data, start + 1)
+                outcome = json.loads(data[start + 5:start + 5 + size])
+                pos = start + 5 + size
+        return cls(header, b"".join(inputs), checks, outcome)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def new_simulation(self):
+        header = self.header
+        if header["tick_rate"] != TICK_RATE:
+            raise ReplayDivergence(f"recorded at {header['tick_rate']} ticks/s, "
+                                   f"TICK_RATE is now {TICK_RATE}")
+        sim = Simulation(seed=header["seed"], world_size=header["world_size"],
+                         roster=tuple(tuple(entry) for entry in header["roster"]),
+                         ai_lod=header["ai_lod"])
+        if _layout(sim.world) != header["obstacles"]:
+            raise ReplayDivergence("the world generated from the seed has a different layout")
+        return sim
+
+
+class ReplayPlayer:
+    """Steps a Simulation through a Replay's inputs.
+
+    With keyframe_every set, a deep copy of the simulation is kept every
+    that many ticks so seek() only re-simulates from the nearest one.
+    """
+    def __init__(self, replay, keyframe_every=None):
+        self.replay = replay
+        self.keyframe_every = keyframe_every
+        self.sim = replay.new_simulation()
+        self.keyframes = {}
+        if keyframe_every:
+            self.keyframes[0] = copy.deepcopy(self.sim)
+
+    @property
+    def tick(self):
+        return self.sim.tick_count
+
+    @property
+    def finished(self):
+        return self.sim.game_over or self.tick >= len(self.replay)
+
+    def step(self):
+        sim = self.sim
+        x, y, burst = unpack_input(self.replay.inputs[sim.tick_count])
+        sim.step((x, y), burst)
+        tick = sim.tick_count
+        expected = self.replay.checks.get(tick)
+        if expected is not None and state_digest(sim) != expected:
+            raise ReplayDivergence(f"state differs from the recording at tick {tick}")
+        if self.keyframe_every and tick % self.keyframe_every == 0 and tick not in self.keyframes:
+            self.keyframes[tick] = copy.deepcopy(sim)
+
+    def run(self, until=None):
+        """Step until tick `until` (default: the end of the recording)."""
+        until = len(self.replay) if until is None else min(until, len(self.replay))
+        while self.tick < until and not self.sim.game_over:
+            self.step()
+
+    def seek(self, tick):
+        """Jump to `tick` from the closest keyframe at or before it."""
+        tick = max(0, min(tick, len(self.replay)))
+        start = max((t for t in self.keyframes if t <= tick), default=None)
+        if start is None:
+            raise ValueError("seeking needs keyframes")
+        if not start <= self.tick <= tick:
+            self.sim = copy.deepcopy(self.keyframes[start])
+        self.run(tick)
+
+    def check_outcome(self):
+        """Raise ReplayDivergence unless the run ended as recorded."""
+        outcome = self.replay.outcome
+        if outcome is None:
+            return
+        sim = self.sim
+        if (sim.game_over_reason, sim.tick_count, sim.player.score) != (
+                outcome["reason"], outcome["ticks"], outcome["score"]):
+            raise ReplayDivergence(
+                f"recorded {outcome['reason']!r} at tick {outcome['ticks']} with score "
+                f"{outcome['score']}, played back {sim.game_over_reason!r} at tick "
+                f"{sim.tick_count} with score {sim.player.score}")
+
+
+def watch(player, speed, screen, font):
+    """Draw the playback at `speed` times real time until the window closes."""
+    from render import Renderer
+    renderer = Renderer(screen, font)
+    clock = pygame.time.Clock()
+    timestep = FixedTimestep(TICK_RATE * speed, MAX_TICKS_PER_FRAME * max(1, int(speed)))
+    paused = False
+    last = time.perf_counter()
+    keyframe = player.keyframe_every
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_LEFT:
+                    # back to the keyframe before the current one
+                    player.seek((player.tick - 1) // keyframe * keyframe)
+                elif event.key == pygame.K_RIGHT:
+                    player.seek((player.tick // keyframe + 1) * keyframe)
+                elif event.key in (pygame.K_UP, pygame.K_DOWN):
+                    speed = speed * 2 if event.key == pygame.K_UP else max(0.125, speed / 2)
+                    timestep = FixedTimestep(TICK_RATE * speed, MAX_TICKS_PER_FRAME * max(1, int(speed)))
+        now = time.perf_counter()
+        ticks = timestep.advance(now - last)
+        last = now
+        if not paused:
+            for _ in range(ticks):
+                if player.finished:
+                    break
+                player.step()
+        renderer.draw(player.sim, 1.0 if paused or player.finished else timestep.alpha)
+        status = f"REPLAY  tick {player.tick}/{len(player.replay)}  x{speed:g}"
+        if paused:
+            status += "  PAUSED"
+        if player.sim.game_over:
+            status += f"  {player.sim.game_over_reason}"
+        label = renderer.text.render(status, (255, 255, 255))
+        screen.blit(label, (WIDTH // 2 - label.get_width() // 2, HEIGHT - 40))
+        pygame.display.flip()
+        clock.tick(FPS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back a recorded game.")
+    parser.add_argument("path")
+    parser.add_argument("--watch", type=float, metavar="SPEED",
+                        help="draw the replay at SPEED times real time instead of checking it headless")
+    args = parser.parse_args(argv)
+    replay = Replay.load(args.path)
+
+    if args.watch:
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption(f"Dragons replay: {os.path.basename(args.path)}")
+        font = pygame.font.SysFont("Arial", 24, bold=True)
+        try:
+            watch(ReplayPlayer(replay, KEYFRAME_EVERY), args.watch, screen, font)
+        finally:
+            pygame.quit()
+        return 0
+
+    player = ReplayPlayer(replay)
+    start = time.perf_counter()
+    try:
+        player.run()
+        player.check_outcome()
+    except ReplayDivergence as exc:
+        print(f"DIVERGED: {exc}")
+        return 1
+    elapsed = time.perf_counter() - start
+    sim = player.sim
+    print(f"{player.tick} ticks in {elapsed:.2f}s "
+          f"({player.tick / (TICK_RATE * elapsed):.1f}x real time), "
+          f"{len(replay.checks)} state checks matched")
+    if sim.game_over:
+        print(f"ended at tick {sim.tick_count}: {sim.game_over_reason} (score {sim.player.score})")
+    else:
+        print("recording ends with the player alive")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
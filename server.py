@@ -0,0 +1,408 @@
+"""Authoritative multiplayer server.
+
+One Simulation with no local player runs the arena at TICK_RATE on an
+asyncio loop.  Every TCP connection gets a Dragon of its own.  Clients
+send newline-delimited JSON:
+
+    {"name": "..."}                      once, to join
+    {"move": [x, y], "burst": false}     whenever input changes
+
+The server answers with frames: a u32 length, then a type byte.
+
+    b"W" + JSON                          welcome: world size, obstacles, rates
+    b"S" + u32 you + u8 n + reason[n]    state, SNAPSHOT_RATE times a second,
+        + snapshot                       `you` is 0 while the player is dead
+
+The snapshot is snapshot.encode() of what is around the client's dragon:
+the dragons whose trail reaches into the area of interest and the points
+near it.  Apart from the first, each is a delta against the previous one
+written to that client.  The tick loop never waits on a socket.  Each
+client has an outbox that holds just the newest snapshot and a writer
+task that encodes and drains it.  A slow client therefore skips
+snapshots instead of building a queue, and it never holds up the arena.
+
+    python server.py                   # serve on localhost:8765
+    python server.py --bots 50         # load test with 50 local bot clients
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+
+import pygame
+
+from settings import *
+from simulation import Simulation, FixedTimestep
+from snapshot import TIER_NAMES, IdMap, Snapshot, capture_dragon, capture_point, encode
+from tracing import tracer
+
+HOST = "127.0.0.1"
+PORT = 8765
+# state messages per second; the client interpolates in between
+SNAPSHOT_RATE = 20
+# how far past the client's screen edges dragons and points are sent
+AOI_MARGIN = 300
+# points are bucketed into squares this big for the AOI filter
+AOI_CELL = 512
+# a fallen player comes back after this long, shielded for a moment
+RESPAWN_MS = 2000
+SPAWN_SHIELD_MS = 2000
+MAX_NAME = 16
+PLAYER_COLORS = ((50, 200, 50), (60, 160, 230), (230, 200, 40), (230, 120, 40),
+                 (170, 90, 230), (40, 210, 190))
+_FRAME = struct.Struct("<IB")
+_STATE = struct.Struct("<IB")
+
+
+def frame(kind, payload):
+    """One server -> client frame: u32 length, type byte, payload."""
+    return _FRAME.pack(len(payload) + 1, ord(kind)) + payload
+
+
+class ClientSession:
+    """One connected player: their dragon, latest input and outbox."""
+    def __init__(self, server, writer, name):
+        self.server = server
+        self.writer = writer
+        self.name = name
+        self.player = None
+        self.color = PLAYER_COLORS[len(server.sessions) % len(PLAYER_COLORS)]
+        self.move = (0, 0)
+        self.burst = False
+        self.dead_reason = ""
+        self.respawn_at = None
+        # newest unsent (you, dead reason, Snapshot); a newer one replaces it
+        self._outbox = None
+        self._ready = asyncio.Event()
+        # the last snapshot written, which the next one is a delta against
+        self._base = None
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        # set once a write fails; the reader then tears the session down
+        self.closed = False
+
+    def push(self, you, dead_reason, snap):
+        """Queue a state to send, replacing anything not yet written."""
+        if self.closed:
+            return
+        if self._outbox is not None:
+            self.skipped += 1
+        self._outbox = (you, dead_reason, snap)
+        self._ready.set()
+
+    async def write_loop(self):
+        writer = self.writer
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                (you, dead_reason, snap), self._outbox = self._outbox, None
+                reason = dead_reason.encode("utf-8")[:255]
+                data = frame("S", _STATE.pack(you, len(reason)) + reason + encode(snap, self._base))
+                self._base = snap
+                writer.write(data)
+                self.sent += 1
+                self.bytes_sent += len(data)
+                # waits only while the socket's buffer is over its high-water mark
+                await writer.drain()
+        except ConnectionError:
+            # reset or broken pipe: closing the transport ends the reader in
+            # _serve_client, whose finally block removes the player
+            self.closed = True
+            self._outbox = None
+            writer.close()
+
+    def apply(self, message):
+        move = message.get("move")
+        if isinstance(move, list) and len(move) == 2:
+            try:
+                self.move = (float(move[0]), float(move[1]))
+            except (TypeError, ValueError):
+                pass
+        self.burst = bool(message.get("burst", False))
+
+
+class GameServer:
+    """Runs a Simulation for many remote players."""
+    def __init__(self, sim=None, host=HOST, port=PORT, tick_rate=TICK_RATE,
+                 snapshot_rate=SNAPSHOT_RATE):
+        self.sim = sim if sim is not None else Simulation(local_player=False)
+        self.host = host
+        self.port = port
+        self.tick_rate = tick_rate
+        self.snapshot_every = max(1, round(tick_rate / snapshot_rate))
+        self.sessions = []
+        self._by_player = {}
+        self._dragon_id = IdMap()   # dragon -> id sent to clients
+        self._server = None
+        self._handlers = set()
+        self.tick_times = []
+        self._welcome = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self.sessions):
+            session.writer.close()
+        # let the connection handlers see their sockets close and clean up
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        self.sim.close()
+
+    async def run(self, duration=None):
+        """Tick the arena at tick_rate until cancelled (or for duration s)."""
+        loop = asyncio.get_running_loop()
+        timestep = FixedTimestep(self.tick_rate)
+        start = last = loop.time()
+        while duration is None or last - start < duration:
+            now = loop.time()
+            ticks = timestep.advance(now - last)
+            last = now
+            for _ in range(ticks):
+                t0 = time.perf_counter()
+                self.tick()
+                self.tick_times.append(time.perf_counter() - t0)
+            # sleep until the next tick is due; clients are served meanwhile
+            await asyncio.sleep(max(0.0, timestep.dt - timestep.accumulator))
+
+    def tick(self):
+        sim = self.sim
+        for session in self.sessions:
+            if session.player is not None:
+                session.player.apply_input(session.move, session.burst)
+        with tracer.span("server.step"):
+            sim.step()
+        self._handle_deaths()
+        if sim.tick_count % self.snapshot_every == 0:
+            with tracer.span("server.snapshots"):
+                self._send_snapshots()
+
+    def _spawn(self, session):
+        sim = self.sim
+        if session.player is None:
+            session.player = sim.add_player(session.name)
+            self._by_player[session.player] = session
+        else:
+            sim.respawn_player(session.player)
+        session.player.invulnerable_until = sim.clock() + SPAWN_SHIELD_MS
+        session.dead_reason = ""
+        session.respawn_at = None
+
+    def _handle_deaths(self):
+        sim = self.sim
+        now = sim.clock()
+        for player in sim.fallen:
+            session = self._by_player.get(player)
+            if session is not None:
+                session.dead_reason = player.death_reason
+                session.respawn_at = now + RESPAWN_MS
+        sim.fallen.clear()
+        for session in self.sessions:
+            if session.respawn_at is not None and now >= session.respawn_at:
+                self._spawn(session)
+
+    def _send_snapshots(self):
+        sim = self.sim
+        # each dragon is captured once per snapshot, however many clients see it
+        dragon_id = self._dragon_id
+        dragons = {}
+        bounds = []
+        for session in self.sessions:
+            p = session.player
+            if p is not None and p.alive:
+                i = dragon_id(p)
+                dragons[i] = capture_dragon(i, p, session.color)
+                bounds.append((i, p.trail.bounds()))
+        for e in sim.enemies:
+            i = dragon_id(e)
+            dragons[i] = capture_dragon(i, e, e.color)
+            bounds.append((i, e.trail.bounds()))
+
+        points, cells = self._point_cells()
+        world = Snapshot(sim.tick_count, dragons, points)
+
+        half_w, half_h = WIDTH // 2 + AOI_MARGIN, HEIGHT // 2 + AOI_MARGIN
+        for session in self.sessions:
+            p = session.player
+            if p is None:
+                continue
+            cx, cy = p.pos
+            view = pygame.Rect(cx - half_w, cy - half_h, 2 * half_w, 2 * half_h)
+            left, top, right, bottom = view.left - 20, view.top - 20, view.right, view.bottom
+            seen = [i for i, b in bounds
+                    if b is not None and b[2] > left and b[0] < right and b[3] > top and b[1] < bottom]
+            near = [i for key in _cells_in(view) for i in cells.get(key, ())]
+            you = dragon_id(p) if session.respawn_at is None else 0
+            session.push(you, session.dead_reason, world.subset(seen, near))
+
+    def _point_cells(self):
+        """Every point captured once, with their ids grouped into AOI_CELL squares.
+
+        Clients get the whole squares their view overlaps.  That is a few
+        more points than the view holds, for one pass over the points per
+        snapshot instead of a grid query per client.
+        """
+        points = {}
+        cells = {}
+        for pt, seq in self.sim.world.points.items():
+            entry = points[seq] = capture_point(pt)
+            key = (entry[0] // AOI_CELL, entry[1] // AOI_CELL)
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [seq]
+            else:
+                bucket.append(seq)
+        return points, cells
+
+    def welcome(self):
+        if self._welcome is None:
+            world = self.sim.world
+            chunked = self.sim.chunked
+            self._welcome = frame("W", json.dumps({
+                "size": world.size,
+                # a chunked world's obstacles are regenerated by the client
+                "obstacles": [] if chunked else [[o.x, o.y, o.width, o.height] for o in world.obstacles],
+                "chunks": [world.seed, world.size, world.chunk_size] if chunked else None,
+                "tiers": TIER_NAMES,
+                "tick_rate": self.tick_rate,
+                "snapshot_rate": self.tick_rate / self.snapshot_every,
+            }).encode())
+        return self._welcome
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            await self._serve_client(reader, writer)
+        finally:
+            self._handlers.discard(task)
+
+    async def _serve_client(self, reader, writer):
+        try:
+            line = await reader.readline()
+        except (ConnectionError, ValueError):
+            # gone before saying hello, or a hello longer than the stream limit
+            writer.close()
+            return
+        try:
+            hello = json.loads(line or b"{}")
+        except ValueError:
+            hello = {}
+        if not isinstance(hello, dict):
+            hello = {}
+        name = str(hello.get("name") or "PLAYER")[:MAX_NAME]
+        session = ClientSession(self, writer, name)
+        writer.write(self.welcome())
+        self.sessions.append(session)
+        self._spawn(session)
+        sender = asyncio.create_task(session.write_loop())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    session.apply(json.loads(line))
+                except (ValueError, AttributeError):
+                    continue
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: a line longer than the stream limit
+            pass
+        finally:
+            sender.cancel()
+            self.sessions.remove(session)
+            if session.player is not None:
+                self._by_player.pop(session.player, None)
+                self.sim.remove_player(session.player)
+            writer.close()
+
+
+def _cells_in(rect):
+    for cx in range(rect.left // AOI_CELL, (rect.right - 1) // AOI_CELL + 1):
+        for cy in range(rect.top // AOI_CELL, (rect.bottom - 1) // AOI_CELL + 1):
+            yield (cx, cy)
+
+
+async def _bot(host, port, index, seed, stop):
+    """A stand-in player: wanders about, reads every snapshot and drops it."""
+    rng = random.Random(seed + index)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({"name": f"BOT{index}"}).encode() + b"\n")
+
+    async def read():
+        while await reader.read(65536):
+            pass
+
+    reading = asyncio.create_task(read())
+    try:
+        while not stop.is_set():
+            move = [rng.uniform(-1, 1), rng.uniform(-1, 1)]
+            writer.write(json.dumps({"move": move, "burst": rng.random() < 0.05}).encode() + b"\n")
+            await asyncio.sleep(rng.uniform(0.2, 1.0))
+    finally:
+        reading.cancel()
+        writer.close()
+
+
+async def load_test(bots, seconds, seed, host=HOST):
+    """Run a server with `bots` local clients and report tick cost."""
+    server = GameServer(Simulation(seed=seed, local_player=False), host=host, port=0)
+    await server.start()
+    stop = asyncio.Event()
+    clients = [asyncio.create_task(_bot(host, server.port, i, seed, stop)) for i in range(bots)]
+    try:
+        await server.run(duration=seconds)
+    finally:
+        sessions = list(server.sessions)
+        stop.set()
+        await asyncio.gather(*clients, return_exceptions=True)
+        await server.close()
+
+    times = sorted(server.tick_times)
+    n = len(times)
+    sent = sum(s.sent for s in sessions)
+    print(f"{bots} bots, {n} ticks in {seconds:.0f}s ({n / seconds:.1f}/s, target {server.tick_rate})")
+    if n:
+        print(f"  tick ms: mean {sum(times) / n * 1000:.2f}  p50 {times[n // 2] * 1000:.2f}  "
+              f"p99 {times[min(n - 1, int(n * 0.99))] * 1000:.2f}  max {times[-1] * 1000:.2f}")
+    print(f"  snapshots sent {sent}, skipped for slow clients {sum(s.skipped for s in sessions)}, "
+          f"{sum(s.bytes_sent for s in sessions) / max(1, sent):.0f} B each")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host a multiplayer arena.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--bots", type=int, default=0, help="run a load test with N local bots")
+    parser.add_argument("--seconds", type=float, default=10.0, help="load test length")
+    args = parser.parse_args(argv)
+
+    if args.bots:
+        asyncio.run(load_test(args.bots, args.seconds, args.seed or 1234, args.host))
+        return
+
+    async def serve():
+        server = GameServer(Simulation(seed=args.seed, local_player=False), args.host, args.port)
+        await server.start()
+        print(f"serving on {server.host}:{server.port}")
+        try:
+            await server.run()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
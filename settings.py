@@ -1,7 +1,23 @@
 # settings.py
 WIDTH, HEIGHT = 1200, 800
 WORLD_SIZE = 6000
-FPS = 60
+# Worlds bigger than CHUNKED_WORLD_SIZE are generated lazily in square chunks
+# of WORLD_CHUNK pixels (see chunks.py).  Chunks within CHUNK_RADIUS chunks of
+# a dragon are active; one nobody has come near for CHUNK_SLEEP_SECONDS sleeps.
+CHUNKED_WORLD_SIZE = 12000
+WORLD_CHUNK = 2048
+CHUNK_RADIUS = 1
+CHUNK_SLEEP_SECONDS = 2
+# Render frame cap (0 = as fast as the display allows)
+FPS = 120
+# Simulation ticks per second, independent of the frame rate.  Speeds,
+# drains and odds were tuned per tick at 60; TICK_SCALE carries them over
+# so the game plays the same at any rate.
+TICK_RATE = 60
+TICK_SCALE = 60 / TICK_RATE
+# Most ticks run to catch up in one frame; time beyond that is dropped
+# so a slow machine plays slower instead of falling further behind.
+MAX_TICKS_PER_FRAME = 5
 
 # Colors
 CLR_BG = (20, 25, 30)
@@ -10,4 +26,35 @@ CLR_PLAYER = (50, 200, 50)
 CLR_ENEMY = (200, 50, 50)
 CLR_WALL = (100, 100, 100)
 # Enemy body segment spacing (pixels) — lower value makes denser trails and more immediate collisions
-ENEMY_SEGMENT_SIZE = 2
\ No newline at end of file
+ENEMY_SEGMENT_SIZE = 2
+# Trail level of detail: skip drawing a segment that sits within this many
+# pixels (on both axes) of the last one drawn.  The 20px squares still overlap.
+RENDER_LOD = True
+TRAIL_LOD_GAP = 8
+# Static background layer: world tiles rendered once and kept in an LRU cache
+STATIC_TILE = 512
+STATIC_TILE_CACHE = 48
+# Redraw the minimap's dragon markers every N frames (1 = every frame)
+MINIMAP_REFRESH_FRAMES = 4
+# Enemy AI level of detail: enemies within the first radius of the player
+# think every tick, further out every Nth tick per (radius, period) step,
+# and beyond the last radius every AI_LOD_FAR_PERIOD ticks.  Far enemies
+# share at most AI_LOD_BUDGET decisions per tick.  These count ticks, not
+# time: they cap the AI's work per tick, and steering turns by the tick.
+AI_LOD = True
+AI_LOD_TIERS = ((1100, 1), (2500, 4))
+AI_LOD_FAR_PERIOD = 16
+AI_LOD_BUDGET = 64
+# Enemy AI on worker processes (ai_workers) only starts for a roster this big.
+# Copying the tick to the workers and back is a fixed cost: on one core it
+# added 2.4 ms a tick to 4.4 ms of AI at 200 enemies, 6.6 to 19 at 500 and
+# 31 to 80 at 1000.  So two workers on free cores only win from about 500.
+AI_WORKERS_MIN_ENEMIES = 500
+
+# Every run's inputs are recorded here for replay.py; only the newest
+# REPLAY_KEEP are kept.  An empty REPLAY_DIR turns recording off.
+REPLAY_DIR = "replays"
+REPLAY_KEEP = 20
+
+# F5 saves the running game here and F8 resumes it (see checkpoint.py)
+CHECKPOINT_FILE = "quicksave.ckpt"
@@ -0,0 +1,488 @@
+import random
+import pygame
+
+from settings import *
+from player import Dragon, nearest_dragon
+from enemy import Enemy, DETECTION_RANGE
+from world import World
+from chunks import ChunkedWorld
+from spatial import SegmentGrid, HeadGrid
+from aischedule import AIScheduler
+from tracing import tracer, traced
+
+# Starting roster of enemy tiers and how many of each to spawn
+DEFAULT_ROSTER = (
+    ("mythic", 1),
+    ("legendary", 2),
+    ("ultra", 3),
+    ("high", 5),
+    ("medium", 8),
+    ("starter", 15),
+)
+
+
+class SimClock:
+    """Millisecond clock that only moves when the simulation ticks.
+
+    Stands in for pygame.time.get_ticks() so a run does not depend on how
+    fast frames are drawn.  Calling the clock returns the current time.
+    """
+    def __init__(self, tick_ms=1000 / TICK_RATE, start=0):
+        self.tick_ms = tick_ms
+        self.now = start
+
+    def __call__(self):
+        return int(self.now)
+
+    def advance(self, ticks=1):
+        self.now += self.tick_ms * ticks
+
+
+class FixedTimestep:
+    """Turns wall-clock time into a whole number of simulation ticks.
+
+    Real time is added to an accumulator, and advance() says how many ticks
+    of tick_rate fit into it.  Whatever is left over, as a fraction of a
+    tick, is alpha: how far the display is between the last two ticks.  A
+    frame runs at most max_ticks; anything beyond that is dropped and
+    counted, so a hitch costs a little game time rather than a spiral of
+    ever longer catch-up frames.
+    """
+    def __init__(self, tick_rate=TICK_RATE, max_ticks=MAX_TICKS_PER_FRAME):
+        self.dt = 1.0 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.dropped = 0
+
+    def advance(self, elapsed):
+        """Add elapsed seconds and return how many ticks to run now."""
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            self.dropped += ticks - self.max_ticks
+            ticks = self.max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * self.dt
+        return ticks
+
+    @property
+    def alpha(self):
+        return min(1.0, self.accumulator / self.dt)
+
+
+class Simulation:
+    """One run of the game, advanced a tick at a time from explicit inputs.
+
+    Everything random goes through a seeded random.Random and every timestamp
+    comes from the injected clock, so two simulations built with the same seed
+    and fed the same inputs play out identically.  Nothing here touches the
+    display, which lets it run headless for tests, benchmarks and bots.
+    """
+    def __init__(self, seed=None, clock=None, world_size=WORLD_SIZE,
+                 roster=DEFAULT_ROSTER, record_score=None, vectorized=False,
+                 ai_workers=0, ai_lod=AI_LOD, local_player=True, generate=True):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.clock = clock if clock is not None else SimClock()
+        # called as record_score(name, score) whenever a dragon dies
+        self.record_score = record_score if record_score is not None else _ignore_score
+        self.tick_count = 0
+
+        # a big map is generated around the dragons as they roam it;
+        # generate=False starts from an empty one, for a checkpoint to fill
+        world_type = ChunkedWorld if world_size > CHUNKED_WORLD_SIZE else World
+        self.world = world_type(rng=self.rng, clock=self.clock, size=world_size, generate=generate)
+        self.chunked = world_type is ChunkedWorld
+        self.enemies = []
+        for tier, count in roster:
+            for _ in range(count):
+                self.enemies.append(Enemy(tier, self.world))
+
+        # every human in the arena; self.player is the one steered through
+        # step() and whose death ends the game, None on a server
+        self.players = []
+        self.player = self.add_player() if local_player else None
+        # remote players who died since the caller last looked
+        self.fallen = []
+        self.segments = SegmentGrid()
+        self.heads = HeadGrid()
+        # enemies that died this tick, respawned in one batch at its end
+        self._deaths = []
+        self._rank = {}
+        # optional NumPy stepper that moves the whole roster at once
+        self.population = None
+        if vectorized:
+            from population import EnemyPopulation
+            self.population = EnemyPopulation(self.rng.randrange(2 ** 32))
+        # decides which enemies think each tick; None lets all of them
+        self.ai_schedule = AIScheduler() if ai_lod else None
+        self.ai_pool = None
+        # below AI_WORKERS_MIN_ENEMIES the workers cost more than they save
+        if ai_workers > 0 and len(self.enemies) >= AI_WORKERS_MIN_ENEMIES:
+            from aipool import AIPool
+            self.ai_pool = AIPool(self.world, ai_workers)
+
+        self.game_over = False
+        self.game_over_reason = ""
+
+    def step(self, move=(0, 0), burst=False):
+        """Advance the game by one tick.
+
+        move is the player's steering direction (zero keeps the current
+        heading) and burst whether the burst key is held.
+        """
+        if self.game_over:
+            return
+        # where everyone was, so a frame between two ticks can interpolate
+        for p in self.players:
+            p.prev_pos.update(p.pos)
+        for e in self.enemies:
+            e.prev_pos.update(e.pos)
+        if self.player is not None:
+            self.player.apply_input(move, burst)
+        with tracer.span("sim.points"):
+            self._update_points()
+        with tracer.span("sim.dragons"):
+            self._update_dragons()
+        with tracer.span("sim.collide"):
+            self._collide()
+        with tracer.span("sim.rivals"):
+            self._spawn_rivals()
+        self.tick_count += 1
+        if hasattr(self.clock, "advance"):
+            self.clock.advance()
+
+    def add_player(self, name="YOU"):
+        """Spawn a new player dragon somewhere safe and return it.
+
+        Anyone other than the local player steers with apply_input() before
+        each step().
+        """
+        spawn = self.world.get_safe_spawn(self.enemies + self.players)
+        player = Dragon(spawn, self.world, name)
+        self.players.append(player)
+        return player
+
+    def remove_player(self, player):
+        """Take a player out of the arena, e.g. when they disconnect."""
+        if player in self.players:
+            self.players.remove(player)
+            self.segments.remove(player)
+
+    def respawn_player(self, player):
+        """Bring a fallen remote player back at a safe spot."""
+        spawn = self.world.get_safe_spawn(self.enemies + self.players)
+        player.respawn(spawn)
+        player.alive = True
+        self.players.append(player)
+
+    def _update_points(self):
+        world = self.world
+        if self.chunked:
+            world.update_chunks([d.pos for d in self.players] + [e.pos for e in self.enemies])
+        world.update_points()
+
+        # Maintain a minimum population if it gets too empty, at 60 points a
+        # second whatever the tick rate
+        if len(world.points) < 40:
+            tick = self.tick_count
+            for _ in range(int((tick + 1) * TICK_SCALE) - int(tick * TICK_SCALE)):
+                spawn_pos = (self.rng.randint(50, world.size-50), self.rng.randint(50, world.size-50))
+                world.spawn_point(spawn_pos, "normal")
+
+    def _update_dragons(self):
+        self._move_players()
+        self.heads.rebuild(self.enemies)
+        # every enemy decides from the same picture of the tick before any
+        # of them moves, so the AI comes out the same whether it runs here,
+        # on worker processes (ai_workers) or next to the vectorised stepper
+        self._think_all(self._plan_ai())
+        if self.population is not None:
+            # the whole roster moves in one vectorised step
+            self._move_all()
+        else:
+            for e in self.enemies:
+                self._move(e)
+
+    def _move_players(self):
+        for p in self.players:
+            p.update(self.world)
+
+    def _target(self, e):
+        """The player e reacts to: the nearest one, or None."""
+        players = self.players
+        if len(players) == 1:
+            return players[0]
+        return nearest_dragon(players, e.pos)[0]
+
+    def _plan_ai(self):
+        """Indices of the enemies that think this tick, or None for all."""
+        if self.ai_schedule is None:
+            return None
+        return self.ai_schedule.plan(self.tick_count, self.players, self.enemies, self.world.walls)
+
+    def _think_all(self, thinkers=None):
+        if self.ai_pool is not None:
+            self.ai_pool.think([self._target(e) for e in self.enemies], self.enemies, thinkers)
+            return
+        enemies = self.enemies
+        for i in (range(len(enemies)) if thinkers is None else thinkers):
+            self._think(enemies[i])
+
+    def _think(self, e):
+        world = self.world
+        neighbours = self.heads.near(e, DETECTION_RANGE)
+        e.update_ai(self._target(e), neighbours, world.walls, world.points)
+
+    def _move(self, e):
+        e.update(self.world)
+        self.heads.move(e)
+
+    def _move_all(self):
+        self.population.step(self.enemies, self.world)
+
+    def close(self):
+        """Stop the AI worker processes, if any."""
+        if self.ai_pool is not None:
+            self.ai_pool.close()
+            self.ai_pool = None
+
+    def _random_point_tier(self):
+        tier_choice = self.rng.random()
+        if tier_choice < 0.05:
+            return "mythic"
+        elif tier_choice < 0.15:
+            return "legendary"
+        elif tier_choice < 0.35:
+            return "rare"
+        return "normal"
+
+    def _respawn_point(self):
+        """Spawn a random tier point somewhere to replace one that was eaten."""
+        world, rng = self.world, self.rng
+        new_tier = self._random_point_tier()
+        world.spawn_point((rng.randint(50, world.size-50), rng.randint(50, world.size-50)), new_tier)
+
+    def _drop_trail(self, e):
+        """Scatter a dead dragon's trail as points, every other segment."""
+        world = self.world
+        for i, pos in enumerate(e.trail):
+            if i % 2 == 0:
+                world.spawn_point(pos, self._random_point_tier())
+
+    def _kill(self, e):
+        """Queue e's death for _resolve_deaths.
+
+        The dragon stops taking part straight away: its body leaves the
+        collision grid and it is skipped for the rest of the tick.
+        """
+        if e.alive:
+            e.alive = False
+            self.segments.remove(e)
+            self._deaths.append(e)
+
+    @traced("collide.resolve_deaths")
+    def _resolve_deaths(self):
+        """Handle every death of this tick in one batch.
+
+        Scores are recorded and trails dropped as points in the order the
+        deaths happened; the roster is then compacted once and the dead
+        Enemy objects are reinitialised in place and appended again, the way
+        a fresh spawn used to be.
+        """
+        deaths = self._deaths
+        if not deaths:
+            return
+        world, enemies = self.world, self.enemies
+        enemies[:] = [e for e in enemies if e.alive]
+        for e in deaths:
+            self.record_score(e.name, e.score)
+            self._drop_trail(e)
+        # respawn at safe locations away from players, other enemies and
+        # each other
+        spots = world.get_safe_spawns(len(deaths), enemies + self.players)
+        for e, spawn_pos in zip(deaths, spots):
+            e.reset(e.tier, world)
+            e.pos = spawn_pos
+            e.prev_pos.update(spawn_pos)
+            e.trail.reset(e.pos, e.dir, e.length, ENEMY_SEGMENT_SIZE)
+            enemies.append(e)
+        deaths.clear()
+
+    def _kill_player(self, player, reason):
+        """A player died: record the score and take them out of the arena.
+
+        The local player's death ends the game at the end of the tick.  A
+        remote player's trail is dropped as points and they wait in
+        self.fallen for the host to respawn them.
+        """
+        if not player.alive:
+            return
+        player.alive = False
+        player.death_reason = reason
+        self.record_score(player.name, player.score)
+        self.segments.remove(player)
+
+    def _collide(self):
+        world, players, enemies = self.world, self.players, self.enemies
+        segments, local = self.segments, self.player
+
+        # Only enforce death checks if invulnerability has expired
+        now = self.clock()
+        vulnerable = [p for p in players if now >= getattr(p, 'invulnerable_until', 0)]
+        for p in vulnerable:
+            if world.check_bounds(p.pos):
+                self._kill_player(p, "Out of Bounds!")
+            elif world.walls.head_hits(p.pos.x, p.pos.y):
+                self._kill_player(p, "Crashed into a wall!")
+
+        # point collection
+        for p in players:
+            collection_radius = 25 if p.is_bursting else 15
+            for pt in world.points.in_radius(p.pos, collection_radius):
+                p.length += 3
+                p.score += pt.value
+                world.remove_point(pt)
+                self._respawn_point()
+
+        # Player self-collision disabled: players will not die from hitting their own body.
+
+        # broadphase: the grid follows every body as it moves, then each
+        # head only tests the segments in its own and neighbouring cells
+        segments.update([p for p in players if p.alive] + enemies)
+        bitten_by = {p: segments.owners_hit(p.get_head_rect()) for p in vulnerable}
+        # deaths are queued, so the roster keeps its order all through the loop
+        self._rank = {e: i for i, e in enumerate(enemies)}
+
+        # a player's head in another player's body
+        if len(players) > 1:
+            for p in vulnerable:
+                for other in bitten_by[p]:
+                    if other is not p and other not in self._rank and other.alive:
+                        self._kill_player(p, "Bit by another Dragon!")
+                        break
+
+        # interactions with enemies
+        for e in enemies:
+            if not e.alive:
+                continue
+            e_head = e.get_head_rect()
+
+            # Check if enemy died by going out of bounds or hitting obstacles
+            if e.check_bounds_and_obstacles(world.walls, world.size):
+                self._kill(e)
+                continue
+
+            # Enemy self-collision disabled: enemies will not die from hitting their own body.
+
+            # Immediate collision: enemy body segment hit a player's head
+            for p in vulnerable:
+                if e in bitten_by[p]:
+                    self._kill_player(p, "Bit by another Dragon!")
+            # the game is over once the local player is dead
+            if local is not None and not local.alive:
+                break
+
+            # Immediate collision: enemy head hits a player's body segments.
+            # One grid query finds every body under the head, players and
+            # enemies alike; the enemies are resolved further down.
+            under_head = segments.owners_hit(e_head)
+            eaten_by = None
+            for p in vulnerable:
+                if p.alive and p in under_head:
+                    eaten_by = p
+                    break
+            if eaten_by is not None:
+                self._kill(e)
+                eaten_by.score += 50
+                continue
+
+            # enemies eat points
+            for pt in world.points.in_rect(e_head):
+                e.grow()
+                e.score += pt.value - 10  # grow() adds 10, so adjust for actual point value
+                world.remove_point(pt)
+                self._respawn_point()
+
+            # Enemy-to-enemy collisions, when another body is under the head
+            if len(under_head) > (e in under_head):
+                self._enemy_vs_enemy(e, under_head)
+
+        self._resolve_deaths()
+        self._resolve_player_deaths()
+
+    def _resolve_player_deaths(self):
+        local = self.player
+        if local is not None and not local.alive:
+            self.game_over = True
+            self.game_over_reason = local.death_reason
+            return
+        if all(p.alive for p in self.players):
+            return
+        for p in self.players:
+            if not p.alive:
+                self._drop_trail(p)
+                self.fallen.append(p)
+        self.players[:] = [p for p in self.players if p.alive]
+
+    @traced("collide.enemy_vs_enemy")
+    def _enemy_vs_enemy(self, e, under_head):
+        """Resolve e's head running into other enemies' bodies.
+
+        under_head is every owner with a body segment under e's head.
+        """
+        rank = self._rank
+        # only enemies are ranked; players are handled in _collide
+        hit = [o for o in under_head if o in rank and o is not e]
+        # visit hit dragons in roster order, as the full scan did
+        hit.sort(key=rank.__getitem__)
+        for other_e in hit:
+            if not other_e.alive:
+                continue
+            # If e is significantly larger, other_e dies
+            if e.length > other_e.length:
+                self._kill(other_e)
+                e.score += 25
+            elif other_e.length > e.length:
+                # other_e is larger, e dies
+                self._kill(e)
+                other_e.score += 25
+                return
+            # If equal size, both die (mutual destruction)
+            else:
+                self._kill(e)
+                self._kill(other_e)
+                return
+
+    def _spawn_rivals(self):
+        world, enemies, rng = self.world, self.enemies, self.rng
+        if not self.players:
+            return
+        player = max(self.players, key=_score_of)
+        # Dynamic spawning: if player is untouchably strong, spawn competitive rivals
+        max_enemy_score = max([e.score for e in enemies], default=0)
+        if player.score > max_enemy_score + 500 and player.score > 1500:
+            # Spawn a high-tier dragon with stats matching player's tier
+            new_enemy = Enemy("high", world)
+            # Boost its score to be close to player's
+            new_enemy.score = player.score - rng.randint(50, 150)
+            new_enemy.length = 10 + int(new_enemy.score * 0.3)
+            # place it safely away from player and other enemies
+            spawn_pos = world.get_safe_spawn(enemies + self.players)
+            new_enemy.pos = spawn_pos
+            new_enemy.prev_pos.update(spawn_pos)
+            if new_enemy.dir.length() == 0:
+                new_enemy.dir = pygame.Vector2(1, 0)
+            new_enemy.trail.reset(new_enemy.pos, new_enemy.dir, new_enemy.length, ENEMY_SEGMENT_SIZE)
+            enemies.append(new_enemy)
+
+
+def _ignore_score(name, score):
+    pass
+
+
+def _score_of(dragon):
+    return dragon.score
@@ -0,0 +1,357 @@
+"""Compact binary snapshots of a tick's state, with delta encoding.
+
+capture() turns the live Simulation into a Snapshot: plain ids, ints and
+tuples, quantised so that encoding is exact:
+- Head positions are kept in 1/8 px and trail points in whole pixels.
+- Scores are kept in tenths.
+- Points are stored as (x, y, tier id), keyed by their PointGrid sequence
+  number.
+encode() packs a Snapshot with struct, either in full or as a delta
+against an earlier Snapshot the reader is known to have.  decode()
+reverses it, and decode(encode(s, base), base) == s.
+
+A delta only lists what changed since the base:
+- dragons that left or were added;
+- heads, scores and lengths that moved;
+- trails as the points pushed in front of the old head plus how much of
+  the old trail to keep;
+- points that were eaten or spawned.
+Trail points are stored as signed-byte steps from the previous point,
+with an escape to an absolute pair for jumps such as a burst.
+
+Layout (little endian), version 1:
+
+    header    "DS" u8 version, u8 flags (1 = delta), u32 tick, u32 base tick
+    dragons   u16 removed, removed x u32 id,
+              u16 records, records x (u32 id, u8 mask, fields by mask)
+    points    u32 removed, removed x u32 id,
+              u32 added, added x (u32 id, i32 x, i32 y, u8 tier)
+"""
+import struct
+import weakref
+
+from world import POINT_TIERS
+
+VERSION = 1
+MAGIC = b"DS"
+HEAD_SCALE = 8      # head positions in 1/8 px
+SCORE_SCALE = 10    # scores in tenths
+TIER_NAMES = tuple(POINT_TIERS)
+TIER_IDS = {name: i for i, name in enumerate(TIER_NAMES)}
+# how far ahead of the old head a delta looks for it in the new trail
+MAX_TRAIL_PREFIX = 256
+
+_HEADER = struct.Struct("<2sBBII")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_ID_MASK = struct.Struct("<IB")
+_XY = struct.Struct("<ii")
+_DXY = struct.Struct("<hh")
+_COLOR = struct.Struct("<BBB")
+_SCORE = struct.Struct("<i")
+_POINT = struct.Struct("<IiiB")
+
+_DELTA = 1
+# dragon record fields
+_NEW = 1           # name, colour, head, score, length and trail follow;
+                   # also used for an id whose name or colour changed
+_HEAD = 2          # absolute head
+_HEAD_STEP = 4     # head as an i16 step from the old one
+_SCORE_SET = 8
+_LENGTH_SET = 16
+_TRAIL = 32        # whole trail
+_TRAIL_PREFIX = 64 # new points ahead of the old head, then u16 kept
+_ESCAPE = 0x80     # in a trail run: an absolute i32 pair follows
+
+
+class DragonState:
+    """One dragon in a Snapshot.  Treated as immutable once built."""
+    __slots__ = ("id", "name", "color", "x", "y", "score", "length", "trail")
+
+    def __init__(self, dragon_id, name, color, x, y, score, length, trail):
+        self.id = dragon_id
+        self.name = name
+        self.color = color
+        self.x = x              # head, in 1/HEAD_SCALE px
+        self.y = y
+        self.score = score      # in 1/SCORE_SCALE points
+        self.length = length
+        self.trail = trail      # tuple of (x, y) whole pixels, head first
+
+    def __eq__(self, other):
+        return (isinstance(other, DragonState)
+                and all(getattr(self, f) == getattr(other, f) for f in self.__slots__))
+
+    def __repr__(self):
+        return f"DragonState({self.id}, {self.name!r}, head=({self.x}, {self.y}), {len(self.trail)} segments)"
+
+    @property
+    def pos(self):
+        return (self.x / HEAD_SCALE, self.y / HEAD_SCALE)
+
+
+class Snapshot:
+    """State of one tick: dragons by id and points by id."""
+    __slots__ = ("tick", "dragons", "points")
+
+    def __init__(self, tick, dragons=None, points=None):
+        self.tick = tick
+        self.dragons = dragons if dragons is not None else {}   # id -> DragonState
+        self.points = points if points is not None else {}     # id -> (x, y, tier id)
+
+    def __eq__(self, other):
+        return (isinstance(other, Snapshot) and self.tick == other.tick
+                and self.dragons == other.dragons and self.points == other.points)
+
+    def subset(self, dragon_ids, point_ids):
+        """The same tick limited to some dragons and points."""
+        dragons, points = self.dragons, self.points
+        return Snapshot(self.tick, {i: dragons[i] for i in dragon_ids},
+                        {i: points[i] for i in point_ids})
+
+
+class IdMap:
+    """Stable small ids for live objects, forgotten when they are freed."""
+    def __init__(self):
+        self._ids = weakref.WeakKeyDictionary()
+        self._next = 0
+
+    def __call__(self, obj):
+        obj_id = self._ids.get(obj)
+        if obj_id is None:
+            self._next += 1
+            obj_id = self._ids[obj] = self._next
+        return obj_id
+
+
+def capture_dragon(dragon_id, dragon, color):
+    pos = dragon.pos
+    trail = tuple((round(x), round(y)) for x, y in dragon.trail)
+    return DragonState(dragon_id, dragon.name, tuple(color), round(pos.x * HEAD_SCALE),
+                       round(pos.y * HEAD_SCALE), round(dragon.score * SCORE_SCALE),
+                       int(dragon.length), trail)
+
+
+def capture_point(pt):
+    pos = pt.pos
+    return (round(pos.x), round(pos.y), TIER_IDS[pt.tier])
+
+
+def capture(sim, ids, player_color=(50, 200, 50)):
+    """Snapshot of every player, enemy and point in sim.
+
+    ids is an IdMap, so the same dragon keeps its id from tick to tick.
+    """
+    dragons = {}
+    for p in sim.players:
+        dragon_id = ids(p)
+        dragons[dragon_id] = capture_dragon(dragon_id, p, player_color)
+    for e in sim.enemies:
+        dragon_id = ids(e)
+        dragons[dragon_id] = capture_dragon(dragon_id, e, e.color)
+    points = {seq: capture_point(pt) for pt, seq in sim.world.points.items()}
+    return Snapshot(sim.tick_count, dragons, points)
+
+
+def _pack_run(out, pts):
+    out += _U16.pack(len(pts))
+    if not pts:
+        return
+    px, py = pts[0]
+    out += _XY.pack(px, py)
+    for x, y in pts[1:]:
+        dx, dy = x - px, y - py
+        if -127 <= dx <= 127 and -127 <= dy <= 127:
+            out.append(dx & 0xFF)
+            out.append(dy & 0xFF)
+        else:
+            out.append(_ESCAPE)
+            out += _XY.pack(x, y)
+        px, py = x, y
+
+
+def _unpack_run(buf, off):
+    (n,), off = _U16.unpack_from(buf, off), off + 2
+    if not n:
+        return (), off
+    x, y = _XY.unpack_from(buf, off)
+    off += 8
+    pts = [(x, y)]
+    for _ in range(n - 1):
+        dx = buf[off]
+        if dx == _ESCAPE:
+            x, y = _XY.unpack_from(buf, off + 1)
+            off += 9
+        else:
+            dy = buf[off + 1]
+            x += dx - 256 if dx > 127 else dx
+            y += dy - 256 if dy > 127 else dy
+            off += 2
+        pts.append((x, y))
+    return tuple(pts), off
+
+
+def _trail_prefix(old, new):
+    """k such that new == new[:k] + old[:len(new) - k], or None."""
+    if not old or not new:
+        return None
+    head = old[0]
+    for k in range(min(len(new), MAX_TRAIL_PREFIX + 1)):
+        if new[k] == head:
+            keep = len(new) - k
+            if keep <= len(old) and new[k:] == old[:keep]:
+                return k
+            return None
+    return None
+
+
+def _pack_new(out, d):
+    name = d.name.encode("utf-8")[:255]
+    out += _ID_MASK.pack(d.id, _NEW)
+    out += _U8.pack(len(name))
+    out += name
+    out += _COLOR.pack(*d.color)
+    out += _XY.pack(d.x, d.y)
+    out += _SCORE.pack(d.score)
+    out += _U16.pack(d.length)
+    _pack_run(out, d.trail)
+
+
+def _pack_change(out, d, old):
+    mask = 0
+    fields = bytearray()
+    dx, dy = d.x - old.x, d.y - old.y
+    if dx or dy:
+        if -32768 <= dx <= 32767 and -32768 <= dy <= 32767:
+            mask |= _HEAD_STEP
+            fields += _DXY.pack(dx, dy)
+        else:
+            mask |= _HEAD
+            fields += _XY.pack(d.x, d.y)
+    if d.score != old.score:
+        mask |= _SCORE_SET
+        fields += _SCORE.pack(d.score)
+    if d.length != old.length:
+        mask |= _LENGTH_SET
+        fields += _U16.pack(d.length)
+    if d.trail != old.trail:
+        k = _trail_prefix(old.trail, d.trail)
+        if k is None:
+            mask |= _TRAIL
+            _pack_run(fields, d.trail)
+        else:
+            mask |= _TRAIL_PREFIX
+            _pack_run(fields, d.trail[:k])
+            fields += _U16.pack(len(d.trail) - k)
+    if mask:
+        out += _ID_MASK.pack(d.id, mask)
+        out += fields
+        return True
+    return False
+
+
+def encode(snap, base=None):
+    """Pack snap, as a delta against base when one is given."""
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, _DELTA if base is not None else 0,
+                                 snap.tick, base.tick if base is not None else 0))
+    dragons = snap.dragons
+    old_dragons = base.dragons if base is not None else {}
+    removed = [i for i in old_dragons if i not in dragons]
+    out += _U16.pack(len(removed))
+    for i in removed:
+        out += _U32.pack(i)
+    count_at = len(out)
+    out += _U16.pack(0)
+    count = 0
+    for i, d in dragons.items():
+        old = old_dragons.get(i)
+        if old is None or old.name != d.name or old.color != d.color:
+            # a respawned enemy keeps its object, hence its id, but not its name
+            _pack_new(out, d)
+            count += 1
+        elif old is not d and _pack_change(out, d, old):
+            count += 1
+    _U16.pack_into(out, count_at, count)
+
+    points = snap.points
+    old_points = base.points if base is not None else {}
+    removed = [i for i in old_points if i not in points]
+    out += _U32.pack(len(removed))
+    for i in removed:
+        out += _U32.pack(i)
+    added = [(i, pt) for i, pt in points.items() if i not in old_points]
+    out += _U32.pack(len(added))
+    for i, (x, y, tier) in added:
+        out += _POINT.pack(i, x, y, tier)
+    return bytes(out)
+
+
+def decode(data, base=None):
+    """Unpack a snapshot; a delta needs the base it was encoded against."""
+    magic, version, flags, tick, base_tick = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} snapshot")
+    off = _HEADER.size
+    if flags & _DELTA:
+        if base is None or base.tick != base_tick:
+            raise ValueError(f"delta snapshot needs the snapshot of tick {base_tick}")
+        dragons = dict(base.dragons)
+        points = dict(base.points)
+    else:
+        dragons = {}
+        points = {}
+
+    (removed,), off = _U16.unpack_from(data, off), off + 2
+    for _ in range(removed):
+        del dragons[_U32.unpack_from(data, off)[0]]
+        off += 4
+    (count,), off = _U16.unpack_from(data, off), off + 2
+    for _ in range(count):
+        dragon_id, mask = _ID_MASK.unpack_from(data, off)
+        off += _ID_MASK.size
+        if mask & _NEW:
+            size = data[off]
+            name = data[off + 1:off + 1 + size].decode("utf-8", "replace")
+            off += 1 + size
+            color = _COLOR.unpack_from(data, off)
+            x, y = _XY.unpack_from(data, off + 3)
+            (score,) = _SCORE.unpack_from(data, off + 11)
+            (length,) = _U16.unpack_from(data, off + 15)
+            trail, off = _unpack_run(data, off + 17)
+            dragons[dragon_id] = DragonState(dragon_id, name, color, x, y, score, length, trail)
+            continue
+        old = dragons[dragon_id]
+        x, y, score, length, trail = old.x, old.y, old.score, old.length, old.trail
+        if mask & _HEAD_STEP:
+            dx, dy = _DXY.unpack_from(data, off)
+            x, y = x + dx, y + dy
+            off += 4
+        elif mask & _HEAD:
+            x, y = _XY.unpack_from(data, off)
+            off += 8
+        if mask & _SCORE_SET:
+            (score,) = _SCORE.unpack_from(data, off)
+            off += 4
+        if mask & _LENGTH_SET:
+            (length,) = _U16.unpack_from(data, off)
+            off += 2
+        if mask & _TRAIL:
+            trail, off = _unpack_run(data, off)
+        elif mask & _TRAIL_PREFIX:
+            prefix, off = _unpack_run(data, off)
+            (keep,) = _U16.unpack_from(data, off)
+            off += 2
+            trail = prefix + old.trail[:keep]
+        dragons[dragon_id] = DragonState(dragon_id, old.name, old.color, x, y, score, length, trail)
+
+    (removed,), off = _U32.unpack_from(data, off), off + 4
+    for _ in range(removed):
+        del points[_U32.unpack_from(data, off)[0]]
+        off += 4
+    (added,), off = _U32.unpack_from(data, off), off + 4
+    for _ in range(added):
+        i, x, y, tier = _POINT.unpack_from(data, off)
+        points[i] = (x, y, tier)
+        off += _POINT.size
+    return Snapshot(tick, dragons, points)
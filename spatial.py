@@ -0,0 +1,565 @@
+import math
+from collections import deque
+
+import pygame
+
+# Head and body segments are all 20x20 rects, so any two that overlap must sit
+# in the same or an adjacent cell as long as a cell is at least 20px wide.
+SEGMENT_SIZE = 20
+SEGMENT_CELL = 32
+# Points are sparse compared to trail segments, so use bigger buckets.
+POINT_CELL = 128
+# Below this many points a plain scan beats walking rings of cells.
+POINT_LINEAR_SCAN = 48
+# Matches the AI detection range, so a neighbour query is a 3x3 block.
+HEAD_CELL = 300
+# Obstacles are a few hundred px across; this keeps a handful per cell.
+WALL_CELL = 64
+
+
+class SegmentGrid:
+    """Uniform spatial hash over the body segments of every dragon.
+
+    Each cell maps (owner, serial) to the 20x20 rect of a segment whose
+    corner lands in it, so a head only has to be tested against the few
+    cells around it instead of every trail.  The head segment
+    (trail[0]) is never stored because none of the collision rules test
+    against it.
+
+    update() is called once a tick and only touches what moved: a dragon
+    usually gains one body segment behind its new head and loses one off
+    its tail, found from the trail's serial numbers (see Trail).  A trail
+    that was refilled or replaced is put in again whole.
+    """
+    def __init__(self, cell_size=SEGMENT_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+        # owner -> [trail epoch, serial of the oldest entry, deque of the
+        # (cell key, serial) of every entry, oldest first]
+        self.owners = {}
+
+    def clear(self):
+        self.cells.clear()
+        self.owners.clear()
+
+    def insert(self, owner):
+        """Add every body segment of owner.trail to the grid."""
+        cells = self.cells
+        size = self.cell_size
+        trail = owner.trail
+        serial = trail.pushed - 1
+        entries = []
+        last_key = None
+        bucket = None
+        for x, y in trail.iter_from(1):
+            serial -= 1
+            # pygame.Rect truncates toward zero, so bucket on the same value
+            key = (int(x) // size, int(y) // size)
+            if key != last_key:
+                # neighbouring segments usually share a cell
+                bucket = cells.get(key)
+                if bucket is None:
+                    bucket = cells[key] = {}
+                last_key = key
+            bucket[owner, serial] = pygame.Rect(x, y, SEGMENT_SIZE, SEGMENT_SIZE)
+            entries.append((key, serial))
+        entries.reverse()
+        self.owners[owner] = [trail.epoch, serial, deque(entries)]
+
+    def remove(self, owner):
+        """Drop every segment belonging to owner."""
+        state = self.owners.pop(owner, None)
+        if state is None:
+            return
+        cells = self.cells
+        for key, serial in state[2]:
+            bucket = cells[key]
+            del bucket[owner, serial]
+            if not bucket:
+                del cells[key]
+
+    def rebuild(self, owners):
+        self.clear()
+        for owner in owners:
+            self.insert(owner)
+
+    def update(self, owners):
+        """Make the grid hold the body segments of exactly these owners."""
+        tracked = self.owners
+        cells = self.cells
+        size = self.cell_size
+        for owner in owners:
+            trail = owner.trail
+            state = tracked.get(owner)
+            if state is None or state[0] != trail.epoch:
+                self.remove(owner)
+                self.insert(owner)
+                continue
+            pushed = trail.pushed
+            # body segments are serials pushed - len .. pushed - 2
+            lo = pushed - len(trail)
+            first, entries = state[1], state[2]
+            while entries and first < lo:
+                key, serial = entries.popleft()
+                bucket = cells[key]
+                del bucket[owner, serial]
+                if not bucket:
+                    del cells[key]
+                first += 1
+            serial = first + len(entries) if entries else lo
+            state[1] = first if entries else lo
+            for serial in range(serial, pushed - 1):
+                x, y = trail[pushed - 1 - serial]
+                key = (int(x) // size, int(y) // size)
+                bucket = cells.get(key)
+                if bucket is None:
+                    bucket = cells[key] = {}
+                bucket[owner, serial] = pygame.Rect(x, y, SEGMENT_SIZE, SEGMENT_SIZE)
+                entries.append((key, serial))
+        # every owner is tracked by now, so any extra one is gone
+        if len(tracked) > len(owners):
+            present = set(owners)
+            for owner in [owner for owner in tracked if owner not in present]:
+                self.remove(owner)
+
+    def _buckets(self, rect):
+        # only cells holding a corner within SEGMENT_SIZE - 1 above or left
+        # of rect can overlap it: a 2x2 block for most heads
+        size = self.cell_size
+        cells = self.cells
+        cys = range((rect.y - SEGMENT_SIZE + 1) // size, (rect.bottom - 1) // size + 1)
+        for gx in range((rect.x - SEGMENT_SIZE + 1) // size, (rect.right - 1) // size + 1):
+            for gy in cys:
+                bucket = cells.get((gx, gy))
+                if bucket:
+                    yield bucket
+
+    def owners_hit(self, rect):
+        """Return the set of owners with a body segment overlapping rect."""
+        hit = set()
+        size = self.cell_size
+        cells = self.cells
+        cys = range((rect.y - SEGMENT_SIZE + 1) // size, (rect.bottom - 1) // size + 1)
+        for gx in range((rect.x - SEGMENT_SIZE + 1) // size, (rect.right - 1) // size + 1):
+            for gy in cys:
+                bucket = cells.get((gx, gy))
+                if bucket:
+                    # each bucket is tested in one C call against the stored rects
+                    for (owner, _), _ in rect.collidedictall(bucket, True):
+                        hit.add(owner)
+        return hit
+
+    def hits_owner(self, rect, owner):
+        """True if rect overlaps any body segment of the given owner."""
+        for bucket in self._buckets(rect):
+            for (other, _), _ in rect.collidedictall(bucket, True):
+                if other is owner:
+                    return True
+        return False
+
+
+class HeadGrid:
+    """Per-tick index of dragon heads for "who is within R of me" queries.
+
+    Rebuilt at the start of every tick with the roster order, and told about
+    each dragon that moves so queries always see current positions.  Results
+    come back in roster order, which is the order the AI used to scan the
+    whole enemy list in.
+    """
+    def __init__(self, cell_size=HEAD_CELL):
+        self.cell_size = cell_size
+        self.cells = {}    # (cx, cy) -> {owner: rank}
+        self.keys = {}     # owner -> (cx, cy)
+        self.rank = {}     # owner -> index in the roster
+
+    def _key(self, pos):
+        size = self.cell_size
+        return (int(pos[0] // size), int(pos[1] // size))
+
+    def clear(self):
+        self.cells.clear()
+        self.keys.clear()
+        self.rank.clear()
+
+    def rebuild(self, owners):
+        self.clear()
+        cells, keys, rank = self.cells, self.keys, self.rank
+        for i, owner in enumerate(owners):
+            key = self._key(owner.pos)
+            bucket = cells.get(key)
+            if bucket is None:
+                bucket = cells[key] = {}
+            bucket[owner] = i
+            keys[owner] = key
+            rank[owner] = i
+
+    def move(self, owner):
+        """Re-bucket owner after its position changed."""
+        key = self._key(owner.pos)
+        old = self.keys[owner]
+        if key == old:
+            return
+        bucket = self.cells[old]
+        i = bucket.pop(owner)
+        if not bucket:
+            del self.cells[old]
+        bucket = self.cells.get(key)
+        if bucket is None:
+            bucket = self.cells[key] = {}
+        bucket[owner] = i
+        self.keys[owner] = key
+
+    def near(self, owner, radius):
+        """Other owners whose head is strictly closer than radius, in roster order."""
+        pos = owner.pos
+        size = self.cell_size
+        reach = max(1, math.ceil(radius / size))
+        cx, cy = self._key(pos)
+        cells = self.cells
+        found = []
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                bucket = cells.get((gx, gy))
+                if not bucket:
+                    continue
+                for other, i in bucket.items():
+                    if other is not owner and pos.distance_to(other.pos) < radius:
+                        found.append((i, other))
+        found.sort(key=_rank_of)
+        return [other for _, other in found]
+
+
+def _rank_of(entry):
+    return entry[0]
+
+
+class ObstacleGrid:
+    """Occupancy bitmap of the static obstacles, for O(1) head-vs-wall tests.
+
+    The world is cut into cells of head positions.  Each cell is baked at
+    construction into one byte: free (no head position in it can touch a
+    wall), solid (every head position in it is inside one obstacle's
+    reach) or edge.  Only edge cells fall back to an exact test, against
+    the few obstacles listed for that cell, so the cost of a test does not
+    grow with the number of obstacles.
+    """
+    FREE, SOLID, EDGE = 0, 1, 2
+
+    def __init__(self, obstacles, cell_size=WALL_CELL, origin=(0, 0)):
+        self.cell_size = cell_size
+        self.cells = {}
+        # the bitmap starts at the cell holding origin, so a grid for a far
+        # corner of a big map (see chunks.py) is no bigger than its obstacles
+        self.ox = origin[0] // cell_size * cell_size
+        self.oy = origin[1] // cell_size * cell_size
+        # one spare cell on the low side for heads poking out of the world
+        right = max((obs.right - self.ox for obs in obstacles), default=0)
+        bottom = max((obs.bottom - self.oy for obs in obstacles), default=0)
+        self.cols = right // cell_size + 2
+        self.rows = bottom // cell_size + 2
+        self.bits = bytearray(self.cols * self.rows)
+        for obs in obstacles:
+            # integer head positions overlapping obs: x in [left-19, right-1]
+            lo_x, hi_x = obs.left - self.ox - SEGMENT_SIZE + 1, obs.right - self.ox - 1
+            lo_y, hi_y = obs.top - self.oy - SEGMENT_SIZE + 1, obs.bottom - self.oy - 1
+            for cx in range(lo_x // cell_size, hi_x // cell_size + 1):
+                x0 = cx * cell_size
+                full_x = lo_x <= x0 and x0 + cell_size - 1 <= hi_x
+                for cy in range(lo_y // cell_size, hi_y // cell_size + 1):
+                    y0 = cy * cell_size
+                    i = (cy + 1) * self.cols + cx + 1
+                    if full_x and lo_y <= y0 and y0 + cell_size - 1 <= hi_y:
+                        self.bits[i] = self.SOLID
+                    elif self.bits[i] != self.SOLID:
+                        self.bits[i] = self.EDGE
+                    self.cells.setdefault((cx, cy), []).append(obs)
+
+    def head_hits(self, x, y):
+        """True if a head rect at (x, y) overlaps an obstacle."""
+        size = self.cell_size
+        # pygame.Rect truncates, so bucket on the truncated position
+        cx, cy = (int(x) - self.ox) // size, (int(y) - self.oy) // size
+        if not (-1 <= cx < self.cols - 1 and -1 <= cy < self.rows - 1):
+            return False
+        state = self.bits[(cy + 1) * self.cols + cx + 1]
+        if state == self.FREE:
+            return False
+        if state == self.SOLID:
+            return True
+        return pygame.Rect(x, y, SEGMENT_SIZE, SEGMENT_SIZE).collidelist(self.cells[(cx, cy)]) != -1
+
+
+class ClearanceGrid:
+    """Positions bucketed by radius, for "is anything closer than radius"."""
+    def __init__(self, radius, positions=()):
+        self.radius = radius
+        self.cells = {}
+        for pos in positions:
+            self.add(pos)
+
+    def _key(self, pos):
+        r = self.radius
+        return (int(pos[0] // r), int(pos[1] // r))
+
+    def add(self, pos):
+        self.cells.setdefault(self._key(pos), []).append(pos)
+
+    def clear_of(self, pos):
+        """True if nothing is strictly closer than radius to pos."""
+        radius = self.radius
+        cx, cy = self._key(pos)
+        cells = self.cells
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for other in cells.get((gx, gy), ()):
+                    if pos.distance_to(other) < radius:
+                        return False
+        return True
+
+
+class PointGrid:
+    """Bucketed index of collectible points.
+
+    Behaves like the old ``world.points`` list for iteration, ``len`` and
+    ``remove``, but buckets the points on a grid so the AI can ask for the
+    value-weighted nearest point and pickups can ask for the points around a
+    head without touching the rest of the map.  Iteration and query results
+    follow insertion order, which is what the list used to give us.
+    """
+    def __init__(self, cell_size=POINT_CELL):
+        self.cell_size = cell_size
+        self._order = {}       # point -> insertion sequence number
+        self._seq = 0
+        self._tiers = {}       # tier -> {point: None}
+        self._cells = {}       # (cx, cy) -> {point: seq}, every tier
+        self._keys = {}        # point -> (cx, cy)
+        # when a list, every add/remove is logged here (see start_journal)
+        self.journal = None
+        # bounding box of every cell we have ever filled, caps ring searches
+        self._min_cx = self._min_cy = 0
+        self._max_cx = self._max_cy = -1
+        # cells the points are spread over, when the owner knows better than
+        # the bounding box (points clustered around dragons on a huge map)
+        self.spread = None
+
+    def _key(self, pos):
+        # bucket on the truncated coordinate, like pygame.Rect does
+        size = self.cell_size
+        return (int(pos[0]) // size, int(pos[1]) // size)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __contains__(self, pt):
+        return pt in self._order
+
+    def items(self):
+        """(point, sequence number) pairs in insertion order.
+
+        Sequence numbers are never reused, so they name a point for as long
+        as it stays on the map, recycled Point objects included.
+        """
+        return list(self._order.items())
+
+    def add(self, pt):
+        self._seq += 1
+        seq = self._seq
+        self._order[pt] = seq
+        key = self._key(pt.pos)
+        self._keys[pt] = key
+        self._tiers.setdefault(pt.tier, {})[pt] = None
+        bucket = self._cells.get(key)
+        if bucket is None:
+            bucket = self._cells[key] = {}
+        bucket[pt] = seq
+        if self.journal is not None:
+            self.journal.append((1, seq, pt.pos[0], pt.pos[1], pt.tier))
+        cx, cy = key
+        if self._max_cx < self._min_cx:
+            self._min_cx = self._max_cx = cx
+            self._min_cy = self._max_cy = cy
+        else:
+            self._min_cx = min(self._min_cx, cx)
+            self._max_cx = max(self._max_cx, cx)
+            self._min_cy = min(self._min_cy, cy)
+            self._max_cy = max(self._max_cy, cy)
+
+    def add_many(self, pts):
+        """add() every point in pts, in order, with less overhead per point."""
+        order, keys, tiers, cells = self._order, self._keys, self._tiers, self._cells
+        size = self.cell_size
+        journal = self.journal
+        seq = self._seq
+        touched = set()
+        for pt in pts:
+            seq += 1
+            order[pt] = seq
+            pos = pt.pos
+            key = (int(pos[0]) // size, int(pos[1]) // size)
+            keys[pt] = key
+            tier = pt.tier
+            members = tiers.get(tier)
+            if members is None:
+                members = tiers[tier] = {}
+            members[pt] = None
+            bucket = cells.get(key)
+            if bucket is None:
+                bucket = cells[key] = {}
+            bucket[pt] = seq
+            touched.add(key)
+            if journal is not None:
+                journal.append((1, seq, pos[0], pos[1], tier))
+        self._seq = seq
+        if not touched:
+            return
+        xs = [cx for cx, _ in touched]
+        ys = [cy for _, cy in touched]
+        if self._max_cx >= self._min_cx:
+            xs += (self._min_cx, self._max_cx)
+            ys += (self._min_cy, self._max_cy)
+        self._min_cx, self._max_cx = min(xs), max(xs)
+        self._min_cy, self._max_cy = min(ys), max(ys)
+
+    def remove(self, pt):
+        seq = self._order.pop(pt)
+        if self.journal is not None:
+            self.journal.append((0, seq, 0.0, 0.0, None))
+        key = self._keys.pop(pt)
+        del self._tiers[pt.tier][pt]
+        bucket = self._cells[key]
+        del bucket[pt]
+        if not bucket:
+            del self._cells[key]
+
+    def start_journal(self):
+        """Log changes from now on, starting with an add for every point.
+
+        Entries are (1, seq, x, y, tier) for an add and (0, seq, 0, 0, None)
+        for a removal.  Replaying them in order into another PointGrid gives
+        a copy whose queries return the same answers, ties included.  The
+        owner drains the list; positions are copied because points get
+        recycled.
+        """
+        self.journal = [(1, seq, pt.pos[0], pt.pos[1], pt.tier) for pt, seq in self._order.items()]
+
+    def discard(self, pt):
+        if pt in self._order:
+            self.remove(pt)
+
+    def _buckets(self, cx0, cy0, cx1, cy1):
+        cells = self._cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    yield bucket
+
+    def _ordered(self, found):
+        found.sort()
+        return [pt for _, pt in found]
+
+    def in_radius(self, pos, radius):
+        """Points strictly closer than radius to pos, in insertion order."""
+        size = self.cell_size
+        # int() can round a negative coordinate up by one, hence the slack
+        cx0 = math.floor(pos[0] - radius) // size
+        cy0 = math.floor(pos[1] - radius) // size
+        cx1 = (math.floor(pos[0] + radius) + 1) // size
+        cy1 = (math.floor(pos[1] + radius) + 1) // size
+        found = []
+        for bucket in self._buckets(cx0, cy0, cx1, cy1):
+            for pt, seq in bucket.items():
+                if pos.distance_to(pt.pos) < radius:
+                    found.append((seq, pt))
+        return self._ordered(found)
+
+    def in_rect(self, rect):
+        """Points for which rect.collidepoint(pt.pos) holds, in insertion order."""
+        size = self.cell_size
+        found = []
+        for bucket in self._buckets((rect.x - 1) // size, (rect.y - 1) // size,
+                                    rect.right // size, rect.bottom // size):
+            for pt, seq in bucket.items():
+                if rect.collidepoint(pt.pos):
+                    found.append((seq, pt))
+        return self._ordered(found)
+
+    def nearest(self, pos, weights):
+        """Return (point, distance) minimising distance * weights[tier].
+
+        Tiers missing from weights count at full distance.  The distance
+        returned is the real one, not the weighted one.
+        """
+        return self.nearest_each(pos, (weights,))[0]
+
+    def nearest_each(self, pos, weightings):
+        """nearest() for several weightings at once, in one walk over the points.
+
+        Ties on weighted distance go to the lowest sequence number.
+        """
+        # [point, distance, weighted distance, seq] per weighting
+        found = [[None, math.inf, math.inf, 0] for _ in weightings]
+        # tier -> (entry, weight) per weighting; a point d away weighs at
+        # least d * floor under any of them
+        weighed = {tier: [(best, weighting.get(tier, 1.0)) for best, weighting in zip(found, weightings)]
+                   for tier in self._tiers}
+        floor = min([weight for pairs in weighed.values() for _, weight in pairs], default=1.0)
+        order = self._order
+        # a sparse map would make the ring walk visit mostly empty cells:
+        # it looks at about area / n cells to find one of n points, a scan
+        # at all n of them
+        area = self.spread
+        if area is None:
+            area = (self._max_cx - self._min_cx + 1) * (self._max_cy - self._min_cy + 1)
+        if floor <= 0 or len(order) <= max(POINT_LINEAR_SCAN, math.isqrt(8 * area)):
+            buckets = (order,)
+            max_r = -1
+        else:
+            # walk outward one ring of cells at a time; anything outside
+            # ring r is at least as far away as the edge of the block
+            # searched so far
+            buckets = ()
+            cells = self._cells
+            size = self.cell_size
+            x, y = pos[0], pos[1]
+            cx, cy = self._key(pos)
+            max_r = max(cx - self._min_cx, self._max_cx - cx,
+                        cy - self._min_cy, self._max_cy - cy) + 1
+        r = 0
+        while True:
+            for bucket in buckets:
+                for pt, seq in bucket.items():
+                    d = pos.distance_to(pt.pos)
+                    for best, weight in weighed[pt.tier]:
+                        eff = d * weight
+                        if eff < best[2] or (eff == best[2] and seq < best[3]):
+                            best[:] = pt, d, eff, seq
+            if r > max_r:
+                break
+            if r:
+                # edge of rings 0 .. r - 1, minus one for the truncation
+                # slack in _key; strictly less so a tie just outside is
+                # still looked at
+                edge = min(x - (cx - r + 1) * size, (cx + r) * size - x,
+                           y - (cy - r + 1) * size, (cy + r) * size - y) - 1
+                if max([best[2] for best in found]) < edge * floor:
+                    break
+            buckets = [bucket for bucket in map(cells.get, _ring(cx, cy, r)) if bucket]
+            r += 1
+        return [(best[0], best[1]) for best in found]
+
+
+def _ring(cx, cy, r):
+    """Cell keys at Chebyshev distance exactly r from (cx, cy)."""
+    if r == 0:
+        yield (cx, cy)
+        return
+    for x in range(cx - r, cx + r + 1):
+        yield (x, cy - r)
+        yield (x, cy + r)
+    for y in range(cy - r + 1, cy + r):
+        yield (cx - r, y)
+        yield (cx + r, y)
@@ -0,0 +1,175 @@
+"""Lightweight span tracing with Chrome trace-event output.
+
+Wrap a phase in ``with tracer.span("name"):`` or decorate a function with
+``@traced("name")``.  While tracing is off a span is a shared no-op object
+and a traced function costs one attribute check, so the hooks can stay in
+the hot paths permanently.
+
+Switches:
+    DRAGONS_TRACE=out.json      trace from start-up, written out on exit
+    DRAGONS_PROFILE=N           cProfile the first N frames
+    F9 in game                  start/stop tracing (written when stopped)
+    F10 in game                 cProfile the next PROFILE_FRAMES frames
+
+Only the latest TRACE_EVENTS spans are kept, so a trace left running for a
+long session holds the last minute or so before it is written out, in
+bounded memory.
+
+Open the trace in chrome://tracing or https://ui.perfetto.dev.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_TRACE_FILE = "dragons_trace.json"
+DEFAULT_PROFILE_FILE = "dragons_profile.pstats"
+PROFILE_FRAMES = 300
+# about 80 s of a traced game at 120 FPS, some 30 MB
+TRACE_EVENTS = 200_000
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer.events.append((self.name, self.start, end - self.start, threading.get_ident()))
+        return False
+
+
+class Tracer:
+    """Collects named spans and optionally drives a cProfile capture."""
+    def __init__(self, max_events=TRACE_EVENTS):
+        self.enabled = False
+        self.path = DEFAULT_TRACE_FILE
+        # oldest spans fall off the front once the buffer is full
+        self.events = deque(maxlen=max_events)
+        self._origin = time.perf_counter_ns()
+        self._profiler = None
+        self._profile_left = 0
+        self._profile_path = DEFAULT_PROFILE_FILE
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    # --- tracing ---
+    def start(self, path=None):
+        if path:
+            self.path = path
+        self.events.clear()
+        self.enabled = True
+
+    def stop(self):
+        """Stop tracing and write what was collected.  Returns the file path."""
+        if not self.enabled:
+            return None
+        self.enabled = False
+        self.save(self.path)
+        return self.path
+
+    def toggle(self):
+        if self.enabled:
+            return self.stop()
+        self.start()
+        return None
+
+    def save(self, path):
+        pid = os.getpid()
+        origin = self._origin
+        trace = [{
+            "name": name,
+            "ph": "X",
+            "ts": (start - origin) / 1000,
+            "dur": dur / 1000,
+            "pid": pid,
+            "tid": tid,
+        } for name, start, dur, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    # --- profiling ---
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def start_profile(self, frames=PROFILE_FRAMES, path=None):
+        """cProfile the next `frames` calls to end_frame(), then dump pstats."""
+        if self._profiler is not None:
+            return
+        if path:
+            self._profile_path = path
+        self._profile_left = frames
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop_profile(self):
+        if self._profiler is None:
+            return None
+        self._profiler.disable()
+        self._profiler.dump_stats(self._profile_path)
+        self._profiler = None
+        return self._profile_path
+
+    def end_frame(self):
+        """Call once per frame; finishes a cProfile capture when it runs out."""
+        if self._profiler is not None:
+            self._profile_left -= 1
+            if self._profile_left <= 0:
+                return self.stop_profile()
+        return None
+
+    def configure_from_env(self, environ=os.environ):
+        """Honour DRAGONS_TRACE / DRAGONS_PROFILE and flush on interpreter exit."""
+        trace = environ.get("DRAGONS_TRACE")
+        if trace:
+            self.start(DEFAULT_TRACE_FILE if trace == "1" else trace)
+        frames = environ.get("DRAGONS_PROFILE")
+        if frames:
+            self.start_profile(int(frames) if frames.isdigit() else PROFILE_FRAMES)
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        self.stop()
+        self.stop_profile()
+
+
+tracer = Tracer()
+
+
+def traced(name):
+    """Decorator recording each call of the function as a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with _Span(tracer, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
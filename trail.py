@@ -0,0 +1,203 @@
+import math
+from array import array
+from itertools import chain, count
+
+# Dragons are capped at 450 segments; a little headroom avoids growing the
+# buffer when a burst pushes a head before the next trim.
+TRAIL_CAPACITY = 512
+
+# a new epoch whenever a trail's segments stop following on from the old ones
+_epochs = count()
+
+
+class Trail:
+    """Fixed-capacity ring buffer of (x, y) trail positions, head first.
+
+    Coordinates live interleaved in one array('d'), so adding a head is a
+    couple of float writes and trimming the tail just shortens the logical
+    length.  Nothing is shifted or copied per tick.  Indexing (including
+    negative indices such as trail[-1]), len() and iteration behave like the
+    list of tuples this replaces.  Iteration walks memoryviews of the buffer
+    instead of copying it.
+
+    Every push gets the next serial number, so segment i is serial
+    pushed - 1 - i for as long as it stays on the trail.  Refilling or
+    unrolling the buffer starts a new epoch, which no other trail shares.
+    Together they let the collision grid follow a trail incrementally.
+    """
+    __slots__ = ("_buf", "_cap", "_head", "_len", "_bounds", "_loose", "pushed", "epoch")
+
+    def __init__(self, points=(), capacity=TRAIL_CAPACITY):
+        points = list(points)
+        self._cap = max(capacity, len(points))
+        self._buf = array('d', bytes(16 * self._cap))
+        self._head = 0
+        self._len = 0
+        self._bounds = None
+        self._loose = 0
+        self.pushed = 0
+        self.epoch = next(_epochs)
+        for x, y in reversed(points):
+            self.push_front(x, y)
+
+    @classmethod
+    def stretched(cls, pos, direction, count, spacing, capacity=TRAIL_CAPACITY):
+        """A straight trail of count segments laid out behind pos."""
+        trail = cls(capacity=max(capacity, count))
+        x, y = pos[0], pos[1]
+        dx, dy = direction[0], direction[1]
+        for i in range(count - 1, -1, -1):
+            trail.push_front(x - dx * (i * spacing), y - dy * (i * spacing))
+        return trail
+
+    @classmethod
+    def from_bytes(cls, data, capacity=TRAIL_CAPACITY):
+        """A trail from packed float64 x, y pairs, head first: the bytes of
+        views(0) one after the other."""
+        count = len(data) // 16
+        trail = cls(capacity=max(capacity, count))
+        memoryview(trail._buf).cast("B")[:16 * count] = data
+        trail._len = trail.pushed = count
+        return trail
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def _grow(self):
+        # unroll into a buffer twice the size, head back at slot 0
+        old = list(self)
+        self._cap *= 2
+        self._buf = array('d', bytes(16 * self._cap))
+        self._head = 0
+        self._len = 0
+        self.epoch = next(_epochs)
+        for x, y in reversed(old):
+            self.push_front(x, y)
+
+    def push_front(self, x, y):
+        """Make (x, y) the new head."""
+        if self._len == self._cap:
+            self._grow()
+        head = self._head - 1
+        if head < 0:
+            head = self._cap - 1
+        self._head = head
+        buf = self._buf
+        buf[2 * head] = x
+        buf[2 * head + 1] = y
+        self._len += 1
+        self.pushed += 1
+        b = self._bounds
+        if b is not None:
+            if x < b[0]:
+                b[0] = x
+            elif x > b[2]:
+                b[2] = x
+            if y < b[1]:
+                b[1] = y
+            elif y > b[3]:
+                b[3] = y
+            self._loose += 1
+
+    def trim(self, length):
+        """Keep only the first `length` segments."""
+        if length < self._len:
+            self._len = max(0, int(length))
+
+    def advance(self, x, y, min_step, length):
+        """Push (x, y) if it is more than min_step from the current head, then
+        trim to length.  This is the per-tick trail update of every dragon."""
+        n = self._len
+        if n:
+            slot = 2 * self._head
+            buf = self._buf
+            dx = x - buf[slot]
+            dy = y - buf[slot + 1]
+            if math.sqrt(dx * dx + dy * dy) > min_step:
+                self.push_front(x, y)
+        else:
+            self.push_front(x, y)
+        if self._len > length:
+            self._len = max(0, int(length))
+
+    def clear(self):
+        self._len = 0
+        self._bounds = None
+        self.epoch = next(_epochs)
+
+    def reset(self, pos, direction, count, spacing):
+        """Refill in place with a straight trail (see stretched)."""
+        self._len = 0
+        self._bounds = None
+        self.epoch = next(_epochs)
+        x, y = pos[0], pos[1]
+        dx, dy = direction[0], direction[1]
+        for i in range(count - 1, -1, -1):
+            self.push_front(x - dx * (i * spacing), y - dy * (i * spacing))
+
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) of every segment, or None when empty.
+
+        Pushes widen the box as they come and trimming the tail leaves it as
+        it is, so it can be somewhat larger than the trail.  It is
+        recomputed once the trail has turned over half its length.
+        """
+        n = self._len
+        if not n:
+            return None
+        if self._bounds is None or self._loose * 2 > n:
+            xs = []
+            ys = []
+            for view in self.views(0):
+                xs.append(view[0::2])
+                ys.append(view[1::2])
+            self._bounds = [min(map(min, xs)), min(map(min, ys)),
+                            max(map(max, xs)), max(map(max, ys))]
+            self._loose = 0
+        return tuple(self._bounds)
+
+    def __getitem__(self, index):
+        n = self._len
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("trail index out of range")
+        slot = self._head + index
+        if slot >= self._cap:
+            slot -= self._cap
+        return (self._buf[2 * slot], self._buf[2 * slot + 1])
+
+    def views(self, start=0):
+        """Up to two memoryviews of flat x, y, x, y... covering segments from
+        `start` to the tail, in order.  Valid until the trail is next changed."""
+        n = self._len
+        if start >= n:
+            return ()
+        cap = self._cap
+        first = self._head + start
+        if first >= cap:
+            first -= cap
+        end = first + (n - start)
+        mv = memoryview(self._buf)
+        if end <= cap:
+            return (mv[2 * first:2 * end],)
+        return (mv[2 * first:2 * cap], mv[0:2 * (end - cap)])
+
+    def iter_from(self, start):
+        """Iterate (x, y) from segment `start` to the tail without copying."""
+        pairs = []
+        for view in self.views(start):
+            coords = iter(view)
+            pairs.append(zip(coords, coords))
+        if len(pairs) == 1:
+            return pairs[0]
+        return chain(*pairs)
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def __repr__(self):
+        return f"Trail({list(self)!r})"
@@ -1,99 +1,286 @@
+import heapq
 import pygame
 import random
 from settings import *
+from spatial import PointGrid, ObstacleGrid, ClearanceGrid
+from tracing import traced
+
+# value, color and lifetime (ms before the point expires) of each tier;
+# anything unknown counts as normal
+POINT_TIERS = {
+    "normal": (10, (0, 0, 255), 15000),         # Blue
+    "rare": (20, (200, 0, 255), 20000),         # Purple
+    "legendary": (30, (255, 255, 0), 22000),    # Yellow
+    "mythic": (50, (255, 0, 0), 25000),         # Red
+}
+_NORMAL = POINT_TIERS["normal"]
+_LIFETIMES = {tier: spec[2] for tier, spec in POINT_TIERS.items()}
+# Released points kept around for reuse, at most this many
+POINT_POOL_SIZE = 4096
+# Spawns keep this far from every dragon head
+SPAWN_CLEARANCE = 50
+# Random tries before get_safe_spawn falls back to the wall-free lattice
+SPAWN_ATTEMPTS = 64
+
 
 class Point:
-    """A collectible point with a value tier and corresponding color."""
-    def __init__(self, pos, tier="normal"):
+    """A collectible point with a value tier and corresponding color.
+
+    Only the position, tier and spawn time live on the point; value, color
+    and lifetime are looked up in POINT_TIERS.  generation goes up every
+    time the point is released, so stale references to a recycled point
+    can be told apart from the live one.
+    """
+    __slots__ = ("pos", "tier", "created_at", "generation")
+
+    def __init__(self, pos, tier="normal", created_at=None):
         self.pos = pygame.Vector2(pos)
+        self.generation = 0
+        self.tier = tier
+        if created_at is None:
+            created_at = pygame.time.get_ticks()
+        self.created_at = created_at
+
+    def reset(self, pos, tier, created_at):
+        """Reuse a released point for a new spawn."""
+        self.pos.update(pos)
         self.tier = tier
-        self.created_at = pygame.time.get_ticks()
-        if tier == "mythic":
-            self.value = 50
-            self.color = (255, 0, 0)  # Red
-            self.lifetime = 25000
-        elif tier == "legendary":
-            self.value = 30
-            self.color = (255, 255, 0)  # Yellow
-            self.lifetime = 22000
-        elif tier == "rare":
-            self.value = 20
-            self.color = (200, 0, 255)  # Purple
-            self.lifetime = 20000
-        else:  # normal
-            self.value = 10
-            self.color = (0, 0, 255)  # Blue
-            self.lifetime = 15000  # ms before point expires
-
-    def is_expired(self):
-        return pygame.time.get_ticks() - self.created_at > self.lifetime
+        self.created_at = created_at
+
+    @property
+    def value(self):
+        return POINT_TIERS.get(self.tier, _NORMAL)[0]
+
+    @property
+    def color(self):
+        return POINT_TIERS.get(self.tier, _NORMAL)[1]
+
+    @property
+    def lifetime(self):
+        return POINT_TIERS.get(self.tier, _NORMAL)[2]
+
+    @property
+    def expires_at(self):
+        """The point is expired once the clock is past this."""
+        return self.created_at + self.lifetime
+
+    def is_expired(self, now=None):
+        if now is None:
+            now = pygame.time.get_ticks()
+        return now - self.created_at > self.lifetime
+
+
+def wall_free_lattice(walls, lo, hi, area):
+    """Points of the SPAWN_CLEARANCE lattice running from (lo, lo) to (hi, hi)
+    that fall in area, a (left, top, right, bottom) box with inclusive edges,
+    and where a head would not touch a wall."""
+    step = SPAWN_CLEARANCE
+    left, top, right, bottom = area
+    # the first lattice line at or past each edge
+    xs = range(lo + max(0, -(-(left - lo) // step)) * step, min(hi, right) + 1, step)
+    ys = range(lo + max(0, -(-(top - lo) // step)) * step, min(hi, bottom) + 1, step)
+    return [pygame.Vector2(x, y) for x in xs for y in ys if not walls.head_hits(x, y)]
+
 
 class World:
-    def __init__(self):
+    def __init__(self, rng=random, clock=pygame.time.get_ticks, size=WORLD_SIZE, generate=True):
+        # rng and clock are injected so a seeded simulation is repeatable;
+        # generate=False leaves the map empty for restore() to fill in
+        self.rng = rng
+        self.clock = clock
+        self.size = size
+        self.points = PointGrid()
+        # (expires_at, seq, point, generation) min-heap; picked-up points are
+        # left in it and skipped when they come up
+        self._expiry = []
+        self._expiry_seq = 0
+        self._pool = []
+        # (margin, spawn lattice points clear of walls), built on first use
+        self._lattice = None
+        if generate:
+            self._generate()
+        else:
+            self._blank()
+
+    def _generate(self):
+        """Lay out the whole map: obstacles, then the starting points."""
+        rng, size = self.rng, self.size
         # Requirement: Un-movable objects (Obstacles)
         self.obstacles = []
         for _ in range(20):
-            w, h = random.randint(100, 300), random.randint(100, 300)
-            x, y = random.randint(0, WORLD_SIZE-w), random.randint(0, WORLD_SIZE-h)
+            w, h = rng.randint(100, 300), rng.randint(100, 300)
+            x, y = rng.randint(0, size-w), rng.randint(0, size-h)
             self.obstacles.append(pygame.Rect(x, y, w, h))
-            
+        self.walls = ObstacleGrid(self.obstacles)
+
         # Collectible points - spawn much more frequently with varied tiers
-        self.points = []
+        now = self.clock()
         # Normal points (majority)
         for _ in range(150):
-            pos = (random.randint(50, WORLD_SIZE-50), random.randint(50, WORLD_SIZE-50))
-            self.points.append(Point(pos, "normal"))
+            pos = (rng.randint(50, size-50), rng.randint(50, size-50))
+            self.add_point(Point(pos, "normal", now))
         # Rare points
         for _ in range(40):
-            pos = (random.randint(50, WORLD_SIZE-50), random.randint(50, WORLD_SIZE-50))
-            self.points.append(Point(pos, "rare"))
+            pos = (rng.randint(50, size-50), rng.randint(50, size-50))
+            self.add_point(Point(pos, "rare", now))
         # Legendary points
         for _ in range(15):
-            pos = (random.randint(50, WORLD_SIZE-50), random.randint(50, WORLD_SIZE-50))
-            self.points.append(Point(pos, "legendary"))
+            pos = (rng.randint(50, size-50), rng.randint(50, size-50))
+            self.add_point(Point(pos, "legendary", now))
         # Mythic points
         for _ in range(5):
-            pos = (random.randint(50, WORLD_SIZE-50), random.randint(50, WORLD_SIZE-50))
-            self.points.append(Point(pos, "mythic"))
+            pos = (rng.randint(50, size-50), rng.randint(50, size-50))
+            self.add_point(Point(pos, "mythic", now))
+
+    def _blank(self):
+        """No obstacles and no points."""
+        self.obstacles = []
+        self.walls = ObstacleGrid(self.obstacles)
+
+    def add_point(self, pt):
+        self.points.add(pt)
+        self._expiry_seq += 1
+        heapq.heappush(self._expiry, (pt.expires_at, self._expiry_seq, pt, pt.generation))
+
+    def live_points(self):
+        """(point, expiry sequence) of every point on the map, in the order
+        they were added."""
+        seqs = {pt: seq for _, seq, pt, generation in self._expiry if pt.generation == generation}
+        return [(pt, seqs[pt]) for pt in self.points]
+
+    def restore(self, obstacles, points, expiry_seq):
+        """Replace the map with saved obstacles and live_points() entries,
+        which may come from any iterable and are read once.
+
+        Points are added in their original order and keep their expiry
+        sequence, so iteration, queries and expiry all come out as they
+        would have in the saved game.
+        """
+        self.obstacles = obstacles
+        self.walls = ObstacleGrid(obstacles)
+        self._lattice = None
+        self._restore_points(points, expiry_seq)
+
+    def _restore_points(self, points, expiry_seq):
+        # one pass, so points can be decoded as they are added
+        self.points = PointGrid()
+        self._pool = []
+        expiry = self._expiry = []
+        push = expiry.append
+        lifetime = _LIFETIMES.get
+        normal = _NORMAL[2]
+
+        def placed():
+            for pt, seq in points:
+                push((pt.created_at + lifetime(pt.tier, normal), seq, pt, pt.generation))
+                yield pt
+        self.points.add_many(placed())
+        heapq.heapify(expiry)
+        self._expiry_seq = expiry_seq
+
+    def remove_point(self, pt):
+        """Take a point off the map (picked up) and recycle it."""
+        self.points.remove(pt)
+        self._release(pt)
+
+    def _release(self, pt):
+        pt.generation += 1
+        if len(self._pool) < POINT_POOL_SIZE:
+            self._pool.append(pt)
 
     def spawn_point(self, pos, tier="normal"):
-        self.points.append(Point(pos, tier))
+        self._place(pos, tier, self.clock())
+
+    def _place(self, pos, tier, created_at):
+        if self._pool:
+            pt = self._pool.pop()
+            pt.reset(pos, tier, created_at)
+        else:
+            pt = Point(pos, tier, created_at)
+        self.add_point(pt)
+
+    def obstacles_in(self, rect):
+        """The obstacles that overlap rect."""
+        return [obs for obs in self.obstacles if rect.colliderect(obs)]
 
     def get_safe_spawn(self, enemies, margin=100):
         """Return a random location well clear of walls, bounds and nearby enemies.
 
         The margin parameter keeps the player away from world edges so an
-        immediate out‑of‑bounds death is unlikely.  We also check each obstacle
-        rect and ensure the spawn point doesn't intersect.  Finally we avoid any
-        enemy head position by a fixed buffer so the player doesn't appear
-        directly on top of an enemy.
+        immediate out‑of‑bounds death is unlikely.  The head rect at the spawn
+        must not touch an obstacle, and it must be at least SPAWN_CLEARANCE
+        away from every head in enemies so nobody appears on top of a dragon.
         """
-        while True:
-            pos = pygame.Vector2(
-                random.randint(margin, WORLD_SIZE - margin),
-                random.randint(margin, WORLD_SIZE - margin)
-            )
-            # avoid colliding with obstacles
-            head_rect = pygame.Rect(pos.x, pos.y, 20, 20)
-            if any(head_rect.colliderect(obs) for obs in self.obstacles):
-                continue
-            # avoid spawning too close to any enemy head
-            too_close = False
-            for e in enemies:
-                if pos.distance_to(e.pos) < 50:
-                    too_close = True
-                    break
-            if too_close:
-                continue
-            return pos
-    
+        return self.get_safe_spawns(1, enemies, margin)[0]
+
+    @traced("World.get_safe_spawns")
+    def get_safe_spawns(self, count, dragons, margin=100):
+        """count spawn locations, each clear of the dragons and of each other.
+
+        Dragon heads are bucketed once for the whole batch and walls come
+        from the static ObstacleGrid, so each try is a couple of bucket
+        lookups.  After SPAWN_ATTEMPTS random tries a spawn draws from the
+        points of a coarse lattice that are clear of walls instead (see
+        _spawn_lattice), and only checks all of them when those draws fail
+        too.
+        """
+        crowd = ClearanceGrid(SPAWN_CLEARANCE, [d.pos for d in dragons])
+        spots = []
+        for _ in range(count):
+            pos = self._sample_spawn(crowd, margin)
+            crowd.add(pos)
+            spots.append(pos)
+        return spots
+
+    def _sample_spawn(self, crowd, margin):
+        rng, walls = self.rng, self.walls
+        lo, hi = margin, self.size - margin
+        for _ in range(SPAWN_ATTEMPTS):
+            pos = pygame.Vector2(rng.randint(lo, hi), rng.randint(lo, hi))
+            if not walls.head_hits(pos.x, pos.y) and crowd.clear_of(pos):
+                return pos
+
+        # crowded or walled in: only draw from lattice points clear of the
+        # walls, a region at a time (see _spawn_regions)
+        regions = self._spawn_regions()
+        for _ in range(SPAWN_ATTEMPTS):
+            lattice = self._spawn_lattice(rng.choice(regions), margin)
+            if lattice:
+                pos = rng.choice(lattice)
+                if crowd.clear_of(pos):
+                    return pygame.Vector2(pos)
+        lattice = [pos for region in regions for pos in self._spawn_lattice(region, margin)]
+        if not lattice:
+            return pygame.Vector2(self.size // 2, self.size // 2)
+        # with no room left anywhere, at least stay out of the walls
+        free = [pos for pos in lattice if crowd.clear_of(pos)]
+        return pygame.Vector2(rng.choice(free or lattice))
+
+    def _spawn_regions(self):
+        """The parts of the map the spawn fallback draws from: all of it."""
+        return [None]
+
+    def _spawn_lattice(self, region, margin):
+        """Points every SPAWN_CLEARANCE across a spawn region where a head
+        would not touch a wall.  Walls never move, so they are worked out
+        once."""
+        if self._lattice is None or self._lattice[0] != margin:
+            lo, hi = margin, self.size - margin
+            self._lattice = (margin, wall_free_lattice(self.walls, lo, hi, (lo, lo, hi, hi)))
+        return self._lattice[1]
+
     def update_points(self):
         """Remove points that have been on the map too long."""
-        # This list comprehension keeps only points that haven't expired
-        self.points = [pt for pt in self.points if not pt.is_expired()]
+        now = self.clock()
+        expiry, points = self._expiry, self.points
+        while expiry and expiry[0][0] < now:
+            _, _, pt, generation = heapq.heappop(expiry)
+            if pt.generation == generation:
+                points.remove(pt)
+                self._release(pt)
 
     def check_bounds(self, pos):
         # Requirement: Die on collision with outer bounds
-        if pos.x < 0 or pos.x > WORLD_SIZE or pos.y < 0 or pos.y > WORLD_SIZE:
+        if pos.x < 0 or pos.x > self.size or pos.y < 0 or pos.y > self.size:
             return True
         return False